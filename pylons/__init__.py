@@ -1,10 +1,6 @@
 """Base objects to be exported for use in Controllers"""
-# Import pkg_resources first so namespace handling is properly done so the
-# paste imports work
-import pkg_resources
-from paste.registry import StackedObjectProxy
-
 from pylons.configuration import config
+from pylons.context import ContextObjectProxy
 from pylons.controllers.util import Request
 from pylons.controllers.util import Response
 
@@ -13,29 +9,49 @@ __all__ = ['app_globals', 'cache', 'config', 'request', 'response',
 
 
 def __figure_version():
-    try:
-        from pkg_resources import require
-        import os
-        # NOTE: this only works when the package is either installed,
-        # or has an .egg-info directory present (i.e. wont work with raw
-        # SVN checkout)
-        info = require('pylons')[0]
-        if os.path.normcase(os.path.realpath(os.path.dirname(
-            os.path.dirname(__file__)))) == info.location:
-            return info.version
-        else:
-            return '(not installed)'
-    except:
-        return '(not installed)'
+    """Read the version from the package metadata next to the pylons
+    package, so figuring it out doesn't require scanning the installed
+    distributions with ``pkg_resources``"""
+    import glob
+    import os
+    # NOTE: this only works when the package is either installed,
+    # or has an .egg-info directory present (i.e. wont work with raw
+    # SVN checkout)
+    location = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    patterns = [os.path.join(location, 'EGG-INFO', 'PKG-INFO'),
+                os.path.join(location, 'Pylons.egg-info', 'PKG-INFO'),
+                os.path.join(location, 'Pylons-*.egg-info'),
+                os.path.join(location, 'Pylons-*.dist-info', 'METADATA')]
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            if os.path.isdir(path):
+                path = os.path.join(path, 'PKG-INFO')
+            try:
+                metadata = open(path)
+            except IOError:
+                continue
+            try:
+                name = None
+                for line in metadata:
+                    if line.startswith('Name:'):
+                        name = line[5:].strip()
+                    elif line.startswith('Version:') and \
+                            name and name.lower() == 'pylons':
+                        return line[8:].strip()
+                    elif not line.strip():
+                        break
+            finally:
+                metadata.close()
+    return '(not installed)'
 
 __version__ = __figure_version()
 
-app_globals = StackedObjectProxy(name="app_globals")
-cache = StackedObjectProxy(name="cache")
-request = StackedObjectProxy(name="request")
-response = StackedObjectProxy(name="response")
-session = StackedObjectProxy(name="session")
-tmpl_context = StackedObjectProxy(name="tmpl_context or C")
-url = StackedObjectProxy(name="url")
+app_globals = ContextObjectProxy('app_globals', name="app_globals")
+cache = ContextObjectProxy('cache', name="cache")
+request = ContextObjectProxy('request', name="request")
+response = ContextObjectProxy('response', name="response")
+session = ContextObjectProxy('session', name="session")
+tmpl_context = ContextObjectProxy('tmpl_context', name="tmpl_context or C")
+url = ContextObjectProxy('url', name="url")
 
-translator = StackedObjectProxy(name="translator")
+translator = ContextObjectProxy('translator', name="translator")
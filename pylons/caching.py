@@ -0,0 +1,757 @@
+"""Cache tiers for the Beaker caches used by Pylons
+
+The :func:`~pylons.decorators.cache.beaker_cache` decorator and
+:func:`~pylons.templating.cached_template` look their values up in
+Beaker caches. With the file, dbm or memcached backends every hit pays
+for opening a file or a network round-trip, plus unpickling the value.
+
+An in-process :class:`LocalTier` may be put in front of those backends:
+values read from or written to the backend are also kept in an LRU
+store of the process, and served from there while they're fresh. It's
+enabled with the ``pylons.cache_local_ttl`` option (see
+:func:`apply_local_tier`).
+
+Cached values may also carry tags, to be invalidated together with
+:func:`~pylons.decorators.cache.invalidate_tags`. Each tag has a
+generation, stored in the :data:`TAGS_NAMESPACE` cache namespace:
+values are stored along with the generations of their tags at the time
+they were created, and are stale once one of them changed. Invalidating
+a tag only sets its new generation, without looking for the values
+carrying it. The generations are kept in the backend of the values
+(the ``type`` of :func:`~pylons.decorators.cache.beaker_cache`), so
+that they're shared by all the processes sharing the values, unless the
+``pylons.cache_tags_type`` option names another one.
+
+Before being stored in the file, dbm or memcached backends, the values
+are encoded to strings by a :class:`ValueCodec`, which is cheaper to
+pickle and unpickle, and smaller, than the dict of the value.
+
+The lookups of each namespace are counted in a :class:`CacheStats`
+(see :func:`get_cache_stats`), to tell which caches are effective.
+:func:`format_cache_stats` reports them as text, which may be logged
+periodically with the ``pylons.cache_stats_interval`` option, or
+printed from ``paster shell`` with ``cache_stats()``.
+
+After a deploy or a restart the caches are cold. :func:`warm_cache`
+replays a list of URLs through the application in-process, so the
+cached actions and templates they hit are created before taking
+traffic. The list is read from the ``pylons.cache_warm_list`` option
+(see :func:`warm_list`), and replayed by the ``paster warmcache``
+command, or when the application is loaded with the ``warmcache``
+filter (see :func:`~pylons.middleware.warmcache_filter_app_factory`)::
+
+    [app:main]
+    use = egg:yourproj
+    pylons.cache_warm_list =
+        /
+        /products?page=1
+        yourproj.lib.warm:urls
+
+"""
+import cPickle
+import logging
+import marshal
+import Queue
+import struct
+import sys
+import threading
+import time
+import zlib
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict
+
+from beaker.container import MemoryNamespaceManager
+from paste.util.import_string import eval_import
+from webob import Request
+
+__all__ = ['CacheStats', 'LocalTier', 'LocalTierNamespace',
+           'TAGS_NAMESPACE', 'ValueCodec', 'apply_local_tier',
+           'default_codec', 'format_cache_stats', 'format_warm_report',
+           'get_cache_stats', 'local_tier', 'local_tiers',
+           'log_cache_stats', 'namespace_stats', 'new_tag_generations',
+           'print_cache_stats', 'reset_cache_stats', 'tag_generations',
+           'tag_types', 'tags_current', 'warm_cache', 'warm_list']
+
+log = logging.getLogger(__name__)
+
+# LocalTier objects by (namespace name, backend class)
+local_tiers = {}
+_tiers_lock = threading.Lock()
+
+# Cache namespace of the tag generations
+TAGS_NAMESPACE = 'pylons.cache_tags'
+
+# Cache types the tag generations of this process are stored in (None
+# being the default type of the cache manager)
+tag_types = set()
+
+# CacheStats objects by namespace name
+namespace_stats = {}
+_stats_logger = None
+_stats_lock = threading.Lock()
+
+
+class LocalTier(object):
+    """Bounded in-process LRU store of the values of a cache namespace
+
+    ``ttl``
+        Maximum time in seconds a value is served from the tier before
+        being read from the backend again. A value is never kept past
+        its expiration in the backend.
+    ``max_entries``
+        Maximum number of values kept, the least recently used one is
+        dropped when exceeded.
+    ``max_size``
+        Approximate maximum size in bytes of the values kept, or None
+        for no limit. Values larger than this are never kept.
+
+    :attr:`hits` and :attr:`misses` count the lookups that were, and
+    weren't, served from the tier.
+
+    The tier only knows of the changes made through this process:
+    values changed or removed by another process may be served for up
+    to ``ttl`` seconds.
+
+    """
+    def __init__(self, ttl, max_entries=1000, max_size=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > time.time()
+
+    def get(self, key):
+        """Return the value stored for ``key``, raising KeyError when
+        it's missing or no longer fresh"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self.hits += 1
+                self._lock.acquire()
+                try:
+                    # Mark as the most recently used
+                    if key in self._entries:
+                        del self._entries[key]
+                        self._entries[key] = entry
+                finally:
+                    self._lock.release()
+                return entry[2]
+            self.invalidate(key)
+        self.misses += 1
+        raise KeyError(key)
+
+    def put(self, key, value):
+        """Keep the backend ``value`` stored for ``key``"""
+        expires = time.time() + self.ttl
+        # Beaker stores (storedtime, expiretime, value)
+        if isinstance(value, tuple) and len(value) == 3 and \
+                value[1] is not None:
+            expires = min(expires, value[0] + value[1])
+        size = _sizeof(value)
+        if self.max_size is not None and size > self.max_size:
+            self.invalidate(key)
+            return
+
+        self._lock.acquire()
+        try:
+            entries = self._entries
+            previous = entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            entries[key] = (expires, size, value)
+            self.size += size
+            while len(entries) > self.max_entries or \
+                    (self.max_size is not None and
+                     self.size > self.max_size):
+                self.size -= entries.pop(iter(entries).next())[1]
+        finally:
+            self._lock.release()
+
+    def invalidate(self, key=None):
+        """Drop the value of ``key``, or all of them"""
+        self._lock.acquire()
+        try:
+            if key is None:
+                self._entries.clear()
+                self.size = 0
+            else:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self.size -= entry[1]
+        finally:
+            self._lock.release()
+
+
+class LocalTierNamespace(object):
+    """Beaker namespace manager serving values from a :class:`LocalTier`
+    before its ``backend`` namespace manager
+
+    The backend's read lock is only acquired when a value has to be
+    read from the backend, so that hits in the tier don't open the
+    backend's files. Writes go to both, and removing a value (or
+    clearing the namespace) drops it from the tier.
+
+    """
+    def __init__(self, backend, tier):
+        self.backend = backend
+        self.tier = tier
+        self.namespace = backend.namespace
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def acquire_read_lock(self):
+        local = self._local
+        local.depth = getattr(local, 'depth', 0) + 1
+
+    def release_read_lock(self):
+        local = self._local
+        local.depth -= 1
+        if not local.depth and getattr(local, 'locked', False):
+            local.locked = False
+            self.backend.release_read_lock()
+
+    def _lock_backend(self):
+        local = self._local
+        if getattr(local, 'depth', 0) and not getattr(local, 'locked', False):
+            self.backend.acquire_read_lock()
+            local.locked = True
+
+    def acquire_write_lock(self, *args, **kwargs):
+        return self.backend.acquire_write_lock(*args, **kwargs)
+
+    def release_write_lock(self):
+        self.backend.release_write_lock()
+
+    def has_key(self, key):
+        if key in self.tier:
+            return True
+        self._lock_backend()
+        if self.backend.has_key(key):
+            return True
+        self.tier.misses += 1
+        return False
+    __contains__ = has_key
+
+    def __getitem__(self, key):
+        try:
+            return self.tier.get(key)
+        except KeyError:
+            pass
+        self._lock_backend()
+        value = self.backend[key]
+        if value is not None:
+            self.tier.put(key, value)
+        return value
+
+    def set_value(self, key, value, expiretime=None):
+        if expiretime is None:
+            self.backend.set_value(key, value)
+        else:
+            self.backend.set_value(key, value, expiretime)
+        self.tier.put(key, value)
+
+    def __setitem__(self, key, value):
+        self.set_value(key, value)
+
+    def __delitem__(self, key):
+        self.tier.invalidate(key)
+        del self.backend[key]
+
+    def remove(self):
+        self.tier.invalidate()
+        self.backend.remove()
+
+    def keys(self):
+        return self.backend.keys()
+
+
+class ValueCodec(object):
+    """Compact encoding of the values cached by
+    :func:`~pylons.decorators.cache.beaker_cache`
+
+    The values are dicts of the ``content`` returned by the cached
+    function along with the ``status`` and ``headers`` of the response,
+    and other metadata. They're encoded as a string made of:
+
+    * the :attr:`magic` string, followed by a version and a flags byte
+    * the length, followed by the :mod:`marshal` dump, of the headers
+      (as a single ``Name:value`` line per header) and the metadata
+    * the content: as is for a ``str``, UTF-8 encoded for a
+      ``unicode``, and pickled for anything else (including subclasses
+      of ``str`` and ``unicode``, such as ``literal``)
+
+    ``compress_threshold``
+        Contents at least this long (in bytes) are compressed with
+        zlib, None disables compression. Defaults to 4096.
+    ``compress_level``
+        zlib compression level, defaults to 1 (the fastest).
+
+    Compression trades CPU time for less memory and disk or network
+    I/O: ``scripts/bench-codec.py`` compares the size and speed of
+    encoded values with pickled dicts.
+
+    :meth:`decode` returns the values that weren't encoded (such as
+    those stored by older versions of Pylons) unchanged, and None for
+    the values encoded by an unknown version, which are then
+    regenerated.
+
+    """
+    magic = 'PyC'
+    version = 1
+
+    NONE = 1
+    UNICODE = 2
+    PICKLED = 4
+    COMPRESSED = 8
+    PICKLED_META = 16
+
+    def __init__(self, compress_threshold=4096, compress_level=1):
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def encode(self, value):
+        """Encode a value dict to a string"""
+        meta = value.copy()
+        content = meta.pop('content', None)
+        headers = meta.pop('headers', None) or ()
+        meta.pop('cookies', None)
+
+        flags = 0
+        if content is None:
+            flags |= self.NONE
+            body = ''
+        elif content.__class__ is str:
+            body = content
+        elif content.__class__ is unicode:
+            flags |= self.UNICODE
+            body = content.encode('utf-8')
+        else:
+            flags |= self.PICKLED
+            body = cPickle.dumps(content, cPickle.HIGHEST_PROTOCOL)
+        if self.compress_threshold is not None and \
+                len(body) >= self.compress_threshold:
+            flags |= self.COMPRESSED
+            body = zlib.compress(body, self.compress_level)
+
+        headers = '\n'.join('%s:%s' % header for header in headers)
+        if _marshallable(meta):
+            meta = marshal.dumps((headers, meta))
+        else:
+            flags |= self.PICKLED_META
+            meta = cPickle.dumps((headers, meta), cPickle.HIGHEST_PROTOCOL)
+        return ''.join([self.magic, chr(self.version), chr(flags),
+                        struct.pack('!I', len(meta)), meta, body])
+
+    def decode(self, data):
+        """Decode a string encoded by :meth:`encode` back to the value
+        dict"""
+        magic = self.magic
+        if data.__class__ is not str or not data.startswith(magic):
+            return data
+        start = len(magic)
+        if ord(data[start]) != self.version:
+            return None
+        flags = ord(data[start + 1])
+        meta_length = struct.unpack('!I', data[start + 2:start + 6])[0]
+        start += 6
+        meta = data[start:start + meta_length]
+        body = data[start + meta_length:]
+
+        if flags & self.PICKLED_META:
+            headers, value = cPickle.loads(meta)
+        else:
+            headers, value = marshal.loads(meta)
+        if headers:
+            value['headers'] = [tuple(header.split(':', 1))
+                                for header in headers.split('\n')]
+        else:
+            value['headers'] = []
+        value['cookies'] = None
+
+        if flags & self.COMPRESSED:
+            body = zlib.decompress(body)
+        if flags & self.NONE:
+            value['content'] = None
+        elif flags & self.UNICODE:
+            value['content'] = body.decode('utf-8')
+        elif flags & self.PICKLED:
+            value['content'] = cPickle.loads(body)
+        else:
+            value['content'] = body
+        return value
+
+default_codec = ValueCodec()
+
+
+def local_tier(cache, ttl, max_entries=1000, max_size=None):
+    """Put a :class:`LocalTier` in front of the backend of a
+    :class:`beaker.cache.Cache`, returning the cache
+
+    The tier is shared by all the caches of the same namespace and
+    backend type in the process (see :data:`local_tiers`), so that
+    removing a value through any of them (``cache.remove(key)``) drops
+    it from the tier. Caches using the memory backend are left alone.
+
+    """
+    backend = cache.namespace
+    if isinstance(backend, (LocalTierNamespace, MemoryNamespaceManager)):
+        return cache
+    _tiers_lock.acquire()
+    try:
+        if isinstance(cache.namespace, LocalTierNamespace):
+            return cache
+        key = (cache.namespace_name, backend.__class__)
+        tier = local_tiers.get(key)
+        if tier is None:
+            tier = local_tiers[key] = LocalTier(ttl, max_entries, max_size)
+        cache.namespace = LocalTierNamespace(backend, tier)
+    finally:
+        _tiers_lock.release()
+    log.debug("Using a local tier for cache namespace: %s",
+              cache.namespace_name)
+    return cache
+
+
+def apply_local_tier(cache, config):
+    """Put a :class:`LocalTier` in front of ``cache`` when enabled in
+    ``config``, returning the cache
+
+    ``pylons.cache_local_ttl``
+        Maximum time in seconds values are served from the local tier.
+        The tier is disabled when unset.
+    ``pylons.cache_local_max_entries``
+        Maximum number of values kept per namespace, defaults to 1000.
+    ``pylons.cache_local_max_size``
+        Approximate maximum size in bytes of the values kept per
+        namespace, defaults to no limit.
+
+    """
+    ttl = config.get('pylons.cache_local_ttl')
+    if not ttl:
+        return cache
+    max_size = config.get('pylons.cache_local_max_size')
+    if max_size:
+        max_size = int(max_size)
+    else:
+        max_size = None
+    return local_tier(cache, float(ttl),
+                      int(config.get('pylons.cache_local_max_entries', 1000)),
+                      max_size)
+
+
+def _tags_cache(cache_manager, type):
+    """Return the cache of the tag generations, of the ``type`` backend
+    (the default one of ``cache_manager`` when None)"""
+    if type:
+        return cache_manager.get_cache(TAGS_NAMESPACE, type=type)
+    return cache_manager.get_cache(TAGS_NAMESPACE)
+
+
+def tag_generations(cache_manager, tags, type=None):
+    """Return a dict of the current generation of each of the ``tags``,
+    as stored in the ``type`` cache of ``cache_manager``"""
+    cache = _tags_cache(cache_manager, type)
+    generations = {}
+    for tag in tags:
+        try:
+            generations[tag] = cache.get(tag)
+        except KeyError:
+            generations[tag] = 0
+    return generations
+
+
+def tags_current(cache_manager, generations, type=None):
+    """Whether the ``generations`` (as returned by
+    :func:`tag_generations`) are still the current ones"""
+    return not generations or \
+        generations == tag_generations(cache_manager, generations, type)
+
+
+def new_tag_generations(cache_manager, tags, type=None):
+    """Start a new generation of each of the ``tags``, in the ``type``
+    cache of ``cache_manager``, making the values carrying them stale
+
+    Generations are timestamps rather than plain counters, so that a
+    generation evicted from the cache (by memcached, for instance)
+    doesn't start over at a value already used.
+
+    """
+    cache = _tags_cache(cache_manager, type)
+    for tag in tags:
+        try:
+            previous = cache.get(tag)
+        except KeyError:
+            previous = 0
+        cache.put(tag, max(time.time(), previous + 0.001))
+
+
+class CacheStats(object):
+    """Counters of the lookups in a cache namespace
+
+    ``hits``
+        Lookups served from the cache.
+    ``misses``
+        Lookups that had to create the value, as it was missing,
+        expired or invalidated.
+    ``regenerations``
+        Values created, including those refreshed in the background
+        (see the ``stale_ttl`` option of
+        :func:`~pylons.decorators.cache.beaker_cache`).
+    ``regen_time``
+        Total time in seconds spent creating values.
+    ``size``
+        Approximate size in bytes of the last value created.
+
+    The counters are updated without locking: concurrent updates may
+    very rarely lose a count, which is cheaper than taking a lock on
+    every lookup.
+
+    """
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self.regenerations = 0
+        self.regen_time = 0.0
+        self.size = 0
+
+    def __repr__(self):
+        return '<CacheStats %s: %d hits, %d misses>' % (
+            self.namespace, self.hits, self.misses)
+
+    def regenerated(self, seconds, value):
+        """Count the creation of ``value``, which took ``seconds``"""
+        self.regenerations += 1
+        self.regen_time += seconds
+        self.size = _sizeof(value)
+
+    @property
+    def hit_ratio(self):
+        """Ratio of the lookups that were hits"""
+        lookups = self.hits + self.misses
+        return lookups and float(self.hits) / lookups or 0.0
+
+    @property
+    def saved_time(self):
+        """Estimate of the time in seconds the hits saved, from the
+        average time to create a value"""
+        if not self.regenerations:
+            return 0.0
+        return self.hits * self.regen_time / self.regenerations
+
+
+def get_cache_stats(namespace):
+    """Return the :class:`CacheStats` of ``namespace``"""
+    stats = namespace_stats.get(namespace)
+    if stats is None:
+        stats = namespace_stats.setdefault(namespace, CacheStats(namespace))
+    return stats
+
+
+def reset_cache_stats():
+    """Start counting over for all the namespaces"""
+    namespace_stats.clear()
+
+
+def format_cache_stats(namespaces=None):
+    """Format the statistics of ``namespaces`` (defaulting to all of
+    them) as a text table, the namespaces saving the most time first"""
+    if namespaces is None:
+        stats = namespace_stats.values()
+    else:
+        stats = [get_cache_stats(namespace) for namespace in namespaces]
+    stats.sort(key=lambda stat: (-stat.saved_time, stat.namespace))
+    lines = ['%8s %8s %6s %8s %10s %10s %10s  %s' % (
+        'hits', 'misses', 'hit%', 'regens', 'regen ms', 'size',
+        'saved s', 'namespace')]
+    for stat in stats:
+        average = stat.regenerations and \
+            stat.regen_time / stat.regenerations or 0.0
+        lines.append('%8d %8d %6.1f %8d %10.1f %10d %10.1f  %s' % (
+            stat.hits, stat.misses, stat.hit_ratio * 100,
+            stat.regenerations, average * 1000, stat.size,
+            stat.saved_time, stat.namespace))
+    return '\n'.join(lines)
+
+
+def print_cache_stats(namespaces=None):
+    """Print the statistics of ``namespaces``, as formatted by
+    :func:`format_cache_stats`"""
+    print format_cache_stats(namespaces)
+
+
+def log_cache_stats(interval):
+    """Log the statistics of all the namespaces every ``interval``
+    seconds from a background thread
+
+    Called when creating the app if ``pylons.cache_stats_interval`` is
+    set. Only one thread is started per process.
+
+    """
+    global _stats_logger
+    _stats_lock.acquire()
+    try:
+        if _stats_logger is not None:
+            return
+        def run():
+            while True:
+                time.sleep(interval)
+                if namespace_stats:
+                    log.info("Cache statistics:\n%s", format_cache_stats())
+        _stats_logger = threading.Thread(target=run,
+                                         name='pylons cache statistics')
+        _stats_logger.setDaemon(True)
+        _stats_logger.start()
+    finally:
+        _stats_lock.release()
+
+
+def warm_list(value):
+    """Return the list of URLs to warm the caches with
+
+    ``value`` is the ``pylons.cache_warm_list`` option: one entry per
+    line, either a URL (path and query string), or a ``module:name``
+    reference to a list of entries in a module, or to a callable
+    returning one. Lines starting with ``#`` are ignored.
+
+    Entries from a module are either URLs, or ``(url, headers)`` tuples
+    to warm the variants of pages cached by request headers (see the
+    ``vary`` argument of
+    :func:`~pylons.decorators.cache.beaker_cache`)::
+
+        urls = ['/', ('/', {'Accept-Language': 'fr'})]
+
+    A list is returned as it is.
+
+    """
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    urls = []
+    for line in (value or '').splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('/') or '://' in line:
+            urls.append(line)
+            continue
+        entries = eval_import(line)
+        if callable(entries):
+            entries = entries()
+        urls.extend(entries)
+    return urls
+
+
+def warm_cache(app, urls, concurrency=1, extra_environ=None):
+    """Request each of the ``urls`` from the WSGI ``app``, returning a
+    list of ``(url, status, seconds)`` tuples in the order of ``urls``
+
+    The requests are made in-process by ``concurrency`` threads. Their
+    environ has ``pylons.warmcache`` set, along with the keys of
+    ``extra_environ``. Exceptions raised by the application are logged
+    and reported with a None status.
+
+    """
+    results = [None] * len(urls)
+    queue = Queue.Queue()
+    for index, url in enumerate(urls):
+        queue.put((index, url))
+
+    def worker():
+        while True:
+            try:
+                index, url = queue.get_nowait()
+            except Queue.Empty:
+                return
+            results[index] = _warm_url(app, url, extra_environ)
+
+    concurrency = min(int(concurrency), len(urls))
+    if concurrency <= 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=worker)
+                   for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return results
+
+
+def _warm_url(app, entry, extra_environ):
+    url, headers = entry, {}
+    if isinstance(entry, tuple):
+        url, headers = entry
+    environ = {'pylons.warmcache': True}
+    if extra_environ:
+        environ.update(extra_environ)
+    request = Request.blank(url, environ, headers=headers)
+    start = time.time()
+    try:
+        status = request.get_response(app).status
+    except Exception:
+        log.exception("Error warming the caches with: %s", url)
+        status = None
+    return entry, status, time.time() - start
+
+
+def format_warm_report(results):
+    """Format the results of :func:`warm_cache` as a text report, one
+    line per URL with the time it took, followed by a summary"""
+    lines = []
+    errors = 0
+    for url, status, seconds in results:
+        if isinstance(url, tuple):
+            url = '%s %r' % url
+        if not status or status[0] not in '23':
+            errors += 1
+        code = status and status.split(' ', 1)[0] or 'error'
+        lines.append('%9.1f ms  %-5s %s' % (seconds * 1000, code, url))
+    lines.append('%d URLs in %.1f ms, %d errors' % (
+        len(results), sum(result[2] for result in results) * 1000, errors))
+    return '\n'.join(lines)
+
+
+_MARSHAL_TYPES = frozenset([str, unicode, int, long, float, bool,
+                            type(None)])
+
+
+def _marshallable(value):
+    """Whether :mod:`marshal` dumps the value as it is: marshal doesn't
+    know of subclasses (of unicode, say) and dumps them incorrectly"""
+    cls = value.__class__
+    if cls in _MARSHAL_TYPES:
+        return True
+    if cls is dict:
+        return _marshallable(value.keys()) and \
+            _marshallable(value.values())
+    if cls in (list, tuple):
+        for item in value:
+            if not _marshallable(item):
+                return False
+        return True
+    return False
+
+
+def _sizeof(value):
+    """Approximate size in bytes of a value and the containers in it"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        value = value.values()
+    if isinstance(value, (list, tuple)):
+        size += sum(_sizeof(item) for item in value)
+    return size
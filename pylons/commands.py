@@ -14,6 +14,12 @@ Commands available:
     Create a REST Controller and accompanying functional test
 ``shell``
     Open an interactive shell with the Pylons app loaded
+``controllermanifest``
+    Write the manifest of controllers to preload
+``warmcache``
+    Warm the caches by requesting a list of URLs
+``compiletemplates``
+    Compile the Mako and Jinja2 templates of the project
 
 Example usage::
 
@@ -44,15 +50,20 @@ import sys
 
 import paste.fixture
 import paste.registry
-from paste.deploy import loadapp
+from paste.deploy import appconfig, loadapp
 from paste.script.command import Command, BadCommand
 from paste.script.filemaker import FileOp
 from tempita import paste_script_template_renderer
 
 import pylons
 import pylons.util as util
+from pylons.caching import format_warm_report, print_cache_stats, \
+    warm_cache, warm_list
+from pylons.wsgiapp import CONTROLLER_MANIFEST, controller_names
 
-__all__ = ['ControllerCommand', 'RestControllerCommand', 'ShellCommand']
+__all__ = ['CompileTemplatesCommand', 'ControllerCommand',
+           'ControllerManifestCommand', 'RestControllerCommand',
+           'ShellCommand', 'WarmCacheCommand']
 
 
 def can_import(name):
@@ -373,6 +384,69 @@ class RestControllerCommand(Command):
             raise BadCommand('An unknown error occurred. %s' % msg)
 
 
+class ControllerManifestCommand(Command):
+    """Write the manifest of controllers to preload
+
+    Imports every module in the project's controllers directory, and
+    lists those defining a controller in a manifest that's used instead
+    of scanning the directory when the ``pylons.preload_controllers``
+    option is enabled. The manifest is written to ``manifest.txt`` in the
+    controllers directory, unless another path is given with ``-o``.
+
+    Example usage::
+
+        yourproj% paster controllermanifest
+        Writing yourproj/yourproj/controllers/manifest.txt (3 controllers)
+
+    """
+    summary = __doc__.splitlines()[0]
+    usage = '\n' + __doc__
+
+    min_args = 0
+    max_args = 0
+    group_name = 'pylons'
+
+    parser = Command.standard_parser(simulate=True)
+    parser.add_option('-o', '--output',
+                      dest='output',
+                      help="Path to write the manifest to")
+
+    def command(self):
+        """Main command to write the controller manifest"""
+        file_op = FileOp(source_dir=('pylons', 'templates'))
+        try:
+            base_package, controllers_dir = file_op.find_dir('controllers')
+        except:
+            raise BadCommand('No egg_info directory was found')
+        sys.path.insert(0, os.getcwd())
+
+        lines = ['# Controllers to preload, generated by paster '
+                 'controllermanifest']
+        for name in controller_names(controllers_dir):
+            module_name = base_package + '.controllers.' + \
+                name.replace('/', '.')
+            __import__(module_name)
+            module = sys.modules[module_name]
+            attr = getattr(module, '__controller__', None) or \
+                util.class_name_from_module_name(name.split('/')[-1]) + \
+                'Controller'
+            if not hasattr(module, attr):
+                if self.verbose:
+                    print 'Skipping %s, no %s found' % (module_name, attr)
+                continue
+            lines.append('%s %s:%s' % (name, module_name, attr))
+
+        output = self.options.output or os.path.join(controllers_dir,
+                                                     CONTROLLER_MANIFEST)
+        print 'Writing %s (%d controllers)' % (output, len(lines) - 1)
+        if not self.simulate:
+            manifest = open(output, 'w')
+            try:
+                manifest.write('\n'.join(lines) + '\n')
+            finally:
+                manifest.close()
+
+
 class RoutesCommand(Command):
     """Print the applications routes
 
@@ -540,7 +614,8 @@ class ShellCommand(Command):
         base_public = [__name for __name in dir(base) if not \
                        __name.startswith('_') or __name == '_']
         locs.update((name, getattr(base, name)) for name in base_public)
-        locs.update(dict(wsgiapp=wsgiapp, app=test_app))
+        locs.update(dict(wsgiapp=wsgiapp, app=test_app,
+                         cache_stats=print_cache_stats))
 
         mapper = tresponse.config.get('routes.map')
         if mapper:
@@ -554,6 +629,8 @@ class ShellCommand(Command):
             "This project's WSGI App instance")
         banner += "  %-10s -  %s\n" % ('app',
             'paste.fixture wrapped around wsgiapp')
+        banner += "  %-10s -  %s\n" % ('cache_stats',
+            'Print the statistics of the caches')
 
         try:
             if self.options.disable_ipython:
@@ -589,3 +666,169 @@ class ShellCommand(Command):
                 shell.interact(banner)
             finally:
                 paste.registry.restorer.restoration_end()
+
+
+class WarmCacheCommand(Command):
+    """Warm the caches by requesting a list of URLs
+
+    Loads the application and requests each URL through it in-process,
+    so that the cached actions and templates are created before taking
+    traffic, printing the time each of them took. The URLs default to
+    the ``pylons.cache_warm_list`` option of the config file (see
+    :func:`~pylons.caching.warm_list`).
+
+    The optional CONFIG_FILE argument specifies the config file to use.
+    CONFIG_FILE defaults to 'development.ini'. The command exits with
+    status 1 when a request failed.
+
+    Example::
+
+        $ paster warmcache -c 4 production.ini
+        $ paster warmcache development.ini / /products?page=1
+
+    """
+    summary = __doc__.splitlines()[0]
+    usage = '\n' + __doc__
+
+    min_args = 0
+    max_args = None
+    group_name = 'pylons'
+
+    parser = Command.standard_parser(simulate=True)
+    parser.add_option('-c', '--concurrency',
+                      dest='concurrency',
+                      type='int',
+                      help=("Number of requests made at the same time, "
+                            "defaults to the pylons.cache_warm_concurrency "
+                            "option or 1"))
+    parser.add_option('-q',
+                      action='count',
+                      dest='quiet',
+                      default=0,
+                      help=("Do not load logging configuration from the "
+                            "config file"))
+
+    def command(self):
+        """Main command to warm the caches"""
+        args = list(self.args)
+        if args and not args[0].startswith('/'):
+            config_file = args.pop(0)
+        else:
+            # Assume the .ini file is ./development.ini
+            config_file = 'development.ini'
+            if not os.path.isfile(config_file):
+                raise BadCommand('%sError: CONFIG_FILE not found at: .%s%s\n'
+                                 'Please specify a CONFIG_FILE' % \
+                                 (self.parser.get_usage(), os.path.sep,
+                                  config_file))
+
+        config_name = 'config:%s' % config_file
+        here_dir = os.getcwd()
+
+        if not self.options.quiet:
+            # Configure logging from the config file
+            self.logging_file_config(config_file)
+
+        sys.path.insert(0, here_dir)
+        conf = appconfig(config_name, relative_to=here_dir)
+        urls = args or warm_list(conf.get('pylons.cache_warm_list'))
+        if not urls:
+            raise BadCommand('No URLs to warm the caches with, please set '
+                             'the pylons.cache_warm_list option')
+        concurrency = self.options.concurrency or \
+            int(conf.get('pylons.cache_warm_concurrency', 1))
+
+        if self.simulate:
+            print '\n'.join(map(str, urls))
+            return
+        wsgiapp = loadapp(config_name, relative_to=here_dir)
+        results = warm_cache(wsgiapp, urls, concurrency)
+        print format_warm_report(results)
+        for url, status, seconds in results:
+            if not status or status[0] not in '23':
+                return 1
+
+
+class CompileTemplatesCommand(Command):
+    """Compile the Mako and Jinja2 templates of the project
+
+    Loads the application and compiles all its templates (see
+    :func:`~pylons.templating.compile_templates`): Mako templates are
+    written as modules to the ``module_directory`` of the lookup, and
+    Jinja2 templates to the ``bytecode_cache`` of the environment. This
+    may be run when building a deployment, or the templates may be
+    compiled when the application is created with the
+    ``pylons.compile_templates`` option.
+
+    The optional CONFIG_FILE argument specifies the config file to use.
+    CONFIG_FILE defaults to 'development.ini'. The command exits with
+    status 1 when a template failed to compile.
+
+    Example::
+
+        $ paster compiletemplates production.ini
+
+    """
+    summary = __doc__.splitlines()[0]
+    usage = '\n' + __doc__
+
+    min_args = 0
+    max_args = 1
+    group_name = 'pylons'
+
+    parser = Command.standard_parser(simulate=True)
+    parser.add_option('-q',
+                      action='count',
+                      dest='quiet',
+                      default=0,
+                      help=("Do not load logging configuration from the "
+                            "config file"))
+
+    def command(self):
+        """Main command to compile the templates"""
+        # pylons.templating isn't needed by the other commands
+        from pylons.templating import compile_templates
+
+        if len(self.args) == 0:
+            # Assume the .ini file is ./development.ini
+            config_file = 'development.ini'
+            if not os.path.isfile(config_file):
+                raise BadCommand('%sError: CONFIG_FILE not found at: .%s%s\n'
+                                 'Please specify a CONFIG_FILE' % \
+                                 (self.parser.get_usage(), os.path.sep,
+                                  config_file))
+        else:
+            config_file = self.args[0]
+
+        config_name = 'config:%s' % config_file
+        here_dir = os.getcwd()
+
+        if not self.options.quiet:
+            # Configure logging from the config file
+            self.logging_file_config(config_file)
+
+        # Load the wsgi app first so that everything is initialized right
+        sys.path.insert(0, here_dir)
+        wsgiapp = loadapp(config_name, relative_to=here_dir)
+        test_app = paste.fixture.TestApp(wsgiapp)
+
+        # Query the test app to setup the environment and get the config
+        tresponse = test_app.get('/_test_vars')
+        config = tresponse.config
+        jinja2_env = getattr(config['pylons.app_globals'], 'jinja2_env',
+                             None)
+        if jinja2_env is not None and jinja2_env.bytecode_cache is None:
+            print ('Warning: the Jinja2 environment has no bytecode_cache, '
+                   'its templates are only checked')
+
+        results = compile_templates(config)
+        errors = 0
+        for engine, name, error in results:
+            if error is not None:
+                errors += 1
+                print '%s %s: %s' % (engine, name, error)
+            elif self.verbose:
+                print '%s %s' % (engine, name)
+        print 'Compiled %d templates, %d errors' % (len(results), errors)
+        if errors:
+            return 1
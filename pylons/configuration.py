@@ -17,9 +17,9 @@ import copy
 import logging
 import os
 
-from paste.config import DispatchingConfig
 from paste.deploy.converters import asbool
-from webhelpers.mimehelper import MIMETypes
+
+from pylons.context import ContextConfig
 
 
 request_defaults = dict(charset='utf-8', errors='replace',
@@ -32,7 +32,7 @@ response_defaults = dict(content_type='text/html',
 log = logging.getLogger(__name__)
 
 
-config = DispatchingConfig()
+config = ContextConfig()
 
 
 class PylonsConfig(dict):
@@ -69,6 +69,53 @@ class PylonsConfig(dict):
         Whethor or not Routes variables should automatically be
         attached to the tmpl_context object when specified in a
         controllers method.
+    ``pylons.preload_controllers``
+        Whether or not all the controllers should be imported when the
+        application is created, instead of on the first request to
+        each. Defaults to False.
+    ``pylons.controller_manifest``
+        Path to the controller manifest (as written by ``paster
+        controllermanifest``) listing the controllers to preload.
+        Defaults to ``manifest.txt`` in the controllers directory, all
+        the modules in the controllers directory being imported when
+        there's no manifest.
+    ``pylons.compile_templates``
+        Whether or not the Mako and Jinja2 templates should be compiled
+        when the application is created (see
+        :func:`~pylons.templating.compile_templates`), the template
+        files no longer being checked for changes unless ``debug`` is
+        enabled. Defaults to False.
+    ``pylons.fragment_workers``
+        Maximum number of threads rendering the fragments of a call to
+        :func:`~pylons.templating.render_mako_fragments`. Defaults to 4.
+    ``pylons.stream_chunk_size``
+        Number of characters grouped into each chunk of the output of
+        the streaming render functions (see
+        :func:`~pylons.templating.stream_jinja2`). Defaults to 8192.
+    ``pylons.use_registry``
+        Whether or not the Pylons globals should be registered with the
+        ``paste.registry`` for each request. When disabled, the
+        request's :class:`~pylons.context.PylonsContext` is bound to a
+        single thread-local that all the globals resolve through (see
+        :mod:`pylons.context`). Defaults to True.
+    ``pylons.cache_local_ttl``
+        Enables an in-process tier in front of the cache backends used
+        by :func:`~pylons.decorators.cache.beaker_cache` and
+        :func:`~pylons.templating.cached_template`, serving values for
+        up to this many seconds. Its size is limited with
+        ``pylons.cache_local_max_entries`` and
+        ``pylons.cache_local_max_size`` (see :mod:`pylons.caching`).
+    ``pylons.cache_stats_interval``
+        Number of seconds between the logging of the statistics of the
+        caches (see :func:`~pylons.caching.format_cache_stats`). They
+        aren't logged by default.
+    ``pylons.cache_warm_list``
+        The URLs requested by ``paster warmcache`` to warm the caches,
+        one per line, or ``module:name`` references to lists of URLs
+        (see :func:`~pylons.caching.warm_list`).
+    ``pylons.cache_warm_concurrency``
+        Number of requests ``paster warmcache`` makes at the same time.
+        Defaults to 1.
     ``pylons.request_options``
         A dict of Content-Type related default settings for new
         instances of :class:`~pylons.controllers.util.Request`. May
@@ -101,6 +148,7 @@ class PylonsConfig(dict):
         'pylons.response_options': response_defaults.copy(),
         'pylons.strict_tmpl_context': True,
         'pylons.tmpl_context_attach_args': False,
+        'pylons.use_registry': True,
     }
 
     def init_app(self, global_conf, app_conf, package=None, paths=None):
@@ -154,9 +202,6 @@ class PylonsConfig(dict):
 
         conf['debug'] = asbool(conf.get('debug'))
 
-        # Load the MIMETypes with its default types
-        MIMETypes.init()
-
         # Ensure all the keys from defaults are present, load them if not
         for key, val in copy.deepcopy(PylonsConfig.defaults).iteritems():
             conf.setdefault(key, val)
@@ -0,0 +1,173 @@
+"""Registry-free request context
+
+By default the Pylons globals (:data:`~pylons.request`,
+:data:`~pylons.response`, etc.) are registered per request with the
+``paste.registry`` :class:`~paste.registry.RegistryManager`, one
+``register()`` call for each of them, and every access goes through its
+own stacked thread-local.
+
+When ``pylons.use_registry`` is disabled in the config,
+:class:`~pylons.wsgiapp.PylonsApp` instead binds the request's
+:class:`PylonsContext` to a single thread-local slot with
+:func:`bind_context`, and the globals resolve by reading the matching
+attribute off of it.
+
+"""
+import threading
+
+from paste.config import DispatchingConfig
+from paste.registry import StackedObjectProxy
+
+import pylons
+
+__all__ = ['ContextConfig', 'ContextIter', 'ContextObjectProxy',
+           'PylonsContext', 'bind_context', 'get_context',
+           'get_pylons_context']
+
+_local = threading.local()
+
+
+class PylonsContext(object):
+    """Pylons context object
+
+    All the Pylons Stacked Object Proxies are also stored here, for use
+    in generators and async based operation where the globals can't be
+    used.
+
+    This object is attached in
+    :class:`~pylons.controllers.core.WSGIController` instances as
+    :attr:`~WSGIController._py_object`. For example::
+
+        class MyController(WSGIController):
+            def index(self):
+                pyobj = self._py_object
+                return "Environ is %s" % pyobj.request.environ
+
+    Members may be created lazily: when a ``_lazy_members`` dict
+    mapping attribute names to factories is set, a factory is called
+    with the context the first time its attribute is accessed, and the
+    result is kept as the attribute's value.
+
+    """
+    def __getattr__(self, name):
+        # Only called when the attribute hasn't been set yet
+        try:
+            factory = self.__dict__['_lazy_members'][name]
+        except KeyError:
+            raise AttributeError(name)
+        value = self.__dict__[name] = factory(self)
+        return value
+
+
+def get_context():
+    """Return the :class:`PylonsContext` bound to the current thread,
+    or None"""
+    return getattr(_local, 'context', None)
+
+
+def bind_context(context):
+    """Bind ``context`` to the current thread, returning the context
+    previously bound (to be restored once the request is done)"""
+    previous = getattr(_local, 'context', None)
+    _local.context = context
+    return previous
+
+
+class ContextIter(object):
+    """Iterates over an app_iter with ``context`` bound, as the
+    response is usually sent once the request's context was unbound
+
+    The context is bound while getting each chunk and while closing the
+    app_iter, the one previously bound being restored in between.
+
+    """
+    def __init__(self, app_iter, context):
+        self.app_iter = app_iter
+        self.iterator = iter(app_iter)
+        self.context = context
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        previous = bind_context(self.context)
+        try:
+            return self.iterator.next()
+        finally:
+            bind_context(previous)
+
+    def close(self):
+        if not hasattr(self.app_iter, 'close'):
+            return
+        previous = bind_context(self.context)
+        try:
+            self.app_iter.close()
+        finally:
+            bind_context(previous)
+
+
+def get_pylons_context():
+    """Return the :class:`PylonsContext` of the current request
+
+    Uses the thread-local context when one is bound, otherwise resolves
+    it once through ``pylons.request``. Returns None when there's no
+    current request, or when it has no Pylons context.
+
+    """
+    context = getattr(_local, 'context', None)
+    if context is None:
+        try:
+            environ = pylons.request.environ
+        except TypeError:
+            return None
+        context = environ.get('pylons.pylons')
+    return context
+
+
+class ContextObjectProxy(StackedObjectProxy):
+    """StackedObjectProxy that prefers the bound request context
+
+    When a :class:`PylonsContext` is bound to the thread the proxied
+    object is its ``attr`` attribute, otherwise the regular stacked
+    thread-local (populated by the registry) is used. A
+    :class:`PylonsContext` registered with the registry also proxies to
+    its ``attr`` attribute, which lets lazy members be registered
+    before they're created.
+
+    """
+    def __init__(self, attr, name="Default"):
+        super(ContextObjectProxy, self).__init__(name=name)
+        self.__dict__['____attr__'] = attr
+
+    def _current_obj(self):
+        context = getattr(_local, 'context', None)
+        if context is not None:
+            try:
+                return getattr(context, self.____attr__)
+            except AttributeError:
+                pass
+        obj = StackedObjectProxy._current_obj(self)
+        if isinstance(obj, PylonsContext):
+            # Registered in place of a lazy member not yet created
+            return getattr(obj, self.____attr__)
+        return obj
+
+    def _current_obj_restoration(self):
+        obj = StackedObjectProxy._current_obj_restoration(self)
+        if isinstance(obj, PylonsContext):
+            return getattr(obj, self.____attr__)
+        return obj
+
+
+class ContextConfig(DispatchingConfig):
+    """DispatchingConfig that prefers the bound request context's
+    ``config``"""
+    def _current_obj(self):
+        context = getattr(_local, 'context', None)
+        if context is not None:
+            try:
+                return context.config
+            except AttributeError:
+                pass
+        return DispatchingConfig._current_obj(self)
+    current = current_conf = _current_obj
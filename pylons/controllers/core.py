@@ -6,12 +6,122 @@ import types
 from webob.exc import HTTPException, HTTPNotFound
 
 import pylons
+from pylons.context import bind_context
 
 __all__ = ['WSGIController']
 
 log = logging.getLogger(__name__)
 
 
+class DispatchPlan(object):
+    """Precomputed dispatch information for a controller class
+
+    Built once per :class:`WSGIController` subclass (see
+    :meth:`WSGIController._get_dispatch_plan`) so that per-request
+    dispatch doesn't have to repeat the argspec inspection and
+    attribute probing for every call.
+
+    ``actions``
+        Dict mapping each public action method name to its argument
+        plan, a tuple of ``(accepts_kwargs, argnames)``. Requests for
+        these actions are dispatched without probing the controller
+        (see :meth:`WSGIController._find_action`).
+    ``has_before``, ``has_after``
+        Whether the class defines ``__before__``/``__after__``. Those
+        set on an instance (in ``__init__``, for instance) are also
+        called.
+
+    Callables that aren't known when the plan is built (instance
+    attributes, ``__before__`` callables, etc.) are inspected on first
+    use and remembered.
+
+    """
+    def __init__(self, cls):
+        self.has_before = hasattr(cls, '__before__')
+        self.has_after = hasattr(cls, '__after__')
+        self._argplans = {}
+        actions = {}
+        for name in dir(cls):
+            if name.startswith('_') or name == 'start_response':
+                continue
+            try:
+                func = getattr(cls, name)
+            except AttributeError:
+                continue
+            if not callable(func) or isinstance(func, type):
+                continue
+            try:
+                actions[name] = self.argplan(func)
+            except TypeError:
+                # Not introspectable, leave it for request time
+                continue
+        self.actions = actions
+
+    def argplan(self, func):
+        """Return the ``(accepts_kwargs, argnames)`` plan for ``func``
+
+        If the function has been decorated, it is assumed that the
+        decorator preserved the function signature.
+
+        """
+        # function could be callable
+        func_key = getattr(func, 'im_func', func.__call__)
+        try:
+            return self._argplans[func_key]
+        except KeyError:
+            pass
+        argspec = inspect.getargspec(func_key)
+        argnames = tuple(argspec[0][isinstance(func, types.MethodType)
+                                    and 1 or 0:])
+        plan = self._argplans[func_key] = (bool(argspec[2]), argnames)
+        return plan
+
+
+class StreamingIter(object):
+    """Iterator over the generator returned by an action
+
+    The response is sent as the generator produces it, without being
+    buffered. The request's :class:`~pylons.context.PylonsContext` is
+    bound while the generator runs, so the Pylons globals can be used
+    in it even though the middleware is done with the request by then.
+    Unicode chunks are encoded with the response's charset, and closing
+    the iterator closes the generator.
+
+    """
+    def __init__(self, app_iter, py_object, charset):
+        self.app_iter = app_iter
+        self.py_object = py_object
+        self.charset = charset
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        previous = bind_context(self.py_object)
+        try:
+            chunk = self.app_iter.next()
+        finally:
+            bind_context(previous)
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode(self.charset)
+        return chunk
+
+    def close(self):
+        previous = bind_context(self.py_object)
+        try:
+            self.app_iter.close()
+        finally:
+            bind_context(previous)
+
+
+def _append_body(response, body, chunk):
+    """Append the encoded ``chunk`` to the ``body`` already written to
+    ``response``, keeping both as chunks of the app_iter rather than
+    copying them into a new string"""
+    response.app_iter = [body, chunk]
+    response.content_length = len(body) + len(chunk)
+
+
 class WSGIController(object):
     """WSGI Controller that follows WSGI spec for calling and return
     values
@@ -48,9 +158,33 @@ class WSGIController(object):
     Controller will raise an "Action Not Found" error if in debug mode,
     otherwise a ``404 Not Found`` error will be returned.
 
+    Actions may stream their response by returning a generator (see
+    :class:`StreamingIter`). The headers are those of
+    :data:`~pylons.response` when the action returns, before the
+    generator runs, and a ``Content-Length`` set on it is kept::
+
+        def export(self):
+            response.content_type = 'text/csv'
+            response.content_length = size
+            def rows():
+                for record in records:
+                    yield format_row(record)
+            return rows()
+
     """
     _pylons_log_debug = False
 
+    @classmethod
+    def _get_dispatch_plan(cls):
+        """Return the :class:`DispatchPlan` for this controller class,
+        building it on first use"""
+        try:
+            return cls.__dict__['_pylons_dispatch_plan']
+        except KeyError:
+            plan = DispatchPlan(cls)
+            cls._pylons_dispatch_plan = plan
+            return plan
+
     def _perform_call(self, func, args):
         """Hide the traceback for everything above this method"""
         __traceback_hide__ = 'before_and_this'
@@ -67,39 +201,23 @@ class WSGIController(object):
         decorator preserved the function signature.
 
         """
-        # Check to see if the class has a cache of argspecs yet
-        try:
-            cached_argspecs = self.__class__._cached_argspecs
-        except AttributeError:
-            self.__class__._cached_argspecs = cached_argspecs = {}
-
-        # function could be callable
-        func_key = getattr(func, 'im_func', func.__call__)
-        try:
-            argspec = cached_argspecs[func_key]
-        except KeyError:
-            argspec = cached_argspecs[func_key] = inspect.getargspec(func_key)
+        varkw, argnames = self._get_dispatch_plan().argplan(func)
         kargs = self._get_method_args()
 
         log_debug = self._pylons_log_debug
-        c = self._py_object.tmpl_context
-        environ = self._py_object.request.environ
-        args = None
-
-        if argspec[2]:
-            if self._py_object.config['pylons.tmpl_context_attach_args']:
-                for k, val in kargs.iteritems():
-                    setattr(c, k, val)
+        py_object = self._py_object
+        environ = py_object.request.environ
+        attach_args = py_object.config['pylons.tmpl_context_attach_args']
+
+        if varkw:
             args = kargs
         else:
-            args = {}
-            argnames = argspec[0][isinstance(func, types.MethodType)
-                                  and 1 or 0:]
-            for name in argnames:
-                if name in kargs:
-                    if self._py_object.config['pylons.tmpl_context_attach_args']:
-                        setattr(c, name, kargs[name])
-                    args[name] = kargs[name]
+            args = dict((name, kargs[name]) for name in argnames
+                        if name in kargs)
+        if attach_args:
+            c = py_object.tmpl_context
+            for k, val in args.iteritems():
+                setattr(c, k, val)
         if log_debug:
             log.debug("Calling %r method with keyword args: **%r",
                       func.__name__, args)
@@ -139,6 +257,27 @@ class WSGIController(object):
         kargs['pylons'] = self._py_object
         return kargs
 
+    def _find_action(self, action_method):
+        """Return the bound method handling ``action_method``, or None
+
+        The actions of the class are looked up in its
+        :class:`DispatchPlan`, other callable instance attributes are
+        looked up on the instance.
+
+        """
+        if action_method in self._get_dispatch_plan().actions and \
+                action_method not in self.__dict__:
+            return getattr(self, action_method)
+        if action_method == 'start_response':
+            return None
+        try:
+            func = getattr(self, action_method, None)
+        except UnicodeEncodeError:
+            return None
+        if not callable(func):
+            return None
+        return func
+
     def _dispatch_call(self):
         """Handles dispatching the request to the function using
         Routes"""
@@ -153,11 +292,8 @@ class WSGIController(object):
         if log_debug:
             log.debug("Looking for %r method to handle the request",
                       action_method)
-        try:
-            func = getattr(self, action_method, None)
-        except UnicodeEncodeError:
-            func = None
-        if action_method != 'start_response' and callable(func):
+        func = self._find_action(action_method)
+        if func is not None:
             # Store function used to handle request
             req.environ['pylons.action_method'] = func
 
@@ -179,34 +315,35 @@ class WSGIController(object):
         # Keep a local reference to the req/response objects
         self._py_object = environ['pylons.pylons']
 
-        # Keep private methods private
-        try:
-            if environ['pylons.routes_dict']['action'][:1] in ('_', '-'):
-                if log_debug:
-                    log.debug("Action starts with _, private action not "
-                              "allowed. Returning a 404 response")
-                return HTTPNotFound()(environ, start_response)
-        except KeyError:
-            # The check later will notice that there's no action
-            pass
+        # Keep private methods private, the actions of the plan are public
+        plan = self._get_dispatch_plan()
+        action = environ.get('pylons.routes_dict', {}).get('action')
+        if action is not None and action not in plan.actions and \
+                action[:1] in ('_', '-'):
+            if log_debug:
+                log.debug("Action starts with _, private action not "
+                          "allowed. Returning a 404 response")
+            return HTTPNotFound()(environ, start_response)
 
         start_response_called = []
 
         def repl_start_response(status, headers, exc_info=None):
-            response = self._py_object.response
+            # Only a response that's been created can have headers to merge
+            response = self._py_object.__dict__.get('response')
             start_response_called.append(None)
 
             # Copy the headers from the global response
-            if log_debug:
-                log.debug("Merging pylons.response headers into "
-                          "start_response call, status: %s", status)
-            headers.extend(header for header in response.headerlist
-                           if header[0] == 'Set-Cookie' or
-                           header[0].startswith('X-'))
+            if response is not None:
+                if log_debug:
+                    log.debug("Merging pylons.response headers into "
+                              "start_response call, status: %s", status)
+                headers.extend(header for header in response.headerlist
+                               if header[0] == 'Set-Cookie' or
+                               header[0].startswith('X-'))
             return start_response(status, headers, exc_info)
         self.start_response = repl_start_response
 
-        if hasattr(self, '__before__'):
+        if plan.has_before or '__before__' in self.__dict__:
             response = self._inspect_call(self.__before__)
             if hasattr(response, '_exception'):
                 return response(environ, self.start_response)
@@ -221,13 +358,21 @@ class WSGIController(object):
                 if log_debug:
                     log.debug("Controller returned a string "
                               ", writing it to pylons.response")
-                py_response.body = py_response.body + response
+                body = py_response.body
+                if body:
+                    _append_body(py_response, body, response)
+                else:
+                    py_response.body = response
             elif isinstance(response, unicode):
                 if log_debug:
                     log.debug("Controller returned a unicode string "
                               ", writing it to pylons.response")
-                py_response.unicode_body = py_response.unicode_body + \
-                        response
+                body = py_response.body
+                if body:
+                    _append_body(py_response, body,
+                                 response.encode(py_response.charset))
+                else:
+                    py_response.unicode_body = response
             elif hasattr(response, 'wsgi_response'):
                 # It's an exception that got tossed.
                 if log_debug:
@@ -238,6 +383,7 @@ class WSGIController(object):
                         response.headers.add(name, value)
                     else:
                         response.headers.setdefault(name, value)
+                self._py_object.response = response
                 try:
                     registry = environ['paste.registry']
                     registry.replace(pylons.response, response)
@@ -252,10 +398,21 @@ class WSGIController(object):
                 if log_debug:
                     log.debug("Assuming controller returned an iterable, "
                               "setting it as pylons.response.app_iter")
+                if isinstance(response, types.GeneratorType):
+                    response = StreamingIter(response, self._py_object,
+                                             py_response.charset)
+                    # Safe to iterate over once the registry is gone
+                    environ['pylons.stream_response'] = True
+                # Keep the Content-Length set by the action for the
+                # iterable, unlike the one of the (empty) default body
+                content_length = py_response.content_length
+                declared = content_length and py_response.app_iter == ['']
                 py_response.app_iter = response
+                if declared:
+                    py_response.content_length = content_length
             response = py_response
 
-        if hasattr(self, '__after__'):
+        if plan.has_after or '__after__' in self.__dict__:
             after = self._inspect_call(self.__after__)
             if hasattr(after, '_exception'):
                 after.wsgi_response = True
@@ -32,6 +32,7 @@ from webob import Response as WebObResponse
 from webob.exc import status_map
 
 import pylons
+from pylons.context import get_pylons_context
 
 __all__ = ['abort', 'etag_cache', 'redirect', 'Request', 'Response']
 
@@ -48,6 +49,23 @@ class Request(WebObRequest):
     compatibility with paste.wsgiwrappers.WSGIRequest.
 
     """
+    def __getattr__(self, name):
+        # The attributes set on the request are kept in the environ by
+        # WebOb's AdhocAttrMixin
+        getattr_ = getattr(super(Request, self), '__getattr__', None)
+        if getattr_ is not None:
+            try:
+                return getattr_(name)
+            except AttributeError:
+                pass
+        # tmpl_context is only attached once it's created, which happens on
+        # first use
+        if name == 'tmpl_context':
+            pylons_obj = self.environ.get('pylons.pylons')
+            if pylons_obj is not None:
+                return pylons_obj.tmpl_context
+        raise AttributeError(name)
+
     def determine_browser_charset(self):
         """Legacy method to return the
         :attr:`webob.Request.accept_charset`"""
@@ -165,9 +183,13 @@ def etag_cache(key=None):
         exception if the ETag received matches the key provided.
 
     """
+    pylons_obj = get_pylons_context()
+    if pylons_obj is not None:
+        request, response = pylons_obj.request, pylons_obj.response
+    else:
+        request, response = pylons.request, pylons.response._current_obj()
     if_none_matches = IF_NONE_MATCH.findall(
-        pylons.request.environ.get('HTTP_IF_NONE_MATCH', ''))
-    response = pylons.response._current_obj()
+        request.environ.get('HTTP_IF_NONE_MATCH', ''))
     response.headers['ETag'] = '"%s"' % key
     if str(key) in if_none_matches:
         log.debug("ETag match, returning 304 HTTP Not Modified Response")
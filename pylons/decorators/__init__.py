@@ -9,20 +9,28 @@ decorators for use with controllers are in the
 import logging
 import warnings
 
-import formencode
-import simplejson
 from decorator import decorator
-from formencode import api, htmlfill, variabledecode
 
 from pylons.decorators.util import get_pylons
 from pylons.i18n import _ as pylons_gettext
+from pylons.util import DeferredBaseType
 
 __all__ = ['jsonify', 'validate']
 
 log = logging.getLogger(__name__)
 
 
-class JSONEncoder(simplejson.JSONEncoder):
+class JSONEncoder(object):
+    """``simplejson.JSONEncoder`` serializing the objects that have a
+    ``__json__`` method
+
+    simplejson is only imported once the encoder is used (see
+    :class:`~pylons.util.DeferredBaseType`).
+
+    """
+    __metaclass__ = DeferredBaseType
+    _deferred_base = 'simplejson:JSONEncoder'
+
     def default(self, obj):
         encoder = getattr(obj, '__json__', None)
         if encoder is not None:
@@ -30,6 +38,14 @@ class JSONEncoder(simplejson.JSONEncoder):
         return super(JSONEncoder, self).default(obj)
 
 
+def _json_default(obj):
+    """Serialize objects that have a ``__json__`` method"""
+    encoder = getattr(obj, '__json__', None)
+    if encoder is not None:
+        return encoder()
+    raise TypeError(repr(obj) + " is not JSON serializable")
+
+
 @decorator
 def jsonify(func, *args, **kwargs):
     """Action decorator that formats output for JSON
@@ -39,6 +55,8 @@ def jsonify(func, *args, **kwargs):
     output it.
 
     """
+    # Imported here as simplejson is only needed once an action is called
+    import simplejson
     pylons = get_pylons(args)
     pylons.response.headers['Content-Type'] = 'application/json; charset=utf-8'
     data = func(*args, **kwargs)
@@ -49,7 +67,7 @@ def jsonify(func, *args, **kwargs):
         warnings.warn(msg, Warning, 2)
         log.warning(msg)
     log.debug("Returning JSON wrapped action output")
-    return simplejson.dumps(data, cls=JSONEncoder, encoding='utf-8')
+    return simplejson.dumps(data, default=_json_default, encoding='utf-8')
 
 
 def validate(schema=None, validators=None, form=None, variable_decode=False,
@@ -110,6 +128,9 @@ def validate(schema=None, validators=None, form=None, variable_decode=False,
                 pass
 
     """
+    import formencode
+    from formencode import htmlfill, variabledecode
+
     if state is None:
         state = PylonsFormEncodeState
 
@@ -190,6 +211,7 @@ def pylons_formencode_gettext(value):
     trans = pylons_gettext(value)
     if trans == value:
         # translation failed, try formencode
+        from formencode import api
         trans = api._stdtrans(value)
     return trans
 
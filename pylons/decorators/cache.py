@@ -1,21 +1,40 @@
-"""Caching decorator"""
+"""Caching decorators"""
+import copy
 import inspect
 import logging
+import threading
 import time
+from hashlib import sha1
 
+from beaker.container import MemoryNamespaceManager
 from decorator import decorator
 from paste.deploy.converters import asbool
 
+from pylons.caching import apply_local_tier, default_codec, \
+    get_cache_stats, new_tag_generations, tag_generations, tag_types, \
+    tags_current
+from pylons.context import PylonsContext, bind_context, \
+    get_pylons_context
+from pylons.controllers.util import IF_NONE_MATCH
 from pylons.decorators.util import get_pylons
 
+__all__ = ['RequestMemo', 'beaker_cache', 'create_cache_key',
+           'get_request_memo', 'invalidate_tags', 'request_memoize']
+
 log = logging.getLogger(__name__)
 
+# (namespace, key) pairs being regenerated by a background thread
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
 
 def beaker_cache(key="cache_default", expire="never", type=None,
                  query_args=False,
                  cache_headers=('content-type', 'content-length'),
                  invalidate_on_startup=False,
-                 cache_response=True, **b_kwargs):
+                 cache_response=True, max_key_length=None, lock=False,
+                 stale_ttl=None, tags=None, full_response=False, vary=(),
+                 codec=default_codec, **b_kwargs):
     """Cache decorator utilizing Beaker. Caches action or other
     function that returns a pickle-able object as a result.
 
@@ -47,9 +66,75 @@ def beaker_cache(key="cache_default", expire="never", type=None,
         .. note::
             When cache_response is set to False, the cache_headers
             argument is ignored as none of the response is cached.
+    ``max_key_length``
+        Keys longer than this are replaced with their SHA-1 hex digest,
+        for backends that limit the length of keys (such as memcached).
+        Defaults to None, keys are never hashed.
+    ``lock``
+        If True, only one worker at a time regenerates an expired value
+        while the others keep serving the previous one, instead of all
+        of them regenerating it at once. Workers only wait when there's
+        no previous value, which is kept in the backend for another
+        ``expire`` (or ``stale_ttl``) seconds. The lock is the cache
+        backend's creation lock: a file lock (in the Beaker
+        ``lock_dir``) for the file, dbm and memcached backends, which
+        also holds across processes, and a thread lock for the memory
+        backend. Defaults to False.
+    ``stale_ttl``
+        Time in seconds an expired value may still be served for, while
+        it's regenerated in a background thread (holding the same lock
+        as ``lock``). Values older than ``expire`` plus ``stale_ttl``
+        are regenerated before being returned. Ignored when ``expire``
+        is "never". Defaults to None, expired values aren't served.
+
+    ``tags``
+        Tags of the cached values, to invalidate them with
+        :func:`invalidate_tags`: either a list of strings, or a
+        callable returning one when passed the same arguments as the
+        decorated function. Example::
+
+            @beaker_cache(key='id', tags=lambda self, id: ['user:%s' % id])
+            def profile(self, id):
+                ...
+
+        Checking the tags of a value costs one lookup per tag in the
+        ``pylons.cache_tags`` namespace, of the ``type`` backend (or the
+        one of the ``pylons.cache_tags_type`` option). Defaults to None,
+        no tags.
+
+    ``full_response``
+        If True, caches the final response of an action: its status,
+        all of its headers (except ``Set-Cookie`` and
+        ``Content-Length``) and its body, encoded to the response's
+        charset. A strong ``ETag`` computed from the body is added when
+        storing it, and requests with a matching ``If-None-Match``
+        header get a ``304 Not Modified`` answered from the cached
+        status and headers, without reading the body (which is stored
+        under a key of its own). ``cache_response`` and
+        ``cache_headers`` are ignored. Defaults to False.
+    ``vary``
+        A tuple of request header names whose values are part of the
+        key, so that each variant is cached separately. With
+        ``full_response``, they're also added to the ``Vary`` response
+        header.
+
+    ``codec``
+        Object encoding the cached values to strings, and decoding them
+        (see :class:`~pylons.caching.ValueCodec`), used unless the
+        memory backend is used. Defaults to
+        :data:`~pylons.caching.default_codec`, None stores the values
+        as they are, leaving them to be pickled by the backend.
+
+    With ``lock`` or ``stale_ttl``, the time a value was created is
+    stored along with it and the value is kept in the backend past its
+    expiration, so that it remains available to be served while it's
+    regenerated.
 
     If cache_enabled is set to False in the .ini file, then cache is
-    disabled globally.
+    disabled globally. An in-process tier is put in front of the cache
+    backend when ``pylons.cache_local_ttl`` is set (see
+    :mod:`pylons.caching`). The lookups are counted in the statistics of
+    the namespace (see :func:`~pylons.caching.get_cache_stats`).
 
     """
     if invalidate_on_startup:
@@ -57,80 +142,527 @@ def beaker_cache(key="cache_default", expire="never", type=None,
     else:
         starttime = None
     cache_headers = set(cache_headers)
+    if type:
+        b_kwargs['type'] = type
+    if expire == "never":
+        cache_expire = None
+    else:
+        cache_expire = expire
+    if cache_expire is None:
+        stale_ttl = None
+    store_body = full_response
+    if cache_expire is None:
+        body_expire = None
+    elif lock:
+        body_expire = cache_expire + (stale_ttl or cache_expire)
+    else:
+        body_expire = cache_expire + (stale_ttl or 0)
+    get_tags = tags
+    if tags is not None and not callable(tags):
+        tags = tuple(tags)
+        def get_tags(*args, **kwargs):
+            return tags
+    if tags is not None:
+        tag_types.add(type)
+    if lock or stale_ttl:
+        regenerate = _make_regenerate(cache_expire, lock, stale_ttl,
+                                      starttime)
+    else:
+        regenerate = None
 
-    def wrapper(func, *args, **kwargs):
-        """Decorator wrapper"""
-        pylons = get_pylons(args)
-        log.debug("Wrapped with key: %s, expire: %s, type: %s, query_args: %s",
-                  key, expire, type, query_args)
-        enabled = pylons.config.get("cache_enabled", "True")
-        if not asbool(enabled):
-            log.debug("Caching disabled, skipping cache lookup")
-            return func(*args, **kwargs)
+    def decorate(func):
+        # The names of the arguments (other than self) that are used
+        # in the key, along with their position
+        argnames = [(i, arg)
+                    for i, arg in enumerate(inspect.getargspec(func)[0])
+                    if arg != "self"]
+        # Cache objects by namespace, along with the cache manager
+        # they were taken from
+        caches = {}
+
+        def wrapper(func, *args, **kwargs):
+            """Decorator wrapper"""
+            pylons = get_pylons(args)
+            log.debug("Wrapped with key: %s, expire: %s, type: %s, "
+                      "query_args: %s", key, expire, type, query_args)
+            enabled = pylons.config.get("cache_enabled", "True")
+            if not asbool(enabled):
+                log.debug("Caching disabled, skipping cache lookup")
+                return func(*args, **kwargs)
 
-        if key:
-            key_dict = kwargs.copy()
-            key_dict.update(_make_dict_from_args(func, args))
-            if query_args:
-                key_dict.update(pylons.request.GET.mixed())
+            if key:
+                key_dict = kwargs.copy()
+                for i, arg in argnames:
+                    key_dict[arg] = args[i]
+                if query_args:
+                    key_dict.update(pylons.request.GET.mixed())
 
-            if key != "cache_default":
-                if isinstance(key, list):
-                    key_dict = dict((k, key_dict[k]) for k in key)
+                if key != "cache_default":
+                    if isinstance(key, list):
+                        key_dict = dict((k, key_dict[k]) for k in key)
+                    else:
+                        key_dict = {key: key_dict[key]}
+            else:
+                key_dict = None
+            if vary:
+                headers = pylons.request.headers
+                if key_dict is None:
+                    key_dict = {}
+                for name in vary:
+                    key_dict['Vary-' + name] = headers.get(name, '')
+
+            self = None
+            if args:
+                self = args[0]
+            namespace, cache_key = create_cache_key(func, key_dict, self,
+                                                    max_key_length)
+
+            cache_obj = _get_cache_manager(pylons)
+            tags_type = pylons.config.get('pylons.cache_tags_type') or type
+
+            try:
+                manager, my_cache, my_codec = caches[namespace]
+            except KeyError:
+                manager = None
+            if manager is not cache_obj:
+                my_cache = apply_local_tier(
+                    cache_obj.get_cache(namespace, **b_kwargs), pylons.config)
+                # The memory backend doesn't serialize its values
+                if isinstance(my_cache.namespace, MemoryNamespaceManager):
+                    my_codec = None
                 else:
-                    key_dict = {key: key_dict[key]}
+                    my_codec = codec
+                caches[namespace] = cache_obj, my_cache, my_codec
+
+            body_key = cache_key + ' body'
+            # Body created by this request with full_response
+            bodies = []
+            stats = get_cache_stats(namespace)
+            # Whether the value was created for this request, rather
+            # than refreshed in the background
+            created = []
+
+            def create_func(py_object=pylons):
+                log.debug("Creating new cache copy with key: %s, type: %s",
+                          cache_key, type)
+                start = time.time()
+                if get_tags is not None:
+                    # Taken before creating the value, so that it's
+                    # stale if invalidated in the meantime
+                    generations = tag_generations(
+                        cache_obj, get_tags(*args, **kwargs), tags_type)
+                result = func(*args, **kwargs)
+                glob_response = py_object.response
+                headers = glob_response.headerlist
+                if not store_body:
+                    # Only the headers that are served are kept
+                    headers = [header for header in headers
+                               if cache_response and
+                               header[0].lower() in cache_headers]
+                status = glob_response.status
+                full_response = dict(headers=headers, status=status,
+                                     cookies=None, content=result)
+                if get_tags is not None:
+                    full_response['tags'] = generations
+                if store_body:
+                    body = _encode_body(result, glob_response.charset)
+                    etag = sha1(body).hexdigest()
+                    headers = [header for header in headers
+                               if header[0].lower() not in
+                               ('set-cookie', 'content-length', 'etag')]
+                    headers.append(('ETag', '"%s"' % etag))
+                    if vary:
+                        _add_vary(headers, vary)
+                    full_response.update(headers=headers, etag=etag,
+                                         content=None)
+                    body_record = dict(etag=etag, content=body)
+                    if my_codec is not None:
+                        body_record = my_codec.encode(body_record)
+                    my_cache.put(body_key, body_record,
+                                 expiretime=body_expire)
+                    bodies.append(body)
+                stats.regenerated(time.time() - start, result)
+                if py_object is pylons:
+                    created.append(True)
+                return full_response
+
+            def get_response():
+                if regenerate:
+                    return regenerate(my_cache, cache_key, create_func,
+                                      my_codec)
+                if my_codec is None:
+                    return my_cache.get_value(
+                        cache_key, createfunc=create_func,
+                        expiretime=cache_expire, starttime=starttime)
+                return my_codec.decode(my_cache.get_value(
+                    cache_key,
+                    createfunc=lambda: my_codec.encode(create_func()),
+                    expiretime=cache_expire, starttime=starttime))
+
+            response = get_response()
+            if response is None:
+                # Stored in a format this version can't read
+                my_cache.remove_value(cache_key)
+                response = get_response()
+            if get_tags is not None:
+                generations = response.get('tags')
+                if generations is None or \
+                        not tags_current(cache_obj, generations, tags_type):
+                    log.debug("Tags of cache key: %s were invalidated",
+                              cache_key)
+                    my_cache.remove_value(cache_key)
+                    response = get_response()
+            if created:
+                stats.misses += 1
+            else:
+                stats.hits += 1
+            if store_body:
+                return _serve_full_response(pylons, my_cache, cache_key,
+                                            response, bodies, get_response,
+                                            my_codec)
+            if cache_response:
+                glob_response = pylons.response
+                glob_response.headerlist = [
+                    header for header in response['headers']
+                    if header[0].lower() in cache_headers]
+                glob_response.status = response['status']
+
+            return response['content']
+        return decorator(wrapper, func)
+    return decorate
+
+
+def invalidate_tags(*tags, **kwargs):
+    """Invalidate all the values cached by :func:`beaker_cache` with
+    any of the ``tags``, whatever their namespace
+
+    The cache manager used is the ``cache_manager`` keyword argument,
+    or the one :func:`beaker_cache` uses (``app_globals.cache``, or
+    ``pylons.cache``). The generations of the tags are renewed in the
+    cache backend of the ``type`` keyword argument, or of the
+    ``pylons.cache_tags_type`` option, or else in those of all the
+    values cached with tags by this process. Example::
+
+        from pylons.decorators.cache import invalidate_tags
+        invalidate_tags('user:%s' % user.id, 'product:%s' % product.id)
+
+    """
+    pylons = get_pylons(())
+    cache_manager = kwargs.get('cache_manager')
+    if cache_manager is None:
+        cache_manager = _get_cache_manager(pylons)
+    tags_type = kwargs.get('type')
+    if tags_type is None:
+        tags_type = pylons.config.get('pylons.cache_tags_type')
+    if tags_type is not None:
+        types = [tags_type]
+    else:
+        types = tag_types or [None]
+    for tags_type in types:
+        new_tag_generations(cache_manager, tags, tags_type)
+
+
+def _serve_full_response(pylons, my_cache, cache_key, response, bodies,
+                         get_response, codec):
+    """Set up the response from a value cached by :func:`beaker_cache`
+    with ``full_response``, returning its body"""
+    glob_response = pylons.response
+    # Cookies aren't cached, but the ones set for this request are kept
+    cookies = [header for header in glob_response.headerlist
+               if header[0].lower() == 'set-cookie']
+    glob_response.headerlist = response['headers'] + cookies
+    glob_response.status = response['status']
+    etag = response['etag']
+    if_none_matches = IF_NONE_MATCH.findall(
+        pylons.request.environ.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_matches:
+        log.debug("ETag match for cache key: %s, returning 304 HTTP Not "
+                  "Modified Response", cache_key)
+        glob_response.status = 304
+        glob_response.headers.pop('Content-Type', None)
+        return None
+
+    if bodies:
+        return bodies[-1]
+    body_record = _get_body(my_cache, cache_key + ' body', codec)
+    if body_record.get('etag') != etag:
+        # The body expired or was replaced, start over
+        log.debug("Missing body for cache key: %s", cache_key)
+        my_cache.remove_value(cache_key)
+        response = get_response()
+        glob_response.headerlist = response['headers'] + cookies
+        glob_response.status = response['status']
+        if bodies:
+            return bodies[-1]
+        body_record = _get_body(my_cache, cache_key + ' body', codec)
+    return body_record.get('content')
+
+
+def _get_body(my_cache, body_key, codec):
+    """Return the record of a body cached with ``full_response``, or an
+    empty dict"""
+    try:
+        body_record = my_cache.get(body_key)
+    except KeyError:
+        return {}
+    if codec is not None:
+        body_record = codec.decode(body_record)
+    if not isinstance(body_record, dict):
+        return {}
+    return body_record
+
+
+def _encode_body(result, charset):
+    """Encode the result of an action to a string"""
+    if result is None:
+        return ''
+    if isinstance(result, str):
+        return result
+    charset = charset or 'utf-8'
+    if isinstance(result, unicode):
+        return result.encode(charset)
+    chunks = []
+    for chunk in result:
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode(charset)
+        chunks.append(chunk)
+    return ''.join(chunks)
+
+
+def _add_vary(headers, vary):
+    """Add the ``vary`` header names to the Vary header of the
+    ``headers`` list"""
+    names = []
+    for i, (name, value) in enumerate(headers):
+        if name.lower() == 'vary':
+            names = [item.strip() for item in value.split(',')]
+            del headers[i]
+            break
+    lowered = [name.lower() for name in names]
+    names.extend(name for name in vary if name.lower() not in lowered)
+    headers.append(('Vary', ', '.join(names)))
+
+
+def _get_cache_manager(pylons):
+    """Return the cache manager used by :func:`beaker_cache`"""
+    cache_obj = getattr(pylons.app_globals, 'cache', None)
+    if not cache_obj:
+        cache_obj = getattr(pylons, 'cache', None)
+    if not cache_obj:
+        raise Exception('No CacheMiddleware or cache object on '
+                        ' app_globals was found')
+    return cache_obj
+
+
+def _make_regenerate(expire, lock, stale_ttl, starttime):
+    """Return a function getting a value from the cache that's
+    regenerated under the backend's creation lock, for the ``lock`` and
+    ``stale_ttl`` options of :func:`beaker_cache`"""
+    # Drop the value from the backend once it can't be served, the
+    # previous value being served while it's regenerated under the lock
+    # for up to another expire (or stale_ttl)
+    if expire is None:
+        store_expire = None
+    elif lock:
+        store_expire = expire + (stale_ttl or expire)
+    else:
+        store_expire = expire + stale_ttl
+
+    def create(my_cache, cache_key, create_func, codec, py_object=None):
+        if py_object is None:
+            response = create_func()
+        else:
+            response = create_func(py_object)
+        response['created'] = time.time()
+        if codec is None:
+            my_cache.put(cache_key, response, expiretime=store_expire)
         else:
-            key_dict = None
+            my_cache.put(cache_key, codec.encode(response),
+                         expiretime=store_expire)
+        return response
 
-        self = None
-        if args:
-            self = args[0]
-        namespace, cache_key = create_cache_key(func, key_dict, self)
+    def refresh(my_cache, cache_key, create_func, codec):
+        refresh_key = (my_cache.namespace_name, cache_key)
+        _refreshing_lock.acquire()
+        try:
+            if refresh_key in _refreshing:
+                return
+            _refreshing.add(refresh_key)
+        finally:
+            _refreshing_lock.release()
 
-        if type:
-            b_kwargs['type'] = type
+        # Regenerate with a copy of the request's context, so that the
+        # response being sent isn't modified
+        context = get_pylons_context()
+        if context is not None:
+            context = copy.copy(context)
+            if 'response' in context.__dict__:
+                context.response = context.response.copy()
 
-        cache_obj = getattr(pylons.app_globals, 'cache', None)
-        if not cache_obj:
-            cache_obj = getattr(pylons, 'cache', None)
-        if not cache_obj:
-            raise Exception('No CacheMiddleware or cache object on '
-                            ' app_globals was found')
+        def run():
+            previous = bind_context(context)
+            try:
+                creation_lock = my_cache.namespace.get_creation_lock(
+                    cache_key)
+                if creation_lock.acquire(False):
+                    try:
+                        create(my_cache, cache_key, create_func, codec,
+                               context)
+                    finally:
+                        creation_lock.release()
+            except:
+                log.exception("Error regenerating cache key: %s",
+                              cache_key)
+            finally:
+                bind_context(previous)
+                _refreshing_lock.acquire()
+                try:
+                    _refreshing.discard(refresh_key)
+                finally:
+                    _refreshing_lock.release()
+        thread = threading.Thread(target=run,
+                                  name='beaker_cache refresh %s' % cache_key)
+        thread.setDaemon(True)
+        thread.start()
 
-        my_cache = cache_obj.get_cache(namespace, **b_kwargs)
+    def lookup(my_cache, cache_key, codec):
+        """Return the stored value and whether it's fresh, or None when
+        there's no value that can be served"""
+        try:
+            response = my_cache.get(cache_key)
+        except KeyError:
+            return None, False
+        if codec is not None:
+            response = codec.decode(response)
+            if response is None:
+                return None, False
+        created = response.get('created', 0)
+        if starttime is not None and created < starttime:
+            return None, False
+        if expire is None:
+            return response, True
+        age = time.time() - created
+        if age < expire:
+            return response, True
+        if lock or (stale_ttl and age < expire + stale_ttl):
+            return response, False
+        return None, False
 
-        if expire == "never":
-            cache_expire = None
+    def regenerate(my_cache, cache_key, create_func, codec=None):
+        response, fresh = lookup(my_cache, cache_key, codec)
+        if fresh:
+            return response
+        if response is not None and stale_ttl and \
+                time.time() - response['created'] < expire + stale_ttl:
+            log.debug("Serving stale cache copy with key: %s", cache_key)
+            refresh(my_cache, cache_key, create_func, codec)
+            return response
+
+        creation_lock = my_cache.namespace.get_creation_lock(cache_key)
+        if response is not None:
+            if not creation_lock.acquire(False):
+                log.debug("Serving previous cache copy with key: %s while "
+                          "it's regenerated", cache_key)
+                return response
         else:
-            cache_expire = expire
-
-        def create_func():
-            log.debug("Creating new cache copy with key: %s, type: %s",
-                      cache_key, type)
-            result = func(*args, **kwargs)
-            glob_response = pylons.response
-            headers = glob_response.headerlist
-            status = glob_response.status
-            full_response = dict(headers=headers, status=status,
-                                 cookies=None, content=result)
-            return full_response
-
-        response = my_cache.get_value(cache_key, createfunc=create_func,
-                                      expiretime=cache_expire,
-                                      starttime=starttime)
-        if cache_response:
-            glob_response = pylons.response
-            glob_response.headerlist = [header for header in response['headers']
-                                        if header[0].lower() in cache_headers]
-            glob_response.status = response['status']
-
-        return response['content']
-    return decorator(wrapper)
-
-
-def create_cache_key(func, key_dict=None, self=None):
+            creation_lock.acquire()
+        try:
+            # It may have been regenerated while waiting for the lock
+            response, fresh = lookup(my_cache, cache_key, codec)
+            if fresh:
+                return response
+            return create(my_cache, cache_key, create_func, codec)
+        finally:
+            creation_lock.release()
+    return regenerate
+
+
+class RequestMemo(dict):
+    """Results of the :func:`request_memoize` functions for a request,
+    by function and arguments
+
+    :attr:`hits` and :attr:`misses` count the calls that were, and
+    weren't, answered from the memo.
+
+    """
+    def __init__(self):
+        dict.__init__(self)
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return '<RequestMemo %d results, %d hits, %d misses>' % (
+            len(self), self.hits, self.misses)
+
+
+def request_memoize(func):
+    """Memoize a function for the duration of the request
+
+    The result of each call is kept on the request's
+    :class:`~pylons.context.PylonsContext`, keyed by the function and
+    its arguments, and returned by the following calls with the same
+    arguments during the request. It goes away with the context at the
+    end of the request. Unlike :func:`beaker_cache`, results aren't
+    serialized nor shared between requests.
+
+    Example::
+
+        @request_memoize
+        def get_user(user_id):
+            return Session.query(User).get(user_id)
+
+    Outside of a request, or when the arguments aren't hashable, the
+    function is always called. The memo of the current request is
+    returned by :func:`get_request_memo`.
+
+    """
+    def wrapper(func, *args, **kwargs):
+        """Decorator wrapper"""
+        context = get_pylons(args)
+        if not isinstance(context, PylonsContext):
+            context = get_pylons_context()
+            if context is None:
+                return func(*args, **kwargs)
+        memo = context.__dict__.get('_request_memo')
+        if memo is None:
+            memo = context._request_memo = RequestMemo()
+
+        if kwargs:
+            key = (func, args, tuple(sorted(kwargs.iteritems())))
+        else:
+            key = (func, args)
+        try:
+            result = memo[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable arguments
+            return func(*args, **kwargs)
+        else:
+            memo.hits += 1
+            return result
+        memo.misses += 1
+        result = memo[key] = func(*args, **kwargs)
+        return result
+    return decorator(wrapper, func)
+
+
+def get_request_memo():
+    """Return the :class:`RequestMemo` of the current request, or None
+    when no :func:`request_memoize` function was called yet"""
+    context = get_pylons_context()
+    if context is None:
+        return None
+    return context.__dict__.get('_request_memo')
+
+
+def create_cache_key(func, key_dict=None, self=None, max_key_length=None):
     """Get a cache namespace and key used by the beaker_cache decorator.
 
+    The key lists the ``key_dict`` items sorted by name, so that it
+    doesn't depend on the order of the dict. When ``max_key_length`` is
+    given, longer keys are replaced with their SHA-1 hex digest.
+
     Example::
         from pylons import cache
         from pylons.decorators.cache import create_cache_key
@@ -147,7 +679,11 @@ def create_cache_key(func, key_dict=None, self=None):
         cache_key = func.__name__
     if key_dict:
         cache_key += " " + " ".join("%s=%s" % (k, v)
-                                    for k, v in key_dict.iteritems())
+                                    for k, v in sorted(key_dict.iteritems()))
+    if max_key_length and len(cache_key) > max_key_length:
+        if isinstance(cache_key, unicode):
+            cache_key = cache_key.encode('utf-8')
+        cache_key = sha1(cache_key).hexdigest()
 
     if not kls and self:
         kls = getattr(self, '__class__', None)
@@ -156,12 +692,3 @@ def create_cache_key(func, key_dict=None, self=None):
         return '%s.%s' % (kls.__module__, kls.__name__), cache_key
     else:
         return func.__module__, cache_key
-
-
-def _make_dict_from_args(func, args):
-    """Inspects function for name of args"""
-    args_keys = {}
-    for i, arg in enumerate(inspect.getargspec(func)[0]):
-        if arg != "self":
-            args_keys[arg] = args[i]
-    return args_keys
@@ -5,15 +5,26 @@ Provides :mod:`gettext` translation functions via an app's
 translated to.
 
 """
+import copy
+import errno
 import os
-from gettext import NullTranslations, translation
+import threading
+from gettext import GNUTranslations, NullTranslations, find
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict
+
+from paste.deploy.converters import asbool
 
 import pylons
+from pylons.context import get_pylons_context
 
 __all__ = ['_', 'add_fallback', 'get_lang', 'gettext', 'gettext_noop',
            'lazy_gettext', 'lazy_ngettext', 'lazy_ugettext', 'lazy_ungettext',
            'ngettext', 'set_lang', 'ugettext', 'ungettext', 'LanguageError',
-           'N_']
+           'N_', 'TranslatorCache', 'translator_cache']
 
 
 class LanguageError(Exception):
@@ -147,6 +158,147 @@ def ungettext(singular, plural, n):
 lazy_ungettext = lazify(ungettext)
 
 
+class TranslatorCache(object):
+    """Process-wide cache of translators
+
+    :func:`gettext.translation` probes the locale directory for the
+    catalog of every language (and its variants) each time it's called.
+    The cache remembers, per ``(domain, localedir, languages, options)``,
+    the catalogs found along with the loaded translation objects, so
+    getting a translator only involves copying them into a new fallback
+    chain (the copies are needed as translators are modified by
+    ``add_fallback``).
+
+    Languages without any catalog are remembered too, so repeatedly
+    asking for them doesn't hit the filesystem either.
+
+    ``max_entries``
+        Maximum number of cached language lists, the oldest entry is
+        dropped when exceeded.
+
+    When the ``check_files`` argument of :meth:`get` is True (it
+    defaults to the :attr:`check_files` attribute, and
+    :func:`_get_translator` passes the ``debug`` option of the app's
+    config), the modification times of the cached catalogs are checked
+    on that lookup and the entry is reloaded when one of them changed.
+    Languages without a catalog aren't remembered in that case, so
+    newly compiled catalogs are picked up.
+
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.check_files = False
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, domain, localedir, languages, class_=None, fallback=False,
+            codeset=None, check_files=None):
+        """Return a translator, with the same arguments and behavior as
+        :func:`gettext.translation`, checking whether the catalogs
+        changed when ``check_files`` is True"""
+        if check_files is None:
+            check_files = self.check_files
+        key = (domain, localedir, tuple(languages), class_, fallback,
+               codeset)
+        try:
+            entry = self._entries[key]
+        except KeyError:
+            entry = None
+        except TypeError:
+            # Unhashable options, don't cache
+            key = entry = None
+        if entry is not None and check_files and self._changed(entry):
+            entry = None
+        if entry is None:
+            entry = self._load(domain, localedir, languages, class_,
+                               fallback)
+            if key is not None and (entry[0] or not check_files):
+                self._store(key, entry)
+
+        catalogs = entry[1]
+        if isinstance(catalogs, IOError):
+            raise catalogs
+        if not catalogs:
+            return NullTranslations()
+        result = None
+        for catalog in catalogs:
+            translator = copy.copy(catalog)
+            if codeset:
+                translator.set_output_charset(codeset)
+            if result is None:
+                result = translator
+            else:
+                result.add_fallback(translator)
+        return result
+
+    def warm(self, domain, localedir, **kwargs):
+        """Load the translator for each language that has a catalog for
+        ``domain`` in ``localedir``"""
+        try:
+            languages = sorted(os.listdir(localedir))
+        except OSError:
+            return
+        for lang in languages:
+            mofile = os.path.join(localedir, lang, 'LC_MESSAGES',
+                                  '%s.mo' % domain)
+            if os.path.exists(mofile):
+                self.get(domain, localedir, [lang], **kwargs)
+
+    def clear(self):
+        """Drop all the cached translators"""
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
+
+    def _load(self, domain, localedir, languages, class_, fallback):
+        """Find and load the catalogs, returning an entry of
+        ``(mtimes, catalogs)``, where catalogs is the IOError to raise
+        when none were found"""
+        if class_ is None:
+            class_ = GNUTranslations
+        mofiles = find(domain, localedir, languages, all=1)
+        if not mofiles:
+            if fallback:
+                return (), ()
+            return (), IOError(errno.ENOENT,
+                               'No translation file found for domain',
+                               domain)
+        mtimes = []
+        catalogs = []
+        for mofile in mofiles:
+            mtimes.append((mofile, os.path.getmtime(mofile)))
+            fp = open(mofile, 'rb')
+            try:
+                catalogs.append(class_(fp))
+            finally:
+                fp.close()
+        return tuple(mtimes), tuple(catalogs)
+
+    def _changed(self, entry):
+        for mofile, mtime in entry[0]:
+            try:
+                if os.path.getmtime(mofile) != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def _store(self, key, entry):
+        self._lock.acquire()
+        try:
+            entries = self._entries
+            entries.pop(key, None)
+            entries[key] = entry
+            while len(entries) > self.max_entries:
+                del entries[iter(entries).next()]
+        finally:
+            self._lock.release()
+
+translator_cache = TranslatorCache()
+
+
 def _get_translator(lang, **kwargs):
     """Utility method to get a valid translator object from a language
     name"""
@@ -160,8 +312,10 @@ def _get_translator(lang, **kwargs):
     if not isinstance(lang, list):
         lang = [lang]
     try:
-        translator = translation(conf['pylons.package'], localedir,
-                                 languages=lang, **kwargs)
+        # Pick up recompiled catalogs while developing
+        translator = translator_cache.get(
+            conf['pylons.package'], localedir, lang,
+            check_files=asbool(conf.get('debug')), **kwargs)
     except IOError, ioe:
         raise LanguageError('IOError: %s' % ioe)
     translator.pylons_lang = lang
@@ -178,8 +332,9 @@ def set_lang(lang, set_environ=True, **kwargs):
     translator = _get_translator(lang, **kwargs)
     if not set_environ:
         return translator
-    environ = pylons.request.environ
-    environ['pylons.pylons'].translator = translator
+    pylons_obj = get_pylons_context()
+    pylons_obj.translator = translator
+    environ = pylons_obj.request.environ
     if 'paste.registry' in environ:
         environ['paste.registry'].replace(pylons.translator, translator)
 
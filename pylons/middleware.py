@@ -1,20 +1,35 @@
 """Pylons' WSGI middlewares"""
 import logging
 import os.path
-
+import sys
+import threading
+import time
+from hashlib import sha1
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict
+
+import paste.registry
+from beaker.middleware import SessionMiddleware
 from paste.deploy.converters import asbool
 from paste.urlparser import StaticURLParser
+from routes.middleware import RoutesMiddleware
 from weberror.evalexception import EvalException
 from weberror.errormiddleware import ErrorMiddleware
 from webhelpers.html import literal
+from webob.exc import status_map
 
 import pylons
+from pylons.caching import format_warm_report, warm_cache, warm_list
 from pylons.controllers.util import Request, Response
 from pylons.error import template_error_formatters
 from pylons.util import call_wsgi_application
 
-__all__ = ['ErrorHandler', 'error_document_template',
-           'footer_html', 'head_html', 'media_path']
+__all__ = ['ErrorHandler', 'StaticRegistryStack',
+           'error_document_template', 'footer_html', 'head_html',
+           'media_path', 'warmcache_filter_app_factory']
 
 log = logging.getLogger(__name__)
 
@@ -133,6 +148,17 @@ class StatusCodeRedirect(object):
     response is an error code in the errors sequence passed the request
     will be re-run with the path URL set to the path passed in.
 
+    The status is checked when the app calls ``start_response``: only
+    error responses are replaced, others are passed through. As they
+    would be iterated over once a ``RegistryManager`` wrapping this
+    middleware has cleaned up the Pylons globals, they're read into a
+    list when a registry is set up, unless
+    ``environ['pylons.stream_response']`` is set: by the generators
+    returned by actions (see
+    :class:`~pylons.controllers.core.StreamingIter`), and by
+    :class:`StaticRegistryStack`, which keeps the registry until the
+    response is closed. Those are streamed as the app produces them.
+
     This operation is non-recursive and the output of the second
     request will be used no matter what it is.
 
@@ -140,9 +166,17 @@ class StatusCodeRedirect(object):
     purposely return a 401), set
     ``environ['pylons.status_code_redirect'] = True`` in the application.
 
+    When ``cache_ttl`` is set, the error documents are cached by status
+    code, body of the error response (as the document usually includes
+    its message) and the ``cache_vary`` request headers, and served
+    from the cache without re-running the request.
+
     """
+    max_cache_entries = 256
+
     def __init__(self, app, errors=(400, 401, 403, 404),
-                 path='/error/document'):
+                 path='/error/document', cache_ttl=None, cache_vary=(),
+                 prerender=False):
         """Initialize the ErrorRedirect
 
         ``errors``
@@ -151,6 +185,23 @@ class StatusCodeRedirect(object):
         ``path``
             The path to set for the next request down to the
             application.
+        ``cache_ttl``
+            Number of seconds to cache the error documents for. Error
+            documents aren't cached by default. A cached document is
+            served to all the users, whatever their session: documents
+            setting a cookie, or sent with ``Cache-Control: private``
+            (or ``no-store``) or ``Vary: Cookie``, aren't cached, and
+            documents using other per-user data (such as ``c`` or the
+            user's identity) should send one of those headers, or vary
+            on the request headers they depend on (``cache_vary``).
+            The ``max_cache_entries`` least recently used documents are
+            kept.
+        ``cache_vary``
+            A sequence of request headers (such as ``Accept`` or
+            ``Accept-Language``) the cached error documents vary on.
+        ``prerender``
+            Whether or not to render (and cache) the error documents
+            for all the ``errors`` now, see :meth:`prerender`.
 
         """
         self.app = app
@@ -159,25 +210,419 @@ class StatusCodeRedirect(object):
         # Transform errors to str for comparison
         self.errors = tuple([str(x) for x in errors])
 
+        self.cache_ttl = cache_ttl
+        if cache_ttl is not None:
+            self.cache_ttl = int(cache_ttl)
+        self.cache_vary = tuple(['HTTP_' + name.upper().replace('-', '_')
+                                 for name in cache_vary])
+        self.cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        if prerender and self.cache_ttl is not None:
+            self.prerender()
+
     def __call__(self, environ, start_response):
-        status, headers, app_iter, exc_info = call_wsgi_application(
-            self.app, environ, catch_exc_info=True)
-        if status[:3] in self.errors and \
-            'pylons.status_code_redirect' not in environ and self.error_path:
-            # Create a response object
-            environ['pylons.original_response'] = Response(
-                status=status, headerlist=headers, app_iter=app_iter)
-            environ['pylons.original_request'] = Request(environ)
-
-            # Create a new environ to avoid touching the original request data
-            new_environ = environ.copy()
-            new_environ['PATH_INFO'] = self.error_path
-
-            newstatus, headers, app_iter, exc_info = call_wsgi_application(
-                    self.app, new_environ, catch_exc_info=True)
+        redirect = []
+        started = []
+        written = []
+
+        def repl_start_response(status, headers, exc_info=None):
+            if status[:3] in self.errors and self.error_path and \
+                    'pylons.status_code_redirect' not in environ:
+                # Hold on to the response, it might be replaced
+                redirect[:] = [status, headers, exc_info]
+                return written.append
+            del redirect[:]
+            started.append(None)
+            return start_response(status, headers, exc_info)
+        app_iter = self.app(environ, repl_start_response)
+
+        chunks = []
+        iterator = app_iter
+        if not redirect and not started:
+            # start_response is called when iterating, get the first
+            # chunk to know the status
+            iterator = iter(app_iter)
+            try:
+                while not redirect and not started:
+                    chunks.append(iterator.next())
+            except StopIteration:
+                pass
+            if not redirect:
+                return self.pass_through(
+                    environ, PrefixedIter(chunks, iterator, app_iter))
+
+        if not redirect:
+            # Not an error, pass the response through
+            return self.pass_through(environ, app_iter)
+
+        status, headers, exc_info = redirect
+        try:
+            chunks.extend(iterator)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        app_iter = written + chunks
+
+        cache_key = None
+        if self.cache_ttl is not None and exc_info is None and \
+                'pylons.status_code_redirect' not in environ:
+            cache_key = self.cache_key(environ, status, ''.join(app_iter))
+            document = self.cached_document(cache_key)
+            if document is not None:
+                start_response(status, list(document[1]))
+                return [document[2]]
+
+        if 'pylons.status_code_redirect' not in environ:
+            headers, app_iter, exc_info = self.render_document(
+                environ, status, headers, app_iter, cache_key)
         start_response(status, headers, exc_info)
         return app_iter
 
+    def pass_through(self, environ, app_iter):
+        """Return the ``app_iter`` of a response that isn't replaced,
+        read into a list when it can't be iterated over after the
+        registry is cleaned up"""
+        if isinstance(app_iter, (list, tuple)) or \
+                'paste.registry' not in environ or \
+                environ.get('pylons.stream_response'):
+            return app_iter
+        try:
+            return list(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    def cache_key(self, environ, status, body):
+        """Return the key of the error document of a response with
+        ``status`` and ``body``"""
+        return (status[:3], sha1(body).hexdigest()) + \
+            tuple([environ.get(name) for name in self.cache_vary])
+
+    def render_document(self, environ, status, headers, app_iter,
+                        cache_key=None, app=None):
+        """Run the request for the error document of a response,
+        returning its ``(headers, app_iter, exc_info)``
+
+        The document is cached under ``cache_key`` when given. The
+        request is run through ``app`` when given, instead of the
+        wrapped app.
+
+        """
+        # Create a response object
+        environ['pylons.original_response'] = Response(
+            status=status, headerlist=headers, app_iter=app_iter)
+        environ['pylons.original_request'] = Request(environ)
+
+        # Create a new environ to avoid touching the original request data
+        new_environ = environ.copy()
+        new_environ['PATH_INFO'] = self.error_path
+
+        newstatus, headers, app_iter, exc_info = call_wsgi_application(
+                app or self.app, new_environ, catch_exc_info=True)
+        if cache_key is not None and exc_info is None:
+            try:
+                body = ''.join(app_iter)
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+            app_iter = [body]
+            if _shared_document(headers):
+                self.cache_document(cache_key, (time.time() + self.cache_ttl,
+                                                list(headers), body))
+        return headers, app_iter, exc_info
+
+    def cached_document(self, cache_key):
+        """Return the ``(expires, headers, body)`` of the document
+        cached under ``cache_key``, or None when it's missing or
+        expired"""
+        document = self.cache.get(cache_key)
+        if document is None or document[0] <= time.time():
+            return None
+        self._cache_lock.acquire()
+        try:
+            # Mark as the most recently used
+            if cache_key in self.cache:
+                del self.cache[cache_key]
+                self.cache[cache_key] = document
+        finally:
+            self._cache_lock.release()
+        return document
+
+    def cache_document(self, cache_key, document):
+        """Cache the ``document`` under ``cache_key``, dropping the
+        least recently used ones past ``max_cache_entries``"""
+        self._cache_lock.acquire()
+        try:
+            cache = self.cache
+            cache.pop(cache_key, None)
+            cache[cache_key] = document
+            while len(cache) > self.max_cache_entries:
+                del cache[iter(cache).next()]
+        finally:
+            self._cache_lock.release()
+
+    def prerender(self):
+        """Render the error documents for all the ``errors`` into the
+        cache, for requests without the ``cache_vary`` headers
+
+        The documents are those of the default (HTML and plain text)
+        error responses, as returned by
+        :func:`~pylons.controllers.util.abort` without a detail
+        message. They're rendered through a ``RegistryManager``, as the
+        app is usually called outside of it when setting up the
+        middleware stack.
+
+        """
+        app = paste.registry.RegistryManager(self.app)
+        for code in self.errors:
+            for accept in ('text/html', 'text/plain'):
+                request = Request.blank(self.error_path,
+                                        headers={'Accept': accept})
+                original = request.get_response(status_map[int(code)]())
+                environ = request.environ
+                del environ['HTTP_ACCEPT']
+                log.debug("Prerendering the error document for %s (%s)",
+                          original.status, accept)
+                cache_key = self.cache_key(environ, original.status,
+                                           original.body)
+                self.render_document(environ, original.status,
+                                     original.headerlist, [original.body],
+                                     cache_key, app)
+
+
+def _shared_document(headers):
+    """Whether an error document sent with ``headers`` may be served to
+    all the users"""
+    for name, value in headers:
+        name = name.lower()
+        if name == 'set-cookie':
+            return False
+        value = value.lower()
+        if name == 'cache-control' and \
+                ('private' in value or 'no-store' in value):
+            return False
+        if name == 'vary' and ('cookie' in value or '*' in value):
+            return False
+    return True
+
+
+class PrefixedIter(object):
+    """Iterates over the chunks already read from an app_iter, then over
+    the rest of it, closing the app_iter when closed"""
+    def __init__(self, chunks, iterator, app_iter):
+        self.chunks = chunks
+        self.iterator = iterator
+        self.app_iter = app_iter
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.chunks:
+            return self.chunks.pop(0)
+        return self.iterator.next()
+
+    def close(self):
+        if hasattr(self.app_iter, 'close'):
+            self.app_iter.close()
+
+
+class RegistryIter(object):
+    """Iterates over an app_iter with the registry of its request still
+    set up, cleaning it up when closed (as ``RegistryManager`` does
+    with ``streaming=True``)"""
+    def __init__(self, app_iter, registry):
+        self.app_iter = app_iter
+        self.iterator = iter(app_iter)
+        self.registry = registry
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self.iterator.next()
+
+    def close(self):
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            self.registry.cleanup()
+
+
+class StaticRegistryStack(object):
+    """The standard Pylons middleware stack, with the registry and the
+    static files cascade handled in a single call
+
+    Builds the stack of a project's :file:`config/middleware.py`::
+
+        app = RoutesMiddleware(app, config['routes.map'], singleton=False)
+        app = SessionMiddleware(app, config)
+        app = ErrorHandler(app, global_conf, **config['pylons.errorware'])
+        app = StatusCodeRedirect(app, errors)
+        app = RegistryManager(app)
+        app = Cascade([StaticURLParser(static_files_dir), app])
+
+    The routing, session and error handling middleware are the regular
+    ones, nested as above, each part toggled with a flag. Only the two
+    outermost layers are replaced: the static files directory is only
+    looked up when the requested file exists (the Cascade would fall
+    through on its 404 otherwise), the request body isn't copied, and
+    the registry is set up without a separate middleware call, being
+    kept until a streamed response is closed.
+
+    Example usage in :file:`config/middleware.py`::
+
+        app = PylonsApp(config=config)
+        app = StaticRegistryStack(app, config, global_conf,
+                                  full_stack=full_stack,
+                                  static_files=static_files)
+
+    ``routes``
+        Whether or not to match the request with ``config['routes.map']``
+        (as ``RoutesMiddleware``, with ``singleton=False``).
+    ``use_method_override``
+        Whether or not a ``_method`` query string or form parameter
+        overrides the request method when routing.
+    ``session``
+        Whether or not to setup the Beaker session (as
+        ``SessionMiddleware``).
+    ``full_stack``
+        Whether or not this application handles its own exceptions and
+        errors. Sets the default for ``error_handler`` and
+        ``status_code_redirect``.
+    ``error_handler``
+        Whether or not Python exceptions are handled (as
+        :func:`ErrorHandler`).
+    ``status_code_redirect``
+        Whether or not error documents are displayed (as
+        :class:`StatusCodeRedirect`).
+    ``errors``
+        The status codes to display error documents for. Defaults to
+        400, 401, 403 and 404, and 500 as well when debug is disabled.
+    ``error_document_ttl``, ``error_document_vary``, ``prerender_error_documents``
+        Error documents caching options, passed to
+        :class:`StatusCodeRedirect` as ``cache_ttl``, ``cache_vary``
+        and ``prerender``.
+    ``registry``
+        Whether or not to establish the ``paste.registry`` (as
+        ``RegistryManager``).
+    ``static_files``
+        Whether or not to serve the static files in
+        ``config['pylons.paths']['static_files']`` (as a ``Cascade``
+        with ``StaticURLParser``).
+
+    """
+    def __init__(self, app, config, global_conf=None, routes=True,
+                 use_method_override=True, session=True, full_stack=True,
+                 error_handler=None, status_code_redirect=None, errors=None,
+                 error_document_ttl=None, error_document_vary=(),
+                 prerender_error_documents=False, registry=True,
+                 static_files=True):
+        global_conf = global_conf or {}
+        self.app = app
+        self.config = config
+
+        # Build the handler wrapped by the registry from the inside out
+        handler = app
+        if routes:
+            handler = RoutesMiddleware(handler, config['routes.map'],
+                                       use_method_override=use_method_override,
+                                       singleton=False)
+        if session:
+            handler = SessionMiddleware(handler, config)
+        full_stack = asbool(full_stack)
+        if error_handler is None:
+            error_handler = full_stack
+        if asbool(error_handler):
+            handler = ErrorHandler(handler, global_conf,
+                                   **config['pylons.errorware'])
+        if status_code_redirect is None:
+            status_code_redirect = full_stack
+        if asbool(status_code_redirect):
+            if errors is None:
+                errors = [400, 401, 403, 404]
+                if not asbool(config['debug']):
+                    errors.append(500)
+            handler = StatusCodeRedirect(
+                handler, errors, cache_ttl=error_document_ttl,
+                cache_vary=error_document_vary,
+                prerender=prerender_error_documents)
+        self.handler = handler
+        self.registry = asbool(registry)
+
+        self.static_app = None
+        if asbool(static_files):
+            self.static_dir = os.path.normpath(os.path.abspath(
+                config['pylons.paths']['static_files']))
+            self.static_app = StaticURLParser(self.static_dir)
+
+    def __call__(self, environ, start_response):
+        if self.static_app is not None and self.is_static(environ):
+            app_iter = self.serve_static(environ, start_response)
+            if app_iter is not None:
+                return app_iter
+
+        if not self.registry:
+            return self.handler(environ, start_response)
+
+        registry = environ.setdefault('paste.registry',
+                                      paste.registry.Registry())
+        registry.prepare()
+        # The registry is kept until the response is closed
+        environ['pylons.stream_response'] = True
+        try:
+            app_iter = self.handler(environ, start_response)
+        except:
+            # Save state for EvalException if it's present, unless the
+            # exception is expected
+            if environ.get('paste.evalexception'):
+                expected = tuple(environ.get('paste.expected_exceptions', ()))
+                if not expected or \
+                        not isinstance(sys.exc_info()[1], expected):
+                    paste.registry.restorer.save_registry_state(environ)
+            registry.cleanup()
+            raise
+        if isinstance(app_iter, (list, tuple)):
+            registry.cleanup()
+            return app_iter
+        # The response is streamed, keep the registry until it's sent
+        return RegistryIter(app_iter, registry)
+
+    def is_static(self, environ):
+        """Whether or not the static files app would handle the request
+        rather than respond with a 404"""
+        path_info = environ.get('PATH_INFO', '')
+        if not path_info:
+            # Redirected to add the slash
+            return True
+        if path_info.endswith('/'):
+            path_info += 'index.html'
+        full = os.path.normpath(os.path.join(self.static_dir,
+                                             path_info.lstrip('/')))
+        if full != self.static_dir and \
+                not full.startswith(self.static_dir + os.sep):
+            return False
+        return os.path.exists(full)
+
+    def serve_static(self, environ, start_response):
+        """Call the static files app, returning None when it responds
+        with a 404"""
+        failed = []
+
+        def repl_start_response(status, headers, exc_info=None):
+            if status[:3] == '404':
+                failed.append(None)
+                return lambda s: None
+            return start_response(status, headers, exc_info)
+        app_iter = self.static_app(environ.copy(), repl_start_response)
+        if not failed:
+            return app_iter
+        if hasattr(app_iter, 'close'):
+            list(app_iter)
+            app_iter.close()
+        return None
+
 
 error_document_template = literal("""\
 <!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">
@@ -217,3 +662,32 @@ def debugger_filter_factory(global_conf, **kwargs):
 
 def debugger_filter_app_factory(app, global_conf, **kwargs):
     return DebugHandler(app, global_conf, **kwargs)
+
+
+def warmcache_filter_app_factory(app, global_conf, urls=None,
+                                 concurrency=None):
+    """Warm the caches of ``app`` when it's loaded, returning it as it is
+
+    ``urls`` (see :func:`~pylons.caching.warm_list`) and
+    ``concurrency`` default to the ``pylons.cache_warm_list`` and
+    ``pylons.cache_warm_concurrency`` options of the ``[DEFAULT]``
+    section. The report of the timings is logged::
+
+        [filter-app:warm]
+        use = egg:Pylons#warmcache
+        next = main
+        concurrency = 4
+        urls =
+            /
+            /products?page=1
+
+    """
+    if urls is None:
+        urls = global_conf.get('pylons.cache_warm_list')
+    if concurrency is None:
+        concurrency = global_conf.get('pylons.cache_warm_concurrency', 1)
+    urls = warm_list(urls)
+    if urls:
+        results = warm_cache(app, urls, int(concurrency))
+        log.info("Warmed the caches:\n%s", format_warm_report(results))
+    return app
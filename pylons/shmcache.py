@@ -0,0 +1,410 @@
+"""Shared memory cache backend
+
+The memory backend of Beaker keeps a cache per process, so that with
+several worker processes each of them has to create its own copy of
+every value, while the dbm and file backends open a file and unpickle
+the whole namespace or value on each lookup.
+
+The ``shm`` backend keeps the values of all the namespaces in a single
+memory mapped file, shared by all the processes opening it (such as the
+workers forked from the same master). Select it with
+``beaker.cache.type = shm`` in the config file, or ``type='shm'`` with
+:func:`~pylons.decorators.cache.beaker_cache` and the ``cache_type``
+option of the render functions.
+
+Its layout is fixed when the file is created:
+
+* a header recording the geometry and the number of stripes
+* ``shm_size / shm_slot_size`` slots of ``shm_slot_size`` bytes each,
+  grouped in sets of ``shm_ways`` slots. A key is hashed to a set, and
+  stored in the first free slot of the set, or in place of an expired
+  value, or else of the least recently used value of the set.
+
+Expired values are still returned until they're replaced, as Beaker
+checks the expiration itself, and may serve the previous value while a
+new one is created.
+
+Each slot holds a value: the key along with the pickled value, which
+must fit in the slot. Larger values aren't stored (a warning is logged
+the first time for the namespace), so the slot size should be picked
+according to the values cached, or the values should be kept small (see
+:class:`~pylons.caching.ValueCodec`).
+
+Sets are protected by ``shm_stripes`` locks, each lock being made of a
+thread lock and a ``fcntl`` lock on a byte of the file, so that
+lookups of keys in different stripes don't wait for each other.
+
+Options (set as ``beaker.cache.<option>`` in the config file, or passed
+to :meth:`~beaker.cache.CacheManager.get_cache`):
+
+``data_dir``
+    The file is ``container_shm/cache.shm`` in this directory, unless
+    ``shm_file`` is given. Creation locks are kept in
+    ``container_shm_lock`` unless ``lock_dir`` is given.
+``shm_file``
+    Path of the memory mapped file, which is better kept on a memory
+    file system such as ``/dev/shm``.
+``shm_size``
+    Size in bytes of the slots, defaults to 32MB.
+``shm_slot_size``
+    Size in bytes of a slot, defaults to 8KB.
+``shm_ways``
+    Number of slots per set, defaults to 8.
+``shm_stripes``
+    Number of locks, defaults to 64. It's recorded in the file when
+    it's created: the processes opening an existing file use its number
+    of locks.
+
+When the file already exists with a different geometry (``shm_size``,
+``shm_slot_size`` or ``shm_ways``), it's left untouched for the
+processes still using it, and the file suffixed with the new geometry
+(as in ``cache.shm.512x8x8192``) is used instead, with a warning.
+``scripts/bench-shm.py`` compares the backend with the memory and dbm
+backends.
+
+"""
+import cPickle
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from hashlib import md5
+
+from beaker.container import NamespaceManager
+from beaker.exceptions import MissingCacheParameter
+from beaker.synchronization import file_synchronizer
+from beaker.util import verify_directory
+
+__all__ = ['SharedMemoryCache', 'SharedMemoryNamespaceManager',
+           'get_shared_cache']
+
+log = logging.getLogger(__name__)
+
+# magic, version, number of sets, ways, slot size, stripes
+HEADER = struct.Struct('!4sIIIII')
+HEADER_SIZE = 64
+MAGIC = 'PSHM'
+VERSION = 2
+
+# key digest, expiration time, last access time, key length, value length
+SLOT = struct.Struct('!8sddII')
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class SharedMemoryCache(object):
+    """Memory mapped file of fixed size slots shared by processes
+
+    Keys and values are strings. See :mod:`pylons.shmcache` for the
+    layout and the meaning of the arguments.
+
+    """
+    def __init__(self, path, size=32 * 1024 * 1024, slot_size=8192, ways=8,
+                 stripes=64):
+        self.slot_size = slot_size
+        self.ways = ways
+        self.sets = max(size // (slot_size * ways), 1)
+        self.size = HEADER_SIZE + self.sets * ways * slot_size
+        stripes = min(stripes, self.sets)
+
+        opened = self._open(path, stripes)
+        if opened is None:
+            # The file is still mapped by the processes using it, use
+            # one of this geometry instead of resetting it
+            geometry_path = '%s.%dx%dx%d' % (path, self.sets, ways,
+                                             slot_size)
+            log.warning("Shared memory cache %s has a different geometry, "
+                        "using %s", path, geometry_path)
+            path = geometry_path
+            opened = self._open(path, stripes)
+            if opened is None:
+                raise ValueError("Shared memory cache %s has a different "
+                                 "geometry" % path)
+        self.path = path
+        self.fd, self.stripes, self.map = opened
+        self._thread_locks = [threading.Lock()
+                              for i in range(self.stripes)]
+
+    def _open(self, path, stripes):
+        """Open and map the file at ``path``, initializing it when it's
+        new. Returns its descriptor, stripe count and map, or None when
+        it has a different geometry"""
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0600)
+        # Byte 0 of the file guards its initialization
+        fcntl.lockf(fd, fcntl.LOCK_EX, 1, 0)
+        try:
+            header = os.read(fd, HEADER.size)
+            if not header.strip('\0'):
+                log.debug("Initializing shared memory cache: %s", path)
+                os.ftruncate(fd, self.size)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, HEADER.pack(MAGIC, VERSION, self.sets,
+                                         self.ways, self.slot_size, stripes))
+            elif len(header) != HEADER.size or \
+                    os.fstat(fd).st_size != self.size or \
+                    HEADER.unpack(header)[:5] != (MAGIC, VERSION, self.sets,
+                                                  self.ways, self.slot_size):
+                os.close(fd)
+                return None
+            else:
+                # The processes sharing the file must lock the same bytes
+                stripes = HEADER.unpack(header)[5]
+            cache_map = mmap.mmap(fd, self.size, mmap.MAP_SHARED,
+                                  mmap.PROT_READ | mmap.PROT_WRITE)
+        except:
+            os.close(fd)
+            raise
+        fcntl.lockf(fd, fcntl.LOCK_UN, 1, 0)
+        return fd, stripes, cache_map
+
+    def _locate(self, key):
+        """Return the digest of ``key``, and the offset of its set and
+        its stripe"""
+        digest = md5(key).digest()[:8]
+        index = struct.unpack('!Q', digest)[0] % self.sets
+        offset = HEADER_SIZE + index * self.ways * self.slot_size
+        return digest, offset, index % self.stripes
+
+    def _lock(self, stripe):
+        self._thread_locks[stripe].acquire()
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, stripe + 1)
+
+    def _unlock(self, stripe):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, stripe + 1)
+        self._thread_locks[stripe].release()
+
+    def _find(self, key, digest, offset):
+        """Return the offset and header of the slot holding ``key`` in
+        the set at ``offset``, or None"""
+        buf = self.map
+        for way in xrange(self.ways):
+            slot = offset + way * self.slot_size
+            header = SLOT.unpack_from(buf, slot)
+            if header[3] and header[0] == digest and \
+                    buf[slot + SLOT.size:slot + SLOT.size + header[3]] == key:
+                return slot, header
+        return None, None
+
+    def get(self, key):
+        """Return the value of ``key``, raising KeyError when it's
+        missing"""
+        digest, offset, stripe = self._locate(key)
+        self._lock(stripe)
+        try:
+            slot, header = self._find(key, digest, offset)
+            if slot is None:
+                raise KeyError(key)
+            key_length, value_length = header[3], header[4]
+            # Mark as the most recently used
+            SLOT.pack_into(self.map, slot, digest, header[1], time.time(),
+                           key_length, value_length)
+            start = slot + SLOT.size + key_length
+            return self.map[start:start + value_length]
+        finally:
+            self._unlock(stripe)
+
+    def __contains__(self, key):
+        digest, offset, stripe = self._locate(key)
+        self._lock(stripe)
+        try:
+            return self._find(key, digest, offset)[0] is not None
+        finally:
+            self._unlock(stripe)
+
+    def set(self, key, value, expires=0):
+        """Store the ``value`` of ``key``, expiring at the ``expires``
+        time (0 for never). Returns False when the value is too large to
+        be stored"""
+        digest, offset, stripe = self._locate(key)
+        fits = SLOT.size + len(key) + len(value) <= self.slot_size
+        now = time.time()
+        self._lock(stripe)
+        try:
+            slot = self._find(key, digest, offset)[0]
+            if not fits:
+                if slot is not None:
+                    self._clear(slot)
+                return False
+            if slot is None:
+                slot = self._victim(offset, now)
+            SLOT.pack_into(self.map, slot, digest, expires, now, len(key),
+                           len(value))
+            start = slot + SLOT.size
+            self.map[start:start + len(key) + len(value)] = key + value
+            return True
+        finally:
+            self._unlock(stripe)
+
+    def _victim(self, offset, now):
+        """Return the slot to use for a new key in the set at
+        ``offset``: a free slot, else an expired one, else the least
+        recently used"""
+        buf = self.map
+        victim = None
+        oldest = None
+        for way in xrange(self.ways):
+            slot = offset + way * self.slot_size
+            header = SLOT.unpack_from(buf, slot)
+            if not header[3]:
+                return slot
+            if header[1] and header[1] <= now:
+                victim, oldest = slot, -1
+            elif oldest is None or 0 <= header[2] < oldest:
+                victim, oldest = slot, header[2]
+        return victim
+
+    def _clear(self, slot):
+        SLOT.pack_into(self.map, slot, '\0' * 8, 0, 0, 0, 0)
+
+    def delete(self, key):
+        """Remove ``key``, returning whether it was stored"""
+        digest, offset, stripe = self._locate(key)
+        self._lock(stripe)
+        try:
+            slot = self._find(key, digest, offset)[0]
+            if slot is None:
+                return False
+            self._clear(slot)
+            return True
+        finally:
+            self._unlock(stripe)
+
+    def keys(self, prefix='', remove=False):
+        """Return the keys starting with ``prefix``, removing them when
+        ``remove`` is True"""
+        keys = []
+        buf = self.map
+        for index in xrange(self.sets):
+            stripe = index % self.stripes
+            offset = HEADER_SIZE + index * self.ways * self.slot_size
+            self._lock(stripe)
+            try:
+                for way in xrange(self.ways):
+                    slot = offset + way * self.slot_size
+                    key_length = SLOT.unpack_from(buf, slot)[3]
+                    if not key_length:
+                        continue
+                    key = buf[slot + SLOT.size:slot + SLOT.size + key_length]
+                    if key.startswith(prefix):
+                        keys.append(key)
+                        if remove:
+                            self._clear(slot)
+            finally:
+                self._unlock(stripe)
+        return keys
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+def get_shared_cache(path, **kwargs):
+    """Return the :class:`SharedMemoryCache` of the file at ``path``
+    opened by this process, opening it first if needed"""
+    try:
+        return _caches[path]
+    except KeyError:
+        pass
+    _caches_lock.acquire()
+    try:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = SharedMemoryCache(path, **kwargs)
+        return cache
+    finally:
+        _caches_lock.release()
+
+
+class SharedMemoryNamespaceManager(NamespaceManager):
+    """Beaker namespace manager storing its values in a
+    :class:`SharedMemoryCache`
+
+    Registered as the ``shm`` cache type. See :mod:`pylons.shmcache`
+    for the options.
+
+    """
+    def __init__(self, namespace, data_dir=None, lock_dir=None,
+                 shm_file=None, shm_size=32 * 1024 * 1024, shm_slot_size=8192,
+                 shm_ways=8, shm_stripes=64, **kwargs):
+        NamespaceManager.__init__(self, namespace)
+        if isinstance(namespace, unicode):
+            namespace = namespace.encode('utf-8')
+        self.prefix = namespace + '\0'
+
+        if not shm_file:
+            if not data_dir:
+                raise MissingCacheParameter("data_dir or shm_file is "
+                                            "required")
+            verify_directory(data_dir + '/container_shm')
+            shm_file = data_dir + '/container_shm/cache.shm'
+        if lock_dir:
+            self.lock_dir = lock_dir
+        elif data_dir:
+            self.lock_dir = data_dir + '/container_shm_lock'
+        else:
+            self.lock_dir = os.path.dirname(os.path.abspath(shm_file))
+        verify_directory(self.lock_dir)
+
+        self.cache = get_shared_cache(
+            shm_file, size=int(shm_size), slot_size=int(shm_slot_size),
+            ways=int(shm_ways), stripes=int(shm_stripes))
+        self._warned = False
+
+    def get_creation_lock(self, key):
+        return file_synchronizer(
+            identifier="shmcontainer/funclock/%s/%s" % (self.namespace, key),
+            lock_dir=self.lock_dir)
+
+    def _key(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return self.prefix + key
+
+    def __getitem__(self, key):
+        data = self.cache.get(self._key(key))
+        try:
+            return cPickle.loads(data)
+        except Exception:
+            # Written by a process that died while writing it
+            log.warning("Dropping unreadable value from the shared memory "
+                        "cache (namespace: %s)", self.namespace)
+            del self[key]
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._key(key) in self.cache
+
+    def has_key(self, key):
+        return self._key(key) in self.cache
+
+    def set_value(self, key, value, expiretime=None):
+        expires = 0
+        # Beaker stores (storedtime, expiretime, value)
+        if isinstance(value, tuple) and len(value) == 3 and value[1]:
+            expires = value[0] + value[1]
+        if expiretime:
+            expires = time.time() + expiretime
+        data = cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+        if not self.cache.set(self._key(key), data, expires) and \
+                not self._warned:
+            self._warned = True
+            log.warning("Value of %d bytes too large to be stored in the "
+                        "shared memory cache (namespace: %s), consider "
+                        "raising shm_slot_size", len(data), self.namespace)
+
+    def __setitem__(self, key, value):
+        self.set_value(key, value)
+
+    def __delitem__(self, key):
+        self.cache.delete(self._key(key))
+
+    def do_remove(self):
+        self.cache.keys(self.prefix, remove=True)
+
+    def keys(self):
+        start = len(self.prefix)
+        return [key[start:] for key in self.cache.keys(self.prefix)]
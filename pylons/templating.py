@@ -93,6 +93,41 @@ The template engine is created in the projects
 instance. Configuration options can be directly passed into the
 template engine, and are used by the render functions.
 
+Streaming templates
+-------------------
+
+:func:`stream_jinja2` and :func:`stream_genshi` return generators
+rendering the template as the response is sent, rather than the whole
+page: an action returning one has its response sent as it's produced
+(see :class:`~pylons.controllers.core.WSGIController`). The output is
+grouped in chunks of about ``pylons.stream_chunk_size`` characters
+(8192 by default), each encoded to the charset of the response.
+
+Mako can't suspend a template while it renders: :func:`stream_mako`
+renders it in a separate thread, which hands the chunks over as they're
+flushed and waits for them to be sent before going further.
+
+Rendering fragments concurrently
+--------------------------------
+
+Pages made of independent parts, each slow to render, can render them
+with :func:`render_mako_fragments`: the parts found in the cache are
+served first, and the others are rendered concurrently by a bounded
+number of threads, so that the page takes about as long as its slowest
+part rather than the sum of all of them.
+
+Precompiling templates
+----------------------
+
+Mako compiles each template to a module (in the ``module_directory``
+of the lookup) the first time it's rendered, and Jinja2 compiles them
+to bytecode, kept in the ``bytecode_cache`` of the environment when it
+has one. :func:`compile_templates` compiles all the templates up front,
+which is done by the ``paster compiletemplates`` command, or when the
+application is created if the ``pylons.compile_templates`` option is
+enabled. When ``debug`` is disabled, the lookups then stop checking
+the template files for changes.
+
 .. warning::
 
     Don't change the variable name on :data:`app_globals` that the
@@ -102,12 +137,21 @@ template engine, and are used by the render functions.
 
 """
 import logging
+import os
+import Queue
+import sys
+import threading
+import time
 
 from webhelpers.html import literal
 
 import pylons
+from pylons.caching import apply_local_tier, get_cache_stats
+from pylons.context import bind_context, get_pylons_context
 
-__all__ = ['render_genshi', 'render_jinja2', 'render_mako']
+__all__ = ['compile_templates', 'render_genshi', 'render_jinja2',
+           'render_mako', 'render_mako_fragments', 'stream_genshi',
+           'stream_jinja2', 'stream_mako']
 
 PYLONS_VARS = ['c', 'app_globals', 'config', 'h', 'render', 'request',
                'session', 'translator', 'ungettext', '_', 'N_']
@@ -129,7 +173,70 @@ def pylons_globals():
     If SessionMiddleware is being used, ``session`` will also be
     available in the template namespace.
 
+    The dictionary is built once per request and kept on the request's
+    :class:`~pylons.context.PylonsContext`, this returns a copy of it.
+
+    """
+    pylons_obj = get_pylons_context()
+    if pylons_obj is None:
+        return _proxied_globals()
+    return _context_globals(pylons_obj).copy()
+
+
+def _context_globals(pylons_obj):
+    """Return the :func:`pylons_globals` dict of the request of
+    ``pylons_obj``, shared by the templates rendered during the request
+    (so it must not be modified)
+
+    It's built again when the translator or the response were replaced
+    since, as :func:`~pylons.i18n.translation.set_lang` does.
+
     """
+    translator = pylons_obj.translator
+    response = pylons_obj.response
+    pylons_vars = pylons_obj.__dict__.get('_template_globals')
+    if pylons_vars is not None and \
+            pylons_vars['translator'] is translator and \
+            pylons_vars['response'] is response:
+        return pylons_vars
+
+    conf = pylons_obj.config
+    c = pylons_obj.tmpl_context
+    request = pylons_obj.request
+    pylons_vars = dict(
+        c=c,
+        tmpl_context=c,
+        config=conf,
+        app_globals=conf.get('pylons.app_globals'),
+        h=conf.get('pylons.h'),
+        request=request,
+        response=response,
+        url=getattr(pylons_obj, 'url', None),
+        translator=translator,
+        ungettext=pylons.i18n.ungettext,
+        _=pylons.i18n._,
+        N_=pylons.i18n.N_
+    )
+
+    # If the session was overriden to be None, don't populate the session
+    # var
+    environ = request.environ
+    econf = conf['pylons.environ_config']
+    if 'beaker.session' in environ or \
+        ('session' in econf and econf['session'] in environ):
+        session = getattr(pylons_obj, 'session', None)
+        if session is None:
+            session = pylons.session._current_obj()
+        pylons_vars['session'] = session
+    log.debug("Created render namespace with pylons vars: %s", pylons_vars)
+    pylons_obj._template_globals = pylons_vars
+    return pylons_vars
+
+
+def _proxied_globals():
+    """Create the :func:`pylons_globals` dict through the Pylons
+    globals, for use when there's no
+    :class:`~pylons.context.PylonsContext` for the current request"""
     conf = pylons.config._current_obj()
     c = pylons.tmpl_context._current_obj()
     app_globals = conf.get('pylons.app_globals')
@@ -158,6 +265,38 @@ def pylons_globals():
     return pylons_vars
 
 
+def _template_globals(extra_vars):
+    """Return the namespace to render a template with: the Pylons
+    globals, merged with the ``extra_vars`` dict (which isn't modified)
+    when given. The namespace returned must not be modified"""
+    pylons_obj = get_pylons_context()
+    if pylons_obj is None:
+        pylons_vars = _proxied_globals()
+    else:
+        pylons_vars = _context_globals(pylons_obj)
+    if extra_vars:
+        return dict(extra_vars, **pylons_vars)
+    return pylons_vars
+
+
+def _response_charset():
+    """Return the charset the current response is encoded to"""
+    pylons_obj = get_pylons_context()
+    if pylons_obj is None:
+        response = pylons.response._current_obj()
+    else:
+        response = pylons_obj.response
+    return response.charset or 'utf-8'
+
+
+def _charset_options(charset):
+    """Return the :func:`cached_template` options caching the renderings
+    encoded to ``charset`` in a namespace of their own"""
+    if charset:
+        return dict(ns_options=('charset',), charset=charset)
+    return {}
+
+
 def cached_template(template_name, render_func, ns_options=(),
                     cache_key=None, cache_type=None, cache_expire=None,
                     **kwargs):
@@ -197,51 +336,113 @@ def cached_template(template_name, render_func, ns_options=(),
     ``cache_expire='never'`` which will cache the template forever
     seconds with no key.
 
+    An in-process tier is put in front of the cache backend when
+    ``pylons.cache_local_ttl`` is set (see :mod:`pylons.caching`). The
+    lookups are counted in the statistics of the namespace (see
+    :func:`~pylons.caching.get_cache_stats`).
+
     """
-    # If one of them is not None then the user did set something
-    if cache_key is not None or cache_expire is not None or cache_type \
-        is not None:
-
-        if not cache_type:
-            cache_type = 'dbm'
-        if not cache_key:
-            cache_key = 'default'
-        if cache_expire == 'never':
-            cache_expire = None
+    options = _cache_options(cache_key, cache_type, cache_expire)
+    if options is not None:
         namespace = template_name
         for name in ns_options:
             namespace += str(kwargs.get(name))
-        cache = pylons.cache.get_cache(namespace, type=cache_type)
-        content = cache.get_value(cache_key, createfunc=render_func,
-            expiretime=cache_expire)
-        return content
+        return _cached_render(namespace, render_func, options)
     else:
         return render_func()
 
 
+def _cached_render(namespace, render_func, options, cache_manager=None):
+    """Return the value cached for the ``(cache_key, cache_type,
+    cache_expire)`` ``options`` in ``namespace``, calling
+    ``render_func`` to create it when needed"""
+    cache_key, cache_type, cache_expire = options
+    cache = _template_cache(namespace, cache_type, cache_manager)
+    stats = get_cache_stats(namespace)
+    created = []
+
+    def create():
+        start = time.time()
+        content = render_func()
+        stats.regenerated(time.time() - start, content)
+        created.append(True)
+        return content
+
+    content = cache.get_value(cache_key, createfunc=create,
+        expiretime=cache_expire)
+    if created:
+        stats.misses += 1
+    else:
+        stats.hits += 1
+    return content
+
+
+def _cache_options(cache_key=None, cache_type=None, cache_expire=None):
+    """Return the ``(cache_key, cache_type, cache_expire)`` to cache a
+    template with, or None when it isn't cached"""
+    # If one of them is not None then the user did set something
+    if cache_key is None and cache_expire is None and cache_type is None:
+        return None
+    if not cache_type:
+        cache_type = 'dbm'
+    if not cache_key:
+        cache_key = 'default'
+    if cache_expire == 'never':
+        cache_expire = None
+    return cache_key, cache_type, cache_expire
+
+
+def _template_cache(namespace, cache_type, cache_manager=None):
+    if cache_manager is None:
+        cache_manager = pylons.cache
+    return apply_local_tier(
+        cache_manager.get_cache(namespace, type=cache_type), pylons.config)
+
+
+def _context_cache(context):
+    """Return the cache manager of the request ``context``
+
+    Without the Beaker cache middleware, the registry has the one of
+    ``app_globals`` but it isn't set on the context.
+
+    """
+    if context is None:
+        return pylons.cache._current_obj()
+    try:
+        return context.cache
+    except AttributeError:
+        return context.app_globals.cache
+
+
 def render_mako(template_name, extra_vars=None, cache_key=None,
-                cache_type=None, cache_expire=None):
+                cache_type=None, cache_expire=None, as_bytes=False):
     """Render a template with Mako
 
     Accepts the cache options ``cache_key``, ``cache_type``, and
     ``cache_expire``.
 
+    With ``as_bytes``, the result is a string encoded to the charset of
+    the response rather than a unicode literal, which the controller
+    writes to the response as it is.
+
     """
+    charset = as_bytes and _response_charset()
+
     # Create a render callable for the cache function
     def render_template():
-        # Pull in extra vars if needed
-        globs = extra_vars or {}
-
-        # Second, get the globals
-        globs.update(pylons_globals())
+        # The globals, along with the extra vars if needed
+        globs = _template_globals(extra_vars)
 
         # Grab a template reference
         template = globs['app_globals'].mako_lookup.get_template(template_name)
 
+        if charset:
+            return template.render_unicode(**globs).encode(charset)
         return literal(template.render_unicode(**globs))
 
     return cached_template(template_name, render_template, cache_key=cache_key,
-                           cache_type=cache_type, cache_expire=cache_expire)
+                           cache_type=cache_type, cache_expire=cache_expire,
+                           **_charset_options(charset))
 
 
 def render_mako_def(template_name, def_name, cache_key=None,
@@ -262,73 +463,428 @@ def render_mako_def(template_name, def_name, cache_key=None,
     ``cache_expire``.
 
     """
+    render_template = _mako_def_renderer(template_name, def_name, kwargs)
+    return cached_template(template_name, render_template, cache_key=cache_key,
+                           cache_type=cache_type, cache_expire=cache_expire)
+
+
+def _mako_def_renderer(template_name, def_name, kwargs):
     # Create a render callable for the cache function
     def render_template():
-        # Pull in extra vars if needed
-        globs = kwargs or {}
-
-        # Second, get the globals
-        globs.update(pylons_globals())
+        # The globals, along with the extra vars if needed
+        globs = _template_globals(kwargs)
 
         # Grab a template reference
         template = globs['app_globals'].mako_lookup.get_template(
             template_name).get_def(def_name)
 
         return literal(template.render_unicode(**globs))
+    return render_template
 
-    return cached_template(template_name, render_template, cache_key=cache_key,
-                           cache_type=cache_type, cache_expire=cache_expire)
+
+def render_mako_fragments(fragments, max_workers=None):
+    """Render def blocks within Mako templates concurrently, returning
+    their output in order
+
+    ``fragments`` is a list of ``(template_name, def_name, kwargs,
+    cache_options)`` tuples: ``kwargs`` are the arguments of the def,
+    and ``cache_options`` a dict of the cache options of
+    :func:`render_mako_def` (``cache_key``, ``cache_type`` and
+    ``cache_expire``), or None.
+
+    Example::
+
+        widgets = render_mako_fragments([
+            ('widgets.mako', 'news', dict(limit=5),
+             dict(cache_key='news', cache_expire=60)),
+            ('widgets.mako', 'inbox', dict(user=c.user), None)])
+
+    The cached fragments are looked up first, in a single pass over
+    each cache namespace. The others are rendered (and cached) by up to
+    ``max_workers`` threads, defaulting to the
+    ``pylons.fragment_workers`` option or 4, with the request's
+    :class:`~pylons.context.PylonsContext` bound so that the Pylons
+    globals can be used in the templates. An exception raised rendering
+    a fragment is raised again once they're all done.
+
+    """
+    context = get_pylons_context()
+    results = [None] * len(fragments)
+    options = [_cache_options(**(fragment[3] or {}))
+               for fragment in fragments]
+    pending = []
+    lookups = {}
+    for index, fragment in enumerate(fragments):
+        if options[index] is None:
+            pending.append(index)
+        else:
+            cache_key, cache_type, cache_expire = options[index]
+            lookups.setdefault((fragment[0], cache_type), []).append(
+                (index, cache_key, cache_expire))
+
+    # Resolved here as the worker threads have no registry
+    cache_manager = None
+    if lookups:
+        cache_manager = _context_cache(context)
+    for (namespace, cache_type), keys in lookups.iteritems():
+        cache = _template_cache(namespace, cache_type, cache_manager)
+        stats = get_cache_stats(namespace)
+        cache.namespace.acquire_read_lock()
+        try:
+            for index, cache_key, cache_expire in keys:
+                try:
+                    results[index] = cache.get_value(cache_key,
+                                                     expiretime=cache_expire)
+                except KeyError:
+                    pending.append(index)
+                else:
+                    stats.hits += 1
+        finally:
+            cache.namespace.release_read_lock()
+    if not pending:
+        return results
+
+    # Build the template globals once, rather than in each thread
+    if context is not None:
+        _context_globals(context)
+    queue = Queue.Queue()
+    for index in sorted(pending):
+        queue.put(index)
+    errors = []
+
+    def worker():
+        previous = bind_context(context)
+        try:
+            while True:
+                try:
+                    index = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                template_name, def_name, kwargs = fragments[index][:3]
+                render = _mako_def_renderer(template_name, def_name,
+                                            kwargs or {})
+                try:
+                    if options[index] is None:
+                        results[index] = render()
+                    else:
+                        results[index] = _cached_render(
+                            template_name, render, options[index],
+                            cache_manager)
+                except Exception:
+                    errors.append((index, sys.exc_info()))
+        finally:
+            bind_context(previous)
+
+    if max_workers is None:
+        max_workers = pylons.config.get('pylons.fragment_workers', 4)
+    max_workers = min(int(max_workers), len(pending))
+    if max_workers <= 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=worker)
+                   for i in range(max_workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    if errors:
+        exc_info = min(errors, key=lambda error: error[0])[1]
+        raise exc_info[0], exc_info[1], exc_info[2]
+    return results
 
 
 def render_genshi(template_name, extra_vars=None, cache_key=None,
-                  cache_type=None, cache_expire=None, method='xhtml'):
+                  cache_type=None, cache_expire=None, method='xhtml',
+                  as_bytes=False):
     """Render a template with Genshi
 
     Accepts the cache options ``cache_key``, ``cache_type``, and
     ``cache_expire`` in addition to method which are passed to Genshi's
     render function.
 
+    With ``as_bytes``, the result is a string encoded to the charset of
+    the response rather than a unicode literal, Genshi encoding the
+    output as it's serialized.
+
     """
+    charset = as_bytes and _response_charset()
+
     # Create a render callable for the cache function
     def render_template():
-        # Pull in extra vars if needed
-        globs = extra_vars or {}
-
-        # Second, get the globals
-        globs.update(pylons_globals())
+        # The globals, along with the extra vars if needed
+        globs = _template_globals(extra_vars)
 
         # Grab a template reference
         template = globs['app_globals'].genshi_loader.load(template_name)
 
+        if charset:
+            return template.generate(**globs).render(method=method,
+                                                     encoding=charset)
         return literal(template.generate(**globs).render(method=method,
                                                          encoding=None))
 
+    options = dict(ns_options=('method'), method=method)
+    if charset:
+        options.update(ns_options=('method', 'charset'), charset=charset)
     return cached_template(template_name, render_template, cache_key=cache_key,
                            cache_type=cache_type, cache_expire=cache_expire,
-                           ns_options=('method'), method=method)
+                           **options)
 
 
 def render_jinja2(template_name, extra_vars=None, cache_key=None,
-                 cache_type=None, cache_expire=None):
+                 cache_type=None, cache_expire=None, as_bytes=False):
     """Render a template with Jinja2
 
     Accepts the cache options ``cache_key``, ``cache_type``, and
     ``cache_expire``.
 
+    With ``as_bytes``, the result is a string encoded to the charset of
+    the response rather than a unicode literal, which the controller
+    writes to the response as it is.
+
     """
+    charset = as_bytes and _response_charset()
+
     # Create a render callable for the cache function
     def render_template():
-        # Pull in extra vars if needed
-        globs = extra_vars or {}
-
-        # Second, get the globals
-        globs.update(pylons_globals())
+        # The globals, along with the extra vars if needed
+        globs = _template_globals(extra_vars)
 
         # Grab a template reference
         template = \
             globs['app_globals'].jinja2_env.get_template(template_name)
 
+        if charset:
+            return template.render(**globs).encode(charset)
         return literal(template.render(**globs))
 
     return cached_template(template_name, render_template, cache_key=cache_key,
-                           cache_type=cache_type, cache_expire=cache_expire)
+                           cache_type=cache_type, cache_expire=cache_expire,
+                           **_charset_options(charset))
+
+
+def stream_mako(template_name, extra_vars=None, chunk_size=None):
+    """Render a template with Mako as it's iterated over
+
+    Returns a generator of chunks of about ``chunk_size`` characters
+    (defaulting to the ``pylons.stream_chunk_size`` option or 8192) of
+    the output, encoded to the charset of the response.
+
+    The template is rendered by a separate thread, with the request's
+    :class:`~pylons.context.PylonsContext` bound, which waits for a
+    chunk to be sent before rendering further than the next one.
+    Closing the generator stops the rendering.
+
+    """
+    globs = _template_globals(extra_vars)
+    template = globs['app_globals'].mako_lookup.get_template(template_name)
+    writer = _ChunkWriter(_response_charset(), _chunk_size(chunk_size))
+    return _stream_mako(template, globs, writer, get_pylons_context())
+
+
+def _stream_mako(template, globs, writer, context):
+    from mako.runtime import Context
+
+    def render():
+        previous = bind_context(context)
+        try:
+            try:
+                template.render_context(Context(writer, **globs), **globs)
+                writer.flush()
+            except _StreamClosed:
+                return
+            except Exception:
+                writer.queue.put(sys.exc_info())
+                return
+            writer.queue.put(None)
+        finally:
+            bind_context(previous)
+
+    thread = threading.Thread(target=render)
+    thread.setDaemon(True)
+    thread.start()
+    try:
+        while True:
+            chunk = writer.queue.get()
+            if chunk is None:
+                break
+            elif isinstance(chunk, tuple):
+                raise chunk[0], chunk[1], chunk[2]
+            writer.room.release()
+            yield chunk
+    finally:
+        writer.close()
+
+
+def stream_genshi(template_name, extra_vars=None, method='xhtml',
+                  chunk_size=None):
+    """Render a template with Genshi as it's iterated over
+
+    Returns a generator of chunks of about ``chunk_size`` characters
+    (defaulting to the ``pylons.stream_chunk_size`` option or 8192) of
+    the serialized output, encoded to the charset of the response.
+
+    """
+    globs = _template_globals(extra_vars)
+    template = globs['app_globals'].genshi_loader.load(template_name)
+    return _group_chunks(template.generate(**globs).serialize(method=method),
+                         _response_charset(), _chunk_size(chunk_size))
+
+
+def stream_jinja2(template_name, extra_vars=None, chunk_size=None):
+    """Render a template with Jinja2 as it's iterated over
+
+    Returns a generator of chunks of about ``chunk_size`` characters
+    (defaulting to the ``pylons.stream_chunk_size`` option or 8192) of
+    the output, encoded to the charset of the response.
+
+    """
+    globs = _template_globals(extra_vars)
+    template = globs['app_globals'].jinja2_env.get_template(template_name)
+    return _group_chunks(template.generate(**globs), _response_charset(),
+                         _chunk_size(chunk_size))
+
+
+def _chunk_size(chunk_size):
+    if chunk_size is None:
+        chunk_size = pylons.config.get('pylons.stream_chunk_size', 8192)
+    return int(chunk_size)
+
+
+def _group_chunks(iterable, charset, chunk_size):
+    """Join the strings of ``iterable`` into chunks of at least
+    ``chunk_size`` characters (but the last), encoded to ``charset``"""
+    data = []
+    size = 0
+    for text in iterable:
+        data.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            yield u''.join(data).encode(charset)
+            data = []
+            size = 0
+    if data:
+        yield u''.join(data).encode(charset)
+
+
+class _StreamClosed(Exception):
+    """Raised in the thread rendering a template for :func:`stream_mako`
+    once the generator of its output is closed"""
+
+
+class _ChunkWriter(object):
+    """Buffer of a Mako context, grouping the output into encoded
+    chunks put in its :attr:`queue`
+
+    At most one chunk is queued besides the one being sent, :meth:`flush`
+    waiting for :attr:`room` until the previous one is taken.
+
+    """
+    def __init__(self, charset, chunk_size):
+        self.charset = charset
+        self.chunk_size = chunk_size
+        self.queue = Queue.Queue()
+        self.room = threading.Semaphore(1)
+        self.closed = False
+        self._data = []
+        self._size = 0
+
+    def write(self, text):
+        self._data.append(text)
+        self._size += len(text)
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._data:
+            self.room.acquire()
+            if self.closed:
+                raise _StreamClosed()
+            self.queue.put(u''.join(self._data).encode(self.charset))
+            self._data = []
+            self._size = 0
+
+    def close(self):
+        """Stop the rendering at the next :meth:`flush`, waking up a
+        waiting one"""
+        self.closed = True
+        self.room.release()
+
+
+def compile_templates(config, filesystem_checks=True):
+    """Compile the Mako and Jinja2 templates of the application
+
+    Every file in the ``pylons.paths['templates']`` directories (other
+    than hidden files and Python modules) is compiled with the
+    ``mako_lookup`` of the app_globals, writing its module to the
+    lookup's ``module_directory``. Every template of the ``jinja2_env``
+    is compiled, and stored in the environment's ``bytecode_cache``.
+
+    With ``filesystem_checks`` disabled, the Mako lookup and the Jinja2
+    environment then no longer check the template files for changes.
+
+    Returns a list of ``(engine, name, error)`` tuples, ``error`` being
+    the exception raised compiling the template or None.
+
+    """
+    app_globals = config['pylons.app_globals']
+    results = []
+
+    mako_lookup = getattr(app_globals, 'mako_lookup', None)
+    if mako_lookup is not None:
+        directories = config['pylons.paths'].get('templates') or []
+        if isinstance(directories, basestring):
+            directories = [directories]
+        for directory in directories:
+            for name in _template_names(directory):
+                results.append(('mako', '/' + name,
+                                _compile(mako_lookup.get_template,
+                                         '/' + name)))
+        if not filesystem_checks:
+            mako_lookup.filesystem_checks = False
+
+    jinja2_env = getattr(app_globals, 'jinja2_env', None)
+    if jinja2_env is not None:
+        for name in jinja2_env.list_templates(filter_func=_is_template):
+            results.append(('jinja2', name,
+                            _compile(jinja2_env.get_template, name)))
+        if not filesystem_checks:
+            jinja2_env.auto_reload = False
+    return results
+
+
+def _compile(get_template, name):
+    try:
+        get_template(name)
+    except Exception, e:
+        log.error("Error compiling template %s: %s", name, e)
+        return e
+    log.debug("Compiled template: %s", name)
+    return None
+
+
+def _is_template(name):
+    """Whether the file ``name`` (relative to a templates directory) is
+    a template, rather than a hidden or backup file or a Python module"""
+    for part in name.split('/'):
+        if part.startswith('.'):
+            return False
+    return not name.endswith('~') and \
+        os.path.splitext(name)[1] not in ('.py', '.pyc', '.pyo')
+
+
+def _template_names(directory):
+    """Return the names of the templates in ``directory`` relative to
+    it, with '/' separators"""
+    names = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(name for name in dirnames
+                             if not name.startswith('.'))
+        prefix = os.path.relpath(dirpath, directory)
+        for filename in sorted(filenames):
+            if not _is_template(filename):
+                continue
+            if prefix != os.curdir:
+                filename = '/'.join(prefix.split(os.sep) + [filename])
+            names.append(filename)
+    return names
@@ -1,23 +1,15 @@
-"""Paste Template and Pylons utility functions
+"""Pylons utility functions
 
-PylonsTemplate is a Paste Template sub-class that configures the source
-directory and default plug-ins for a new Pylons project. The minimal
-template a more minimal template with less additional directories and
-layout.
+The Paste Templates used to create new Pylons projects are in
+:mod:`pylons.scaffolding`, so the runtime doesn't import Paste Script.
+The classes of the same name here stand in for them (see
+:class:`DeferredBaseType`), for the projects and templates importing or
+subclassing them from this module.
 
 """
 import logging
-import sys
 
-import pkg_resources
-from paste.deploy.converters import asbool
-from paste.script.appinstall import Installer
-from paste.script.templates import Template, var
-from tempita import paste_script_template_renderer
-
-import pylons
-import pylons.configuration
-import pylons.i18n
+from pylons.context import PylonsContext
 
 __all__ = ['AttribSafeContextObj', 'ContextObj', 'PylonsContext',
            'class_name_from_module_name', 'call_wsgi_application']
@@ -82,26 +74,6 @@ def class_name_from_module_name(module_name):
     return ''.join(w.title() for w in words)
 
 
-class PylonsContext(object):
-    """Pylons context object
-
-    All the Pylons Stacked Object Proxies are also stored here, for use
-    in generators and async based operation where the globals can't be
-    used.
-
-    This object is attached in
-    :class:`~pylons.controllers.core.WSGIController` instances as
-    :attr:`~WSGIController._py_object`. For example::
-
-        class MyController(WSGIController):
-            def index(self):
-                pyobj = self._py_object
-                return "Environ is %s" % pyobj.request.environ
-
-    """
-    pass
-
-
 class ContextObj(object):
     """The :term:`tmpl_context` object, with strict attribute access
     (raises an Exception when the attribute does not exist)"""
@@ -134,107 +106,84 @@ class AttribSafeContextObj(ContextObj):
             return ''
 
 
-class PylonsTemplate(Template):
-    _template_dir = ('pylons', 'templates/default_project')
-    template_renderer = staticmethod(paste_script_template_renderer)
-    summary = 'Pylons application template'
-    egg_plugins = ['PasteScript', 'Pylons']
-    vars = [
-        var('template_engine', 'mako/genshi/jinja2/etc: Template language',
-            default='mako'),
-        var('sqlalchemy', 'True/False: Include SQLAlchemy configuration',
-            default=False),
-    ]
-    ensure_names = ['description', 'author', 'author_email', 'url']
-
-    def pre(self, command, output_dir, vars):
-        """Called before template is applied."""
-        package_logger = vars['package']
-        if package_logger == 'root':
-            # Rename the app logger in the rare case a project is named 'root'
-            package_logger = 'app'
-        vars['package_logger'] = package_logger
-        vars['template_engine'] = 'mako'
-
-        template_engine = 'mako'
-
-        if template_engine == 'mako':
-            # Support a Babel extractor default for Mako
-            vars['babel_templates_extractor'] = \
-                ("('templates/**.mako', 'mako', {'input_encoding': 'utf-8'})"
-                 ",\n%s#%s" % (' ' * 4, ' ' * 8))
-        else:
-            vars['babel_templates_extractor'] = ''
-
-        # Ensure these exist in the namespace
-        for name in self.ensure_names:
-            vars.setdefault(name, '')
-
-        vars['version'] = vars.get('version', '0.1')
-        vars['zip_safe'] = asbool(vars.get('zip_safe', 'false'))
-        vars['sqlalchemy'] = asbool(vars.get('sqlalchemy', 'false'))
+class DeferredBaseType(type):
+    """Metaclass of the classes deriving from a base class that's only
+    imported once needed
+
+    The base is named by the ``_deferred_base`` attribute of the class
+    (as ``'module:name'``), and imported once the class, or one of its
+    subclasses, is instantiated or has an attribute of the base looked
+    up. The class is then combined with the base, subclasses
+    overriding it as they would if they derived from it directly.
+
+    """
+    def __call__(cls, *args, **kwargs):
+        return type.__call__(cls._combined(), *args, **kwargs)
+
+    def __getattr__(cls, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(cls._combined(), name)
+
+    def _combined(cls):
+        try:
+            return cls.__dict__['_combined_class']
+        except KeyError:
+            pass
+        for klass in cls.__mro__:
+            if '_deferred_base' in klass.__dict__:
+                module, name = klass.__dict__['_deferred_base'].split(':')
+                base = getattr(__import__(module, {}, {}, [name]), name)
+                break
+        combined = DeferredBaseType(cls.__name__, (cls, base),
+                                    dict(__module__=cls.__module__))
+        combined._combined_class = combined
+        cls._combined_class = combined
+        return combined
+
+
+class PylonsTemplate(object):
+    """Stands in for :class:`pylons.scaffolding.PylonsTemplate`"""
+    __metaclass__ = DeferredBaseType
+    _deferred_base = 'pylons.scaffolding:PylonsTemplate'
 
 
 class MinimalPylonsTemplate(PylonsTemplate):
-    _template_dir = ('pylons', 'templates/minimal_project')
-    summary = 'Pylons minimal application template'
-    vars = [
-        var('template_engine', 'mako/genshi/jinja2/etc: Template language',
-            default='mako'),
-    ]
+    """Stands in for :class:`pylons.scaffolding.MinimalPylonsTemplate`"""
+    _deferred_base = 'pylons.scaffolding:MinimalPylonsTemplate'
 
 
 class LegacyPylonsTemplate(PylonsTemplate):
-    _template_dir = ('pylons', 'templates/legacy_project')
-    summary = 'Pylons legacy application template'
-    vars = [
-        var('template_engine', 'mako/genshi/jinja2/etc: Template language',
-            default='mako'),
-    ]
+    """Stands in for :class:`pylons.scaffolding.LegacyPylonsTemplate`"""
+    _deferred_base = 'pylons.scaffolding:LegacyPylonsTemplate'
 
 
 class NewPylonsTemplate(PylonsTemplate):
-    _template_dir = ('pylons', 'templates/new_project')
-    summary = 'Pylons "newstyle" application template'
-    vars = []
+    """Stands in for :class:`pylons.scaffolding.NewPylonsTemplate`"""
+    _deferred_base = 'pylons.scaffolding:NewPylonsTemplate'
 
 
 class NewMinimalPylonsTemplate(PylonsTemplate):
-    _template_dir = ('pylons', 'templates/newminimal_project')
-    summary = 'Pylons "newstyle" minimal application template'
-    vars = []
+    """Stands in for :class:`pylons.scaffolding.NewMinimalPylonsTemplate`"""
+    _deferred_base = 'pylons.scaffolding:NewMinimalPylonsTemplate'
 
 
 class NewSQLAlchemyTemplate(PylonsTemplate):
-    _template_dir = ('pylons', 'templates/newsqla_project')
-    summary = 'Pylons "newstyle" SQLAlchemy template'
-    vars = []
-
-
-class PylonsInstaller(Installer):
-    use_cheetah = False
-    config_file = 'config/deployment.ini_tmpl'
-
-    def config_content(self, command, vars):
-        """
-        Called by ``self.write_config``, this returns the text content
-        for the config file, given the provided variables.
-        """
-        modules = [line.strip()
-                    for line in self.dist.get_metadata_lines('top_level.txt')
-                    if line.strip() and not line.strip().startswith('#')]
-        if not modules:
-            print >> sys.stderr, 'No modules are listed in top_level.txt'
-            print >> sys.stderr, \
-                'Try running python setup.py egg_info to regenerate that file'
-        for module in modules:
-            if pkg_resources.resource_exists(module, self.config_file):
-                return self.template_renderer(
-                    pkg_resources.resource_string(module, self.config_file),
-                    vars, filename=self.config_file)
-        # Legacy support for the old location in egg-info
-        return super(PylonsInstaller, self).config_content(command, vars)
+    """Stands in for :class:`pylons.scaffolding.NewSQLAlchemyTemplate`"""
+    _deferred_base = 'pylons.scaffolding:NewSQLAlchemyTemplate'
+
+
+class PylonsInstaller(object):
+    """Stands in for :class:`pylons.scaffolding.PylonsInstaller`
+
+    Projects created with earlier versions of Pylons refer to the
+    installer here in their :file:`setup.py`.
+
+    """
+    __metaclass__ = DeferredBaseType
+    _deferred_base = 'pylons.scaffolding:PylonsInstaller'
 
 
 def resolve_dotted(name):
+    import pkg_resources
     return pkg_resources.EntryPoint.parse('x=%s' % name).load(False)
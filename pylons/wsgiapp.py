@@ -7,23 +7,67 @@ well.
 
 """
 import logging
+import os
 import sys
 
 import paste.registry
-import pkg_resources
+from paste.deploy.converters import asbool
 from webob.exc import HTTPNotFound
 
 import pylons
-import pylons.templating
+from pylons.caching import log_cache_stats
+from pylons.context import ContextIter, bind_context, get_context
 from pylons.controllers.util import Request, Response
-from pylons.i18n.translation import _get_translator
+from pylons.i18n.translation import _get_translator, translator_cache
 from pylons.util import (AttribSafeContextObj, ContextObj, PylonsContext,
-                         class_name_from_module_name)
+                         class_name_from_module_name, resolve_dotted)
 
 __all__ = ['PylonsApp']
 
 log = logging.getLogger(__name__)
 
+CONTROLLER_MANIFEST = 'manifest.txt'
+
+
+def controller_names(controllers_dir):
+    """Return the names of the controller modules found in
+    ``controllers_dir``, sub-directories being separated with '/' as in
+    the Routes ``controller`` argument"""
+    names = []
+    for dirpath, dirnames, filenames in os.walk(controllers_dir):
+        # Only descend into packages
+        dirnames[:] = sorted(
+            name for name in dirnames
+            if os.path.exists(os.path.join(dirpath, name, '__init__.py')))
+        prefix = os.path.relpath(dirpath, controllers_dir)
+        for filename in sorted(filenames):
+            name, ext = os.path.splitext(filename)
+            if ext != '.py' or name.startswith('_'):
+                continue
+            if prefix != os.curdir:
+                name = '/'.join(prefix.split(os.sep) + [name])
+            names.append(name)
+    return names
+
+
+def read_controller_manifest(path):
+    """Read a controller manifest written by ``paster
+    controllermanifest``, returning a list of ``(name, module_name,
+    attr)`` tuples"""
+    entries = []
+    manifest = open(path)
+    try:
+        for line in manifest:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            name, target = line.split()
+            module_name, attr = target.split(':')
+            entries.append((name, module_name, attr))
+    finally:
+        manifest.close()
+    return entries
+
 
 class PylonsApp(object):
     """Pylons WSGI Application
@@ -63,11 +107,31 @@ class PylonsApp(object):
         self.controller_classes = {}
         self.log_debug = False
         self.config.setdefault('lang', None)
+        self.use_registry = asbool(config.get('pylons.use_registry', True))
+
+        # PylonsContext members that are created on first access
+        self._lazy_members = dict(response=self.create_response,
+                                  translator=self.create_translator,
+                                  tmpl_context=self.create_tmpl_context)
 
         # Cache some options for use during requests
         self._session_key = self.environ_config.get('session', 'beaker.session')
         self._cache_key = self.environ_config.get('cache', 'beaker.cache')
 
+        # Load the translators of the available languages up front
+        root = config['pylons.paths'].get('root')
+        if root:
+            translator_cache.warm(package_name, os.path.join(root, 'i18n'))
+
+        if asbool(config.get('pylons.preload_controllers')):
+            self.preload_controllers()
+
+        if asbool(config.get('pylons.compile_templates')):
+            self.compile_templates()
+
+        if config.get('pylons.cache_stats_interval'):
+            log_cache_stats(float(config['pylons.cache_stats_interval']))
+
     def __call__(self, environ, start_response):
         """Setup and handle a web request
 
@@ -91,6 +155,27 @@ class PylonsApp(object):
         log_debug = self.log_debug = logging.DEBUG >= log.getEffectiveLevel()
         environ['pylons.log_debug'] = log_debug
 
+        if self.use_registry:
+            return self._handle_request(environ, start_response)
+
+        # Restore whatever context was bound should this request be
+        # nested within another Pylons app's
+        previous_context = get_context()
+        try:
+            app_iter = self._handle_request(environ, start_response)
+            context = get_context()
+        finally:
+            bind_context(previous_context)
+        if isinstance(app_iter, (list, tuple)):
+            return app_iter
+        # Iterated over once this method returned, bind the context
+        # again meanwhile
+        environ['pylons.stream_response'] = True
+        return ContextIter(app_iter, context)
+
+    def _handle_request(self, environ, start_response):
+        """Run the request through the methods listed in
+        :meth:`~PylonsApp.__call__`"""
         self.setup_app_env(environ, start_response)
         if 'paste.testing_variables' in environ:
             self.load_test_env(environ)
@@ -132,14 +217,21 @@ class PylonsApp(object):
         """
         pylons_obj = environ['pylons.pylons']
 
+        # Lazy members that haven't been created yet are registered as
+        # the PylonsContext itself, which the globals resolve through
+        # (creating the member) on first use
+        members = pylons_obj.__dict__
         registry = environ['paste.registry']
-        registry.register(pylons.response, pylons_obj.response)
+        registry.register(pylons.response,
+                          members.get('response', pylons_obj))
         registry.register(pylons.request, pylons_obj.request)
 
         registry.register(pylons.app_globals, self.globals)
         registry.register(pylons.config, self.config)
-        registry.register(pylons.tmpl_context, pylons_obj.tmpl_context)
-        registry.register(pylons.translator, pylons_obj.translator)
+        registry.register(pylons.tmpl_context,
+                          members.get('tmpl_context', pylons_obj))
+        registry.register(pylons.translator,
+                          members.get('translator', pylons_obj))
 
         if 'session' in pylons_obj.__dict__:
             registry.register(pylons.session, pylons_obj.session)
@@ -158,6 +250,11 @@ class PylonsApp(object):
         :meth:`~PylonsApp.register_globals` is called to register them
         in the environment.
 
+        The response, translator and :term:`tmpl_context` are created
+        on first access by :meth:`~PylonsApp.create_response`,
+        :meth:`~PylonsApp.create_translator` and
+        :meth:`~PylonsApp.create_tmpl_context`.
+
         """
         if self.log_debug:
             log.debug("Setting up Pylons stacked object globals")
@@ -171,16 +268,13 @@ class PylonsApp(object):
         req.config = self.config
         req.link, req.route_dict = environ['wsgiorg.routing_args']
 
-        response = Response(
-            content_type=self.response_options['content_type'],
-            charset=self.response_options['charset'])
-        response.headers.update(self.response_options['headers'])
-
-        # Store a copy of the request/response in environ for faster access
+        # Store a copy of the request/response in environ for faster access,
+        # the response, translator and tmpl_context are only created
+        # should they be used
         pylons_obj = PylonsContext()
+        pylons_obj._lazy_members = self._lazy_members
         pylons_obj.config = self.config
         pylons_obj.request = req
-        pylons_obj.response = response
         pylons_obj.app_globals = self.globals
         pylons_obj.h = self.helpers
 
@@ -191,25 +285,46 @@ class PylonsApp(object):
 
         environ['pylons.environ_config'] = self.environ_config
 
-        # Setup the translator object
-        lang = self.config['lang']
-        pylons_obj.translator = _get_translator(lang, pylons_config=self.config)
-
-        if self.config['pylons.strict_tmpl_context']:
-            tmpl_context = ContextObj()
-        else:
-            tmpl_context = AttribSafeContextObj()
-        pylons_obj.tmpl_context = req.tmpl_context = tmpl_context
-
         if self._session_key in environ:
             pylons_obj.session = req.session = environ[self._session_key]
         if self._cache_key in environ:
             pylons_obj.cache = environ[self._cache_key]
 
+        if not self.use_registry:
+            # Bind the context for the globals to resolve through
+            if 'cache' not in pylons_obj.__dict__ and \
+                hasattr(self.globals, 'cache'):
+                pylons_obj.cache = self.globals.cache
+            bind_context(pylons_obj)
         # Load the globals with the registry if around
-        if 'paste.registry' in environ:
+        elif 'paste.registry' in environ:
             self.register_globals(environ)
 
+    def create_response(self, pylons_obj):
+        """Create the :class:`~pylons.controllers.util.Response` for
+        the request, called the first time ``pylons_obj.response`` is
+        used"""
+        response = Response(
+            content_type=self.response_options['content_type'],
+            charset=self.response_options['charset'])
+        response.headers.update(self.response_options['headers'])
+        return response
+
+    def create_translator(self, pylons_obj):
+        """Create the translator for the request, called the first time
+        ``pylons_obj.translator`` is used"""
+        return _get_translator(self.config['lang'], pylons_config=self.config)
+
+    def create_tmpl_context(self, pylons_obj):
+        """Create the :term:`tmpl_context` for the request, called the
+        first time ``pylons_obj.tmpl_context`` is used"""
+        if self.config['pylons.strict_tmpl_context']:
+            tmpl_context = ContextObj()
+        else:
+            tmpl_context = AttribSafeContextObj()
+        pylons_obj.request.tmpl_context = tmpl_context
+        return tmpl_context
+
     def resolve(self, environ, start_response):
         """Uses dispatching information found in
         ``environ['wsgiorg.routing_args']`` to retrieve a controller
@@ -254,8 +369,7 @@ class PylonsApp(object):
 
         # Check to see if its a dotted name
         if '.' in controller or ':' in controller:
-            mycontroller = pkg_resources.EntryPoint.parse(
-                'x=%s' % controller).load(False)
+            mycontroller = resolve_dotted(controller)
             self.controller_classes[controller] = mycontroller
             return mycontroller
 
@@ -280,6 +394,64 @@ class PylonsApp(object):
         self.controller_classes[controller] = mycontroller
         return mycontroller
 
+    def preload_controllers(self):
+        """Import all the controllers up front, filling
+        ``controller_classes``
+
+        Called when creating the app if ``pylons.preload_controllers``
+        is enabled, so the first request to each controller doesn't pay
+        for importing it, and (when the app is loaded before the server
+        forks) worker processes share the imported code.
+
+        The controllers are read from the manifest at
+        ``pylons.controller_manifest`` (defaulting to ``manifest.txt`` in
+        the controllers directory) when it exists, as generated with
+        ``paster controllermanifest``. Otherwise every module in the
+        controllers directory is imported, skipping those that don't
+        define a controller.
+
+        """
+        controllers_dir = self.config['pylons.paths'].get('controllers')
+        manifest = self.config.get('pylons.controller_manifest')
+        if not manifest and controllers_dir:
+            manifest = os.path.join(controllers_dir, CONTROLLER_MANIFEST)
+        if manifest and os.path.exists(manifest):
+            log.debug("Preloading controllers from manifest: %s", manifest)
+            for name, module_name, attr in read_controller_manifest(manifest):
+                __import__(module_name)
+                self.controller_classes[name] = getattr(
+                    sys.modules[module_name], attr)
+        elif controllers_dir:
+            log.debug("Preloading controllers from: %s", controllers_dir)
+            for name in controller_names(controllers_dir):
+                try:
+                    self.find_controller(name)
+                except AttributeError:
+                    log.debug("No controller found in module: %s", name)
+
+        # Compute the dispatch plans now as well
+        for controller in self.controller_classes.itervalues():
+            if hasattr(controller, '_get_dispatch_plan'):
+                controller._get_dispatch_plan()
+
+    def compile_templates(self):
+        """Compile the Mako and Jinja2 templates up front
+
+        Called when creating the app if ``pylons.compile_templates`` is
+        enabled, so that the templates are compiled once before the
+        server forks rather than by each worker on its first request.
+        When ``debug`` is disabled, the template files are then no
+        longer checked for changes (see
+        :func:`~pylons.templating.compile_templates`).
+
+        """
+        # pylons.templating isn't needed otherwise
+        from pylons.templating import compile_templates
+        results = compile_templates(
+            self.config, filesystem_checks=asbool(self.config.get('debug')))
+        errors = len([result for result in results if result[2]])
+        log.info("Compiled %d templates, %d errors", len(results), errors)
+
     def dispatch(self, controller, environ, start_response):
         """Dispatches to a controller, will instantiate the controller
         if necessary.
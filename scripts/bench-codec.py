@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Compare the size and the store/load time of beaker_cache values
+pickled as dicts (as done before pylons.caching.ValueCodec) and
+encoded by the codec, as the file, dbm and memcached backends do"""
+import cPickle
+import time
+import timeit
+
+from pylons.caching import ValueCodec
+
+REPEAT = 200
+
+HEADERS = [('Content-Type', 'text/html; charset=utf-8'),
+           ('Content-Length', '0'), ('Cache-Control', 'no-cache'),
+           ('Pragma', 'no-cache')]
+
+
+def make_value(content):
+    return dict(status='200 OK', headers=HEADERS, cookies=None,
+                content=content)
+
+
+def pickled(value):
+    return cPickle.dumps((time.time(), None, value), 2)
+
+
+def unpickled(data):
+    return cPickle.loads(data)[2]
+
+
+def run(name, content):
+    value = make_value(content)
+    codec = ValueCodec()
+    plain = pickled(value)
+    encoded = pickled(codec.encode(value))
+
+    plain_store = min(timeit.repeat(lambda: pickled(value),
+                                    number=REPEAT, repeat=3))
+    codec_store = min(timeit.repeat(lambda: pickled(codec.encode(value)),
+                                    number=REPEAT, repeat=3))
+    plain_load = min(timeit.repeat(lambda: unpickled(plain),
+                                   number=REPEAT, repeat=3))
+    codec_load = min(timeit.repeat(
+        lambda: codec.decode(unpickled(encoded)), number=REPEAT, repeat=3))
+    print '%s:' % name
+    print '  size:  %8d bytes pickled, %8d bytes encoded' % (
+        len(plain), len(encoded))
+    print '  store: %8.1f usec pickled, %8.1f usec encoded' % (
+        plain_store / REPEAT * 1e6, codec_store / REPEAT * 1e6)
+    print '  load:  %8.1f usec pickled, %8.1f usec encoded' % (
+        plain_load / REPEAT * 1e6, codec_load / REPEAT * 1e6)
+
+
+def main():
+    row = u'<tr><td>%d</td><td>Item \u2603 %d</td><td>%d.00</td></tr>\n'
+    page = u'<table>\n%s</table>' % u''.join(row % (i, i, i)
+                                             for i in range(4000))
+    run('small str', 'Hello World')
+    run('200KB unicode page', page)
+    run('200KB str page', page.encode('utf-8'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Compare per-request overhead of the registry and registry-free
+(``pylons.use_registry = false``) request context modes"""
+import os
+import sys
+import timeit
+from StringIO import StringIO
+
+from paste.registry import RegistryManager
+from routes import Mapper
+from routes.middleware import RoutesMiddleware
+
+import pylons
+from pylons.configuration import PylonsConfig
+from pylons.controllers import WSGIController
+from pylons.templating import pylons_globals
+from pylons.wsgiapp import PylonsApp
+
+REQUESTS = 5000
+
+
+class BenchController(WSGIController):
+    def index(self):
+        pylons.tmpl_context.name = pylons.request.params.get('name', 'World')
+        pylons.response.headers['X-Bench'] = '1'
+        pylons_globals()
+        return 'Hello %s' % pylons.tmpl_context.name
+
+
+def make_app(use_registry):
+    config = PylonsConfig()
+    config.init_app({}, {'pylons.use_registry': use_registry},
+                    package='bench', paths=dict(root=os.getcwd()))
+    config['pylons.app_globals'] = type('Globals', (object,), {})()
+    mapper = Mapper()
+    mapper.connect('/', controller='__main__:BenchController',
+                   action='index')
+    config['routes.map'] = mapper
+    app = PylonsApp(config=config)
+    app = RoutesMiddleware(app, mapper, singleton=False)
+    return RegistryManager(app)
+
+
+def run(app):
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def request():
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/',
+                   'SCRIPT_NAME': '', 'QUERY_STRING': 'name=Bench',
+                   'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+                   'wsgi.url_scheme': 'http', 'wsgi.input': StringIO(''),
+                   'wsgi.errors': sys.stderr}
+        ''.join(app(environ, start_response))
+    request()
+    return min(timeit.repeat(request, number=REQUESTS, repeat=3))
+
+
+def main():
+    registry = run(make_app('true'))
+    context = run(make_app('false'))
+    print 'registry:      %.1f usec/request' % (registry / REQUESTS * 1e6)
+    print 'context local: %.1f usec/request' % (context / REQUESTS * 1e6)
+    print 'savings:       %.1f%%' % ((registry - context) / registry * 100)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""Measure the time taken by ``import pylons.wsgiapp`` in a fresh
+interpreter
+
+Exits with a non-zero status when modules that should only be imported
+on first use get imported, or when the import takes longer than
+``--max-ms`` milliseconds.
+
+"""
+import optparse
+import os
+import subprocess
+import sys
+
+DEFERRED_MODULES = ['formencode', 'simplejson', 'tempita', 'paste.script',
+                    'webhelpers', 'pylons.scaffolding', 'pylons.templating']
+
+CODE = """\
+import sys, time
+start = time.time()
+import %s
+elapsed = time.time() - start
+print elapsed
+print ' '.join(sys.modules)
+"""
+
+
+def measure(module):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.Popen([sys.executable, '-c', CODE % module],
+                            cwd=root, stdout=subprocess.PIPE)
+    output = proc.communicate()[0]
+    if proc.returncode:
+        sys.exit("Importing %s failed" % module)
+    elapsed, modules = output.splitlines()
+    return float(elapsed), modules.split()
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] [module]')
+    parser.add_option('-n', dest='repeat', type='int', default=10,
+                      help='Number of interpreters to start (default 10)')
+    parser.add_option('--max-ms', dest='max_ms', type='float',
+                      help='Fail when the best time exceeds this')
+    options, args = parser.parse_args()
+    module = args and args[0] or 'pylons.wsgiapp'
+
+    times = []
+    for i in range(options.repeat):
+        elapsed, modules = measure(module)
+        times.append(elapsed * 1000)
+    times.sort()
+    print 'import %s' % module
+    print 'best:    %.1f ms' % times[0]
+    print 'median:  %.1f ms' % times[len(times) // 2]
+    print 'modules: %d' % len(modules)
+
+    failed = False
+    loaded = [name for name in DEFERRED_MODULES if name in modules]
+    if loaded:
+        print 'FAIL: imported %s' % ', '.join(loaded)
+        failed = True
+    if options.max_ms and times[0] > options.max_ms:
+        print 'FAIL: best time above %.1f ms' % options.max_ms
+        failed = True
+    sys.exit(failed and 1 or 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Compare per-request overhead of the nested middleware stack from the
+project template and :class:`~pylons.middleware.StaticRegistryStack`"""
+import os
+import sys
+import tempfile
+import timeit
+from StringIO import StringIO
+
+from beaker.middleware import SessionMiddleware
+from paste.cascade import Cascade
+from paste.registry import RegistryManager
+from paste.urlparser import StaticURLParser
+from routes import Mapper
+from routes.middleware import RoutesMiddleware
+
+import pylons
+from pylons.configuration import PylonsConfig
+from pylons.controllers import WSGIController
+from pylons.middleware import ErrorHandler, StaticRegistryStack, \
+    StatusCodeRedirect
+from pylons.wsgiapp import PylonsApp
+
+REQUESTS = 5000
+
+
+class BenchController(WSGIController):
+    def index(self):
+        return 'Hello %s' % pylons.request.params.get('name', 'World')
+
+
+def make_config():
+    config = PylonsConfig()
+    static_files = tempfile.mkdtemp()
+    config.init_app({}, {}, package='bench',
+                    paths=dict(root=os.getcwd(), static_files=static_files))
+    config['pylons.app_globals'] = type('Globals', (object,), {})()
+    mapper = Mapper()
+    mapper.connect('/', controller='__main__:BenchController',
+                   action='index')
+    config['routes.map'] = mapper
+    return config
+
+
+def make_nested_app():
+    config = make_config()
+    app = PylonsApp(config=config)
+    app = RoutesMiddleware(app, config['routes.map'], singleton=False)
+    app = SessionMiddleware(app, config)
+    app = ErrorHandler(app, {}, **config['pylons.errorware'])
+    app = StatusCodeRedirect(app, [400, 401, 403, 404, 500])
+    app = RegistryManager(app)
+    static_app = StaticURLParser(config['pylons.paths']['static_files'])
+    return Cascade([static_app, app])
+
+
+def make_stack_app():
+    config = make_config()
+    return StaticRegistryStack(PylonsApp(config=config), config, {})
+
+
+def run(app, method='GET'):
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def request():
+        body = method == 'POST' and 'name=Bench' or ''
+        environ = {'REQUEST_METHOD': method, 'PATH_INFO': '/',
+                   'SCRIPT_NAME': '', 'QUERY_STRING': 'name=Bench',
+                   'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+                   'CONTENT_LENGTH': str(len(body)),
+                   'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+                   'wsgi.url_scheme': 'http', 'wsgi.input': StringIO(body),
+                   'wsgi.errors': sys.stderr}
+        ''.join(app(environ, start_response))
+    request()
+    return min(timeit.repeat(request, number=REQUESTS, repeat=3))
+
+
+def main():
+    for method in ('GET', 'POST'):
+        nested = run(make_nested_app(), method)
+        stack = run(make_stack_app(), method)
+        print '%s' % method
+        print '  nested stack:        %.1f usec/request' % (
+            nested / REQUESTS * 1e6)
+        print '  StaticRegistryStack: %.1f usec/request' % (
+            stack / REQUESTS * 1e6)
+        print '  savings:             %.1f%%' % (
+            (nested - stack) / nested * 100)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""Compare the get and put times of the memory, dbm and shm (shared
+memory) Beaker backends for a rendered page, as cached by beaker_cache
+or cached_template"""
+import shutil
+import tempfile
+import timeit
+
+from beaker.cache import CacheManager
+
+REPEAT = 2000
+
+
+def run(manager, name, value, **kwargs):
+    cache = manager.get_cache('bench_shm', **kwargs)
+    cache.put('key', value)
+    put = min(timeit.repeat(lambda: cache.put('key', value),
+                            number=REPEAT, repeat=3))
+    get = min(timeit.repeat(lambda: cache.get('key'),
+                            number=REPEAT, repeat=3))
+    print '  %-7s get: %8.1f usec, put: %8.1f usec' % (
+        name + ':', get / REPEAT * 1e6, put / REPEAT * 1e6)
+
+
+def main():
+    data_dir = tempfile.mkdtemp()
+    try:
+        manager = CacheManager(data_dir=data_dir)
+        for size in (100, 4000):
+            value = 'x' * size
+            print '%d bytes:' % size
+            run(manager, 'memory', value, type='memory')
+            run(manager, 'dbm', value, type='dbm')
+            run(manager, 'shm', value, type='shm')
+    finally:
+        shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Measure the time per partial of a page rendering many small Mako defs
+with render_mako_def, in the registry and registry-free
+(``pylons.use_registry = false``) request context modes, and the time
+to render a 200KB page with render_mako to unicode and with
+``as_bytes``"""
+import os
+import sys
+import timeit
+from StringIO import StringIO
+
+from mako.lookup import TemplateLookup
+from paste.registry import RegistryManager
+from routes import Mapper
+from routes.middleware import RoutesMiddleware
+
+import pylons
+from pylons.configuration import PylonsConfig
+from pylons.controllers import WSGIController
+from pylons.templating import render_mako, render_mako_def
+from pylons.wsgiapp import PylonsApp
+
+REQUESTS = 200
+PARTIALS = 50
+
+
+PAGE = u"""<table>
+% for i in rows:
+<tr><td>${i}</td><td>Item \u2603 ${i}</td><td>${i}.00</td></tr>
+% endfor
+</table>"""
+
+
+class BenchController(WSGIController):
+    def index(self):
+        return ''.join([render_mako_def('/partials.mako', 'row', id=i)
+                        for i in xrange(PARTIALS)])
+
+    def page(self):
+        return render_mako('/page.mako', dict(rows=xrange(4000)))
+
+    def page_bytes(self):
+        return render_mako('/page.mako', dict(rows=xrange(4000)),
+                           as_bytes=True)
+
+
+def make_app(use_registry):
+    config = PylonsConfig()
+    config.init_app({}, {'pylons.use_registry': use_registry},
+                    package='bench', paths=dict(root=os.getcwd()))
+    app_globals = type('Globals', (object,), {})()
+    app_globals.mako_lookup = TemplateLookup()
+    app_globals.mako_lookup.put_string(
+        '/partials.mako', '<%def name="row(id)"><td>${id}</td></%def>')
+    app_globals.mako_lookup.put_string('/page.mako', PAGE)
+    config['pylons.app_globals'] = app_globals
+    mapper = Mapper()
+    mapper.connect('/', controller='__main__:BenchController',
+                   action='index')
+    mapper.connect('/{action}', controller='__main__:BenchController')
+    config['routes.map'] = mapper
+    app = PylonsApp(config=config)
+    app = RoutesMiddleware(app, mapper, singleton=False)
+    return RegistryManager(app)
+
+
+def run(app, path='/', requests=REQUESTS):
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def request():
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path,
+                   'SCRIPT_NAME': '', 'QUERY_STRING': '',
+                   'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+                   'wsgi.url_scheme': 'http', 'wsgi.input': StringIO(''),
+                   'wsgi.errors': sys.stderr}
+        ''.join(app(environ, start_response))
+    request()
+    return min(timeit.repeat(request, number=requests, repeat=3))
+
+
+def main():
+    for use_registry in ('true', 'false'):
+        total = run(make_app(use_registry))
+        print 'use_registry=%s: %.1f usec/partial' % (
+            use_registry, total / REQUESTS / PARTIALS * 1e6)
+    app = make_app('false')
+    for path in ('/page', '/page_bytes'):
+        total = run(app, path, 50)
+        print '%s: %.2f msec/page' % (path, total / 50 * 1e3)
+
+
+if __name__ == '__main__':
+    main()
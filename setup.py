@@ -142,19 +142,26 @@ with BitBucket hosting the main repository here:
     },
     entry_points="""
     [paste.paster_command]
+    compiletemplates = pylons.commands:CompileTemplatesCommand
     controller = pylons.commands:ControllerCommand
+    controllermanifest = pylons.commands:ControllerManifestCommand
     restcontroller = pylons.commands:RestControllerCommand
     routes = pylons.commands:RoutesCommand
     shell = pylons.commands:ShellCommand
+    warmcache = pylons.commands:WarmCacheCommand
 
     [paste.paster_create_template]
-    pylons = pylons.util:PylonsTemplate
-    pylons_minimal = pylons.util:MinimalPylonsTemplate
+    pylons = pylons.scaffolding:PylonsTemplate
+    pylons_minimal = pylons.scaffolding:MinimalPylonsTemplate
 
     [paste.filter_factory]
     debugger = pylons.middleware:debugger_filter_factory
 
     [paste.filter_app_factory]
     debugger = pylons.middleware:debugger_filter_app_factory
+    warmcache = pylons.middleware:warmcache_filter_app_factory
+
+    [beaker.backends]
+    shm = pylons.shmcache:SharedMemoryNamespaceManager
     """,
 )
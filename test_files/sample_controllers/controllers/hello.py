@@ -1,14 +1,33 @@
 import logging
+import threading
+import time
 
 from pylons import request, response, session, tmpl_context as c, url
 from pylons.controllers import WSGIController
 from pylons.controllers.util import abort, redirect
-from pylons.templating import render_mako
+from pylons.templating import render_mako, render_mako_fragments, \
+     stream_genshi, stream_jinja2, \
+     stream_mako
 from webob import Response
 from webob.exc import HTTPNotFound
 
 log = logging.getLogger(__name__)
 
+class PathIter(object):
+    """Iterable using the Pylons globals when iterated over"""
+    def __init__(self):
+        self.done = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.done:
+            raise StopIteration
+        self.done = True
+        return request.path_info
+
+
 class HelloController(WSGIController):
     def __init__(self):
         self._pylons_log_debug = True
@@ -25,6 +44,94 @@ class HelloController(WSGIController):
     def intro_template(self):
         return render_mako('/hello.html')
     
+    def lazy_members(self):
+        created = self._py_object.__dict__
+        return ' '.join(name for name in ('translator', 'tmpl_context')
+                        if name in created)
+
+    def counter(self):
+        session['counter'] = session.get('counter', 0) + 1
+        session.save()
+        return 'Counter is %d' % session['counter']
+
+    def extra_vars_template(self):
+        extra_vars = dict(name='World')
+        first = render_mako('/vars.html', extra_vars=extra_vars)
+        pylons_vars = self._py_object._template_globals
+        second = render_mako('/vars.html', extra_vars=extra_vars)
+        return '%s%s%s %s' % (
+            first, second, extra_vars.keys(),
+            self._py_object._template_globals is pylons_vars)
+
+    def bytes_template(self):
+        return render_mako('/vars.html', extra_vars=dict(name=u'caf\xe9'),
+                           as_bytes=True)
+
+    def bytes_cached_template(self):
+        first = render_mako('/time.html', cache_key='fred', cache_expire=20)
+        second = render_mako('/time.html', cache_key='fred', cache_expire=20,
+                             as_bytes=True)
+        return '%s %s' % (first.__class__.__name__,
+                          second.__class__.__name__)
+
+    def stream_template(self):
+        engine = request.params['engine']
+        rows = [u'caf\xe9 %s' % i for i in range(10)]
+        if engine == 'mako':
+            return stream_mako('/rows.html', dict(rows=rows), chunk_size=50)
+        elif engine == 'jinja2':
+            return stream_jinja2('rows.jinja2', dict(rows=rows), chunk_size=50)
+        return stream_genshi('rows.genshi', dict(rows=rows), chunk_size=50)
+
+    def stream_progress(self):
+        rendered = []
+        def rows():
+            for i in range(100):
+                rendered.append(i)
+                yield i
+        chunks = stream_mako('/rows.html', dict(rows=rows()), chunk_size=50)
+        first = chunks.next()
+        progress = len(rendered)
+        chunks.close()
+        time.sleep(0.05)
+        return '%s %s %s' % (first.split('\n')[0], progress < 100,
+                             len(rendered) < 100)
+
+    def stream_chunks(self):
+        chunks = stream_jinja2('rows.jinja2', dict(rows=range(10)),
+                               chunk_size=40)
+        return repr([len(chunk) for chunk in chunks])
+
+    def fragments_template(self):
+        c.title = 'Fragments'
+        calls = []
+        def value(n):
+            calls.append(threading.currentThread())
+            time.sleep(0.05)
+            return n
+        fragments = [('/fragments.html', 'fragment', dict(n=n, value=value),
+                      dict(cache_key=request.params.get('key', '') + str(n),
+                           cache_type='memory',
+                           cache_expire=20))
+                     for n in range(4)]
+        fragments.append(('/fragments.html', 'fragment',
+                          dict(n=4, value=value), None))
+        first = render_mako_fragments(fragments, max_workers=2)
+        second = render_mako_fragments(fragments)
+        return '%s %s %d %d' % (''.join(first), ''.join(second), len(calls),
+                                len(set(calls[:5])))
+
+    def lazy_iter(self):
+        return PathIter()
+
+    def request_attrs(self):
+        pylons_obj = self._py_object
+        return '%s %s %s %s %s' % (
+            request.language, request.config is pylons_obj.config,
+            request.route_dict['action'],
+            request.session is pylons_obj.session,
+            request.tmpl_context is pylons_obj.tmpl_context)
+
     def time_template(self):
         return render_mako('/time.html', cache_key='fred', cache_expire=20)
 
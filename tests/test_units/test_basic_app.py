@@ -8,7 +8,7 @@ from nose.tools import raises
 from __init__ import test_root
 
 
-def make_app(global_conf, full_stack=True, static_files=True, include_cache_middleware=False, attribsafe=False, **app_conf):
+def make_app(global_conf, full_stack=True, static_files=True, include_cache_middleware=False, attribsafe=False, fused=False, **app_conf):
     import pylons
     import pylons.configuration as configuration
     from beaker.cache import CacheManager
@@ -17,12 +17,13 @@ def make_app(global_conf, full_stack=True, static_files=True, include_cache_midd
     from paste.registry import RegistryManager
     from paste.deploy.converters import asbool
     from pylons.decorators import jsonify
-    from pylons.middleware import ErrorHandler, StatusCodeRedirect
+    from pylons.middleware import ErrorHandler, StaticRegistryStack, StatusCodeRedirect
     from pylons.wsgiapp import PylonsApp
     from routes import Mapper
     from routes.middleware import RoutesMiddleware
     
-    paths = dict(root=os.path.join(test_root, 'sample_controllers'), controllers=os.path.join(test_root, 'sample_controllers', 'controllers'))
+    paths = dict(root=os.path.join(test_root, 'sample_controllers'), controllers=os.path.join(test_root, 'sample_controllers', 'controllers'),
+                 static_files=os.path.join(test_root, 'sample_controllers', 'public'))
 
     config = configuration.pylons_config
     config.init_app(global_conf, app_conf, package='sample_controllers', paths=paths)
@@ -42,6 +43,11 @@ def make_app(global_conf, full_stack=True, static_files=True, include_cache_midd
         config['pylons.strict_tmpl_context'] = False
     
     app = PylonsApp(config=config)
+    if fused:
+        app = StaticRegistryStack(app, config, global_conf, full_stack=full_stack,
+                          static_files=static_files)
+        return app
+
     app = RoutesMiddleware(app, config['routes.map'], singleton=False)
     if include_cache_middleware:
         app = CacheMiddleware(app, config)
@@ -100,6 +106,10 @@ class TestWsgiApp(object):
         resp = self.app.get('/goodbye/index')
         assert 'Hello World' in resp
 
+    def test_lazy_iter(self):
+        resp = self.app.get('/hello/lazy_iter')
+        assert resp.body == '/hello/lazy_iter'
+
 
 class TestJsonifyDecorator(object):
     def setUp(self):
@@ -152,3 +162,149 @@ class TestJsonifyDecorator(object):
         response = self.app.get(self.url(controller='i18nc', action='langs'), headers={
                 'Accept-Language':'fr;q=0.6, en;q=0.1, ja;q=0.3'})
         assert "['fr', 'ja', 'en-us']" in response
+
+
+class TestRegistryFreeApp(object):
+    def setUp(self):
+        from paste.fixture import TestApp
+        from routes.util import URLGenerator
+        app = make_app({}, **{'pylons.use_registry': 'false'})
+        self.app = TestApp(app)
+        self.url = URLGenerator(app.config['routes.map'], {})
+
+    def test_basic_response(self):
+        resp = self.app.get('/hello/index')
+        assert 'Hello World' in resp
+
+    def test_context_unbound(self):
+        from pylons.context import get_context
+        self.app.get('/hello/index')
+        assert get_context() is None
+
+    def test_cache_obj_appglobals(self):
+        resp = self.app.get('/hello/index', extra_environ={'paste.testing_variables': True})
+        assert resp.cache == 'Nothing here but a string'
+
+    def test_set_lang(self):
+        response = self.app.get(self.url(controller='i18nc', action='set_lang', lang='ja'))
+        assert u'\u8a00\u8a9e\u8a2d\u5b9a\u3092\u300cja\u300d\u306b\u5909\u66f4\u3057\u307e\u3057\u305f'.encode('utf-8') in response
+
+    def test_abort(self):
+        self.app.get('/hello/abort', status=404)
+
+    def test_lazy_iter(self):
+        from pylons.context import get_context
+        resp = self.app.get('/hello/lazy_iter')
+        assert resp.body == '/hello/lazy_iter'
+        assert get_context() is None
+
+
+class TestStaticRegistryStack(object):
+    def setUp(self):
+        from paste.fixture import TestApp
+        self.app = TestApp(make_app({}, fused=True))
+
+    def test_basic_response(self):
+        resp = self.app.get('/hello/index')
+        assert 'Hello World' in resp
+
+    def test_routing_args(self):
+        resp = self.app.get('/hello/index', extra_environ={'paste.testing_variables': True})
+        assert resp.req.environ['wsgiorg.routing_args'][1]['action'] == 'index'
+        assert resp.req.environ['pylons.routes_dict']['controller'] == 'hello'
+
+    def test_method_override(self):
+        resp = self.app.get('/hello/index?_method=PUT', extra_environ={'paste.testing_variables': True})
+        assert resp.req.environ['REQUEST_METHOD'] == 'GET'
+
+    def test_session(self):
+        resp = self.app.get('/hello/counter')
+        assert 'Counter is 1' in resp
+        assert 'Set-Cookie' in dict(resp.headers) or 'Set-cookie' in dict(resp.headers)
+        resp = self.app.get('/hello/counter')
+        assert 'Counter is 2' in resp
+
+    def test_static_file(self):
+        resp = self.app.get('/static.txt')
+        assert 'Static file' in resp
+
+    def test_static_fall_through(self):
+        self.app.get('/missing.txt', status=404)
+        self.app.post('/hello/index', params={'name': 'value'})
+
+    def test_not_found(self):
+        self.app.get('/hello/abort', status=404)
+
+    def test_registry(self):
+        resp = self.app.get('/hello/index', extra_environ={'paste.testing_variables': True})
+        assert resp.req.environ['paste.registry'].reglist == []
+
+    def test_lazy_iter(self):
+        resp = self.app.get('/hello/lazy_iter',
+                            extra_environ={'paste.testing_variables': True})
+        assert resp.body == '/hello/lazy_iter'
+        assert resp.req.environ['paste.registry'].reglist == []
+
+    def test_no_static_files(self):
+        from paste.fixture import TestApp
+        app = TestApp(make_app({}, fused=True, static_files=False))
+        app.get('/static.txt', status=404)
+
+    def test_static_sibling_dir(self):
+        import shutil
+        import tempfile
+        from pylons.middleware import StaticRegistryStack
+        root = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(root, 'public'))
+            os.mkdir(os.path.join(root, 'public2'))
+            open(os.path.join(root, 'public2', 'secret.txt'), 'w').close()
+            stack = StaticRegistryStack.__new__(StaticRegistryStack)
+            stack.static_dir = os.path.join(root, 'public')
+            environ = {'PATH_INFO': '/../public2/secret.txt'}
+            assert not stack.is_static(environ)
+        finally:
+            shutil.rmtree(root)
+
+
+class TestPreloadControllers(object):
+    def setUp(self):
+        self.controllers_dir = os.path.join(test_root, 'sample_controllers', 'controllers')
+
+    def tearDown(self):
+        from pylons.configuration import pylons_config
+        pylons_config.pop('pylons.preload_controllers', None)
+        pylons_config.pop('pylons.controller_manifest', None)
+
+    def _make_app(self, **app_conf):
+        from pylons.wsgiapp import PylonsApp
+        app = make_app({}, **app_conf)
+        return PylonsApp(config=app.config)
+
+    def test_controller_names(self):
+        from pylons.wsgiapp import controller_names
+        assert controller_names(self.controllers_dir) == ['goodbye', 'hello', 'i18nc']
+
+    def test_preload(self):
+        app = self._make_app(**{'pylons.preload_controllers': 'true'})
+        assert sorted(app.controller_classes) == ['goodbye', 'hello', 'i18nc']
+        assert '_pylons_dispatch_plan' in app.controller_classes['hello'].__dict__
+
+    def test_no_preload(self):
+        app = self._make_app()
+        assert app.controller_classes == {}
+
+    def test_preload_manifest(self):
+        import tempfile
+        from pylons.wsgiapp import read_controller_manifest
+        fd, manifest = tempfile.mkstemp()
+        try:
+            os.write(fd, '# Controllers\nhello sample_controllers.controllers.hello:HelloController\n')
+            os.close(fd)
+            assert read_controller_manifest(manifest) == [
+                ('hello', 'sample_controllers.controllers.hello', 'HelloController')]
+            app = self._make_app(**{'pylons.preload_controllers': 'true',
+                                    'pylons.controller_manifest': manifest})
+            assert app.controller_classes.keys() == ['hello']
+        finally:
+            os.remove(manifest)
@@ -0,0 +1,310 @@
+import itertools
+import os
+import threading
+import time
+from unittest import TestCase
+
+from beaker.cache import CacheManager
+
+from pylons.caching import LocalTier, ValueCodec, apply_local_tier, \
+    format_cache_stats, format_warm_report, get_cache_stats, local_tier, \
+    local_tiers, namespace_stats, new_tag_generations, reset_cache_stats, \
+    tag_generations, tags_current, warm_cache, warm_list
+
+from __init__ import data_dir
+
+cache_dir = os.path.join(data_dir, 'cache')
+# Beaker keeps the caches of a namespace for the process
+namespaces = ('local_tier_%s' % i for i in itertools.count())
+
+
+class TestLocalTier(TestCase):
+    def setUp(self):
+        self.manager = CacheManager(type='dbm', data_dir=cache_dir)
+        self.namespace = namespaces.next()
+        local_tiers.clear()
+
+    def tearDown(self):
+        local_tiers.clear()
+
+    def get_cache(self, **kwargs):
+        return local_tier(self.manager.get_cache(self.namespace), **kwargs)
+
+    def test_hits(self):
+        cache = self.get_cache(ttl=60)
+        cache.put('key', 'value')
+        tier = cache.namespace.tier
+        assert cache.get('key') == 'value'
+        assert cache.get('key') == 'value'
+        assert tier.hits == 2
+        assert tier.misses == 0
+
+    def test_backend_not_locked(self):
+        cache = self.get_cache(ttl=60)
+        cache.put('key', 'value')
+        backend = cache.namespace.backend
+        locked = []
+        original = backend.acquire_read_lock
+        def acquire_read_lock():
+            locked.append(True)
+            return original()
+        backend.acquire_read_lock = acquire_read_lock
+        assert cache.get('key') == 'value'
+        assert not locked
+        self.assertRaises(KeyError, cache.get, 'other')
+        assert locked
+
+    def test_reads_backend(self):
+        cache = self.get_cache(ttl=60)
+        cache.put('key', 'value')
+        cache.namespace.tier.invalidate()
+        assert cache.get('key') == 'value'
+        assert cache.namespace.tier.misses == 1
+        assert cache.get('key') == 'value'
+        assert cache.namespace.tier.hits == 1
+
+    def test_remove(self):
+        cache = self.get_cache(ttl=60)
+        cache.put('key', 'value')
+        assert cache.get('key') == 'value'
+        self.manager.get_cache(self.namespace).remove('key')
+        assert len(cache.namespace.tier) == 0
+        self.assertRaises(KeyError, cache.get, 'key')
+
+    def test_shared_tier(self):
+        cache = self.get_cache(ttl=60)
+        other = local_tier(self.manager.get_cache(self.namespace, expire=60),
+                           ttl=60)
+        assert other is not cache
+        assert other.namespace.tier is cache.namespace.tier
+        cache.put('key', 'value')
+        other.remove('key')
+        self.assertRaises(KeyError, cache.get, 'key')
+
+    def test_clear(self):
+        cache = self.get_cache(ttl=60)
+        cache.put('key', 'value')
+        cache.clear()
+        assert len(cache.namespace.tier) == 0
+
+    def test_backend_expiration(self):
+        cache = self.get_cache(ttl=60)
+        cache.put('key', 'value', expiretime=0.2)
+        assert cache.get('key') == 'value'
+        time.sleep(0.3)
+        self.assertRaises(KeyError, cache.get, 'key')
+
+    def test_memory_backend(self):
+        cache = self.manager.get_cache(self.namespace, type='memory')
+        assert local_tier(cache, 60) is cache
+        assert not local_tiers
+
+    def test_apply_config(self):
+        cache = self.manager.get_cache(self.namespace)
+        apply_local_tier(cache, {})
+        assert not local_tiers
+        apply_local_tier(cache, {'pylons.cache_local_ttl': '30',
+                                 'pylons.cache_local_max_entries': '5'})
+        tier = cache.namespace.tier
+        assert tier.ttl == 30
+        assert tier.max_entries == 5
+        assert tier.max_size is None
+
+
+class TestLocalTierLimits(TestCase):
+    def test_ttl(self):
+        tier = LocalTier(0.1)
+        tier.put('key', (time.time(), None, 'value'))
+        assert tier.get('key')[2] == 'value'
+        time.sleep(0.2)
+        self.assertRaises(KeyError, tier.get, 'key')
+        assert len(tier) == 0
+
+    def test_max_entries(self):
+        tier = LocalTier(60, max_entries=2)
+        tier.put('a', 1)
+        tier.put('b', 2)
+        tier.get('a')
+        tier.put('c', 3)
+        assert sorted(tier._entries) == ['a', 'c']
+
+    def test_max_size(self):
+        tier = LocalTier(60, max_size=2000)
+        tier.put('a', 'x' * 900)
+        tier.put('b', 'x' * 900)
+        tier.put('c', 'x' * 900)
+        assert sorted(tier._entries) == ['b', 'c']
+        assert tier.size <= 2000
+        tier.put('d', 'x' * 3000)
+        assert 'd' not in tier._entries
+        tier.invalidate()
+        assert tier.size == 0
+
+
+class TestTagGenerations(TestCase):
+    def test_generations(self):
+        manager = CacheManager(type='memory')
+        tag = namespaces.next()
+        generations = tag_generations(manager, [tag, 'other'])
+        assert generations == {tag: 0, 'other': 0}
+        assert tags_current(manager, generations)
+        assert tags_current(manager, {})
+        new_tag_generations(manager, [tag])
+        assert not tags_current(manager, generations)
+        generations = tag_generations(manager, [tag])
+        assert generations[tag]
+        new_tag_generations(manager, [tag])
+        assert tag_generations(manager, [tag])[tag] > generations[tag]
+
+
+class TestCacheStats(TestCase):
+    def setUp(self):
+        reset_cache_stats()
+
+    def tearDown(self):
+        reset_cache_stats()
+
+    def test_counters(self):
+        stats = get_cache_stats('ns')
+        assert get_cache_stats('ns') is stats
+        assert stats.hit_ratio == 0
+        assert stats.saved_time == 0
+        stats.misses += 1
+        stats.regenerated(0.2, 'x' * 1000)
+        stats.hits += 3
+        stats.regenerated(0.4, 'x' * 10)
+        assert stats.hit_ratio == 0.75
+        assert abs(stats.saved_time - 0.9) < 1e-9
+        assert 10 < stats.size < 1000
+
+    def test_report(self):
+        get_cache_stats('cheap').regenerated(0.001, 'x')
+        get_cache_stats('cheap').hits += 1
+        get_cache_stats('costly').regenerated(1, 'x')
+        get_cache_stats('costly').hits += 1
+        lines = format_cache_stats().splitlines()
+        assert lines[0].split() == ['hits', 'misses', 'hit%', 'regens',
+                                    'regen', 'ms', 'size', 'saved', 's',
+                                    'namespace']
+        assert lines[1].endswith('costly')
+        assert lines[1].split()[:5] == ['1', '0', '100.0', '1', '1000.0']
+        assert lines[2].endswith('cheap')
+        lines = format_cache_stats(['cheap', 'other']).splitlines()
+        assert len(lines) == 3
+        assert 'other' in namespace_stats
+
+
+class Markup(unicode):
+    pass
+
+
+class TestValueCodec(TestCase):
+    def roundtrip(self, content, codec=None, **meta):
+        codec = codec or ValueCodec()
+        value = dict(status='200 OK', cookies=None, content=content,
+                     headers=[('Content-Type', 'text/html; charset=utf-8'),
+                              ('X-Test', 'a:b')], **meta)
+        data = codec.encode(value)
+        assert isinstance(data, str)
+        assert data.startswith(codec.magic)
+        decoded = codec.decode(data)
+        assert decoded == value, decoded
+        assert decoded['content'].__class__ is content.__class__
+        return data
+
+    def test_str(self):
+        data = self.roundtrip('Hello')
+        assert data.endswith('Hello')
+
+    def test_unicode(self):
+        data = self.roundtrip(u'Hello \u2603')
+        assert data.endswith(u'Hello \u2603'.encode('utf-8'))
+
+    def test_pickled(self):
+        self.roundtrip(Markup(u'<b>Hello</b>'))
+        self.roundtrip(['a', 1, {'b': 2}])
+
+    def test_none(self):
+        value = ValueCodec().decode(ValueCodec().encode(dict(content=None)))
+        assert value == dict(content=None, cookies=None, headers=[])
+
+    def test_metadata(self):
+        self.roundtrip('Hello', created=1.5, tags={'user:1': 2.5},
+                       etag='abc')
+        self.roundtrip('Hello', other=Markup(u'x'))
+
+    def test_compressed(self):
+        content = 'Hello ' * 1000
+        data = self.roundtrip(content)
+        assert len(data) < len(content) / 10
+        data = self.roundtrip(content, codec=ValueCodec(None))
+        assert len(data) > len(content)
+        compressed = self.roundtrip(u'Hello ' * 10, codec=ValueCodec(10))
+        data = self.roundtrip(u'Hello ' * 10, codec=ValueCodec(None))
+        assert len(compressed) < len(data)
+
+    def test_versions(self):
+        codec = ValueCodec()
+        value = dict(status='200 OK', headers=[], content='Hello')
+        assert codec.decode(value) is value
+        data = codec.encode(value)
+        newer = ValueCodec()
+        newer.version = 2
+        assert newer.decode(data) is None
+
+
+WARM_URLS = ['/a', ('/b', {'Accept-Language': 'fr'})]
+
+
+def warm_urls():
+    return ['/c']
+
+
+class TestWarmCache(TestCase):
+    def setUp(self):
+        self.requests = []
+        self.threads = set()
+
+    def app(self, environ, start_response):
+        assert environ['pylons.warmcache']
+        self.requests.append((environ['PATH_INFO'],
+                              environ.get('HTTP_ACCEPT_LANGUAGE')))
+        self.threads.add(threading.currentThread().getName())
+        if environ['PATH_INFO'] == '/error':
+            raise Exception('Error')
+        time.sleep(0.01)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return ['Hello']
+
+    def test_warm_list(self):
+        assert warm_list(None) == []
+        assert warm_list(['/a']) == ['/a']
+        assert warm_list("""
+            # Pages
+            /
+            /page?id=1
+            %s:WARM_URLS
+            %s:warm_urls
+            """ % (__name__, __name__)) == ['/', '/page?id=1'] + \
+            WARM_URLS + ['/c']
+
+    def test_warm_cache(self):
+        results = warm_cache(self.app, WARM_URLS + ['/error'])
+        assert [(url, status) for url, status, seconds in results] == \
+            [('/a', '200 OK'), (WARM_URLS[1], '200 OK'), ('/error', None)]
+        assert self.requests == [('/a', None), ('/b', 'fr'),
+                                 ('/error', None)]
+        assert len(self.threads) == 1
+        report = format_warm_report(results).splitlines()
+        assert report[0].endswith('200   /a')
+        assert report[2].endswith('error /error')
+        assert report[3].startswith('3 URLs in ')
+        assert report[3].endswith('1 errors')
+
+    def test_concurrency(self):
+        urls = ['/%s' % i for i in range(20)]
+        results = warm_cache(self.app, urls, concurrency=4)
+        assert [result[0] for result in results] == urls
+        assert sorted(self.requests) == sorted((url, None) for url in urls)
+        assert len(self.threads) > 1
+        assert threading.currentThread().getName() not in self.threads
@@ -0,0 +1,82 @@
+from paste.registry import Registry
+from webob import Request
+
+import pylons
+from pylons.context import PylonsContext, bind_context, get_context
+
+from test_basic_app import make_app
+
+
+class TestPylonsContext(object):
+    def test_lazy_member(self):
+        created = []
+        def factory(pylons_obj):
+            created.append(pylons_obj)
+            return 'translator'
+        pylons_obj = PylonsContext()
+        pylons_obj._lazy_members = dict(translator=factory)
+        assert not created
+        assert pylons_obj.translator == 'translator'
+        assert pylons_obj.translator == 'translator'
+        assert created == [pylons_obj]
+
+    def test_missing_member(self):
+        pylons_obj = PylonsContext()
+        pylons_obj._lazy_members = {}
+        assert not hasattr(pylons_obj, 'translator')
+        assert not hasattr(PylonsContext(), 'translator')
+
+    def test_bound_context(self):
+        pylons_obj = PylonsContext()
+        pylons_obj.tmpl_context = 'c'
+        previous = bind_context(pylons_obj)
+        try:
+            assert get_context() is pylons_obj
+            assert pylons.tmpl_context._current_obj() == 'c'
+        finally:
+            bind_context(previous)
+        assert get_context() is previous
+
+    def test_registered_lazy_member(self):
+        pylons_obj = PylonsContext()
+        pylons_obj._lazy_members = dict(translator=lambda obj: 'translator')
+        registry = Registry()
+        registry.prepare()
+        registry.register(pylons.translator, pylons_obj)
+        try:
+            assert pylons.translator._current_obj() == 'translator'
+            assert 'translator' in pylons_obj.__dict__
+        finally:
+            registry.cleanup()
+
+
+class TestLazyMembers(object):
+    # Called without paste.fixture/webtest, as the testing variables
+    # include the lazy members
+    def test_unused_members(self):
+        app = make_app({})
+        resp = Request.blank('/hello/lazy_members').get_response(app)
+        assert resp.body == ''
+
+    def test_unused_members_registry_free(self):
+        app = make_app({}, **{'pylons.use_registry': 'false'})
+        resp = Request.blank('/hello/lazy_members').get_response(app)
+        assert resp.body == ''
+
+    def test_used_members(self):
+        from paste.fixture import TestApp
+        app = TestApp(make_app({}))
+        resp = app.get('/hello/lazy_members')
+        assert resp.body == 'tmpl_context'
+
+
+class TestRequestAttributes(object):
+    def test_attributes(self):
+        app = make_app({})
+        resp = Request.blank('/hello/request_attrs').get_response(app)
+        assert resp.body == 'en-us True request_attrs True True'
+
+    def test_attributes_registry_free(self):
+        app = make_app({}, **{'pylons.use_registry': 'false'})
+        resp = Request.blank('/hello/request_attrs').get_response(app)
+        assert resp.body == 'en-us True request_attrs True True'
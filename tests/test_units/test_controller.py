@@ -30,6 +30,29 @@ class BasicWSGIController(WSGIController):
                 x += 1
         return its()
     
+    def stream_length(self):
+        pylons.response.content_length = 6
+        def its():
+            yield 'abc'
+            yield 'def'
+        return its()
+
+    def stream_unicode(self):
+        def its():
+            yield u'caf\xe9 '
+            yield pylons.request.params.get('name', u'')
+        return its()
+
+    def stream_close(self):
+        closed = self._py_object.tmpl_context.closed = []
+        def its():
+            try:
+                yield 'first'
+                yield 'second'
+            finally:
+                closed.append(True)
+        return its()
+
     def strme(self):
         return "hi there"
     
@@ -57,6 +80,14 @@ class BasicWSGIController(WSGIController):
     def list(self):
         return ['from', ' a ', 'list']
 
+    def append_string(self):
+        pylons.response.body = 'Hello '
+        return 'World'
+
+    def append_unicode(self):
+        pylons.response.body = 'Hello '
+        return u'caf\xe9'
+
 class FilteredWSGIController(WSGIController):
     def __init__(self):
         self.before = 0
@@ -102,6 +133,38 @@ class TestBasicWSGI(TestWSGIController):
         resp = self.get_response(action='yield_fun')
         assert 'hi' * 100 in resp
 
+    def test_stream_content_length(self):
+        resp = self.get_response(action='stream_length')
+        assert resp.body == 'abcdef'
+        assert resp.header('Content-Length') == '6'
+
+    def test_append_body(self):
+        resp = self.get_response(action='append_string')
+        assert resp.body == 'Hello World'
+        assert resp.header('Content-Length') == '11'
+        resp = self.get_response(action='append_unicode')
+        assert resp.body == 'Hello caf\xc3\xa9'
+        assert resp.header('Content-Length') == '11'
+
+    def test_stream_unicode_globals(self):
+        resp = self.get_response(action='stream_unicode', _url='/?name=Fred')
+        assert resp.body == 'caf\xc3\xa9 Fred'
+
+    def test_stream_close(self):
+        from webob import Request
+        from pylons.controllers.core import StreamingIter
+        self.environ['pylons.routes_dict']['action'] = 'stream_close'
+        environ = Request.blank('/').environ
+        environ.update(self.baseenviron)
+        app = ControllerWrap(BasicWSGIController)
+        app = SetupCacheGlobal(app, self.baseenviron)
+        app = RegistryManager(app)
+        app_iter = app(environ, lambda status, headers, exc_info=None: None)
+        assert isinstance(app_iter, StreamingIter)
+        assert app_iter.next() == 'first'
+        app_iter.close()
+        assert environ['pylons.pylons'].tmpl_context.closed == [True]
+
     def test_404(self):
         self.environ['paste.config']['global_conf']['debug'] = False
         self.environ['pylons.routes_dict']['action'] = 'notthere'
@@ -199,3 +262,88 @@ class TestFilteredWSGI(TestWSGIController):
     def test_start_response(self):
         self.baseenviron['pylons.routes_dict']['action'] = 'start_response'
         self.app.get('/', status=404)
+
+class ArgsWSGIController(WSGIController):
+    def show(self, id, format='html'):
+        return 'id is %s' % id
+
+    def _hidden(self):
+        return 'hidden'
+
+class InstanceFilteredWSGIController(WSGIController):
+    def __init__(self):
+        self.__before__ = self.set_header
+        self.__after__ = self.set_cookie
+
+    def set_header(self):
+        pylons.response.headers['X-Before'] = 'yes'
+
+    def set_cookie(self):
+        pylons.response.set_cookie('after', 'yes')
+
+    def index(self):
+        return 'hi'
+
+class TestInstanceFilteredWSGI(TestWSGIController):
+    def __init__(self, *args, **kargs):
+        TestWSGIController.__init__(self, *args, **kargs)
+        self.baseenviron = {}
+        app = ControllerWrap(InstanceFilteredWSGIController)
+        app = self.sap = SetupCacheGlobal(app, self.baseenviron)
+        app = RegistryManager(app)
+        self.app = TestApp(app)
+
+    def setUp(self):
+        TestWSGIController.setUp(self)
+        self.baseenviron.update(self.environ)
+
+    def test_instance_before_after(self):
+        plan = InstanceFilteredWSGIController._get_dispatch_plan()
+        assert not plan.has_before and not plan.has_after
+        resp = self.get_response(action='index')
+        assert 'hi' in resp
+        assert resp.header('X-Before') == 'yes'
+        assert 'after=yes' in resp.header('Set-Cookie')
+
+class TestDispatchPlan(TestWSGIController):
+    def __init__(self, *args, **kargs):
+        TestWSGIController.__init__(self, *args, **kargs)
+        self.baseenviron = {}
+        app = ControllerWrap(ArgsWSGIController)
+        app = self.sap = SetupCacheGlobal(app, self.baseenviron)
+        app = RegistryManager(app)
+        self.app = TestApp(app)
+
+    def setUp(self):
+        TestWSGIController.setUp(self)
+        self.baseenviron.update(self.environ)
+
+    def test_plan_actions(self):
+        plan = ArgsWSGIController._get_dispatch_plan()
+        assert plan is ArgsWSGIController._get_dispatch_plan()
+        assert plan.actions['show'] == (False, ('id', 'format'))
+        assert '_hidden' not in plan.actions
+        assert 'start_response' not in plan.actions
+        assert not plan.has_before and not plan.has_after
+
+    def test_plan_per_class(self):
+        assert BasicWSGIController._get_dispatch_plan().has_before
+        assert not ArgsWSGIController._get_dispatch_plan().has_before
+
+    def test_action_args(self):
+        resp = self.get_response(action='show', id='42')
+        assert 'id is 42' in resp
+
+    def test_find_action(self):
+        controller = ArgsWSGIController()
+        assert controller._find_action('show') == controller.show
+        assert controller._find_action('missing') is None
+        assert controller._find_action('start_response') is None
+        controller.extra = lambda: 'extra'
+        assert controller._find_action('extra') is controller.extra
+        controller.show = lambda id: 'instance show'
+        assert controller._find_action('show') is controller.show
+
+    def test_hidden_action(self):
+        self.baseenviron['pylons.routes_dict']['action'] = '_hidden'
+        self.app.get('/', status=404)
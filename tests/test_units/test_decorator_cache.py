@@ -1,5 +1,6 @@
 import os
 import shutil
+import threading
 import time
 
 from webtest import TestApp
@@ -15,11 +16,17 @@ sap = None
 def make_cache_controller():
     global sap
     import pylons
-    from pylons.decorators.cache import beaker_cache, create_cache_key
+    from pylons.decorators.cache import beaker_cache, create_cache_key, \
+        get_request_memo, invalidate_tags, request_memoize
 
     from pylons.controllers import WSGIController, XMLRPCController
     from pylons.testutil import SetupCacheGlobal, ControllerWrap
     
+    @request_memoize
+    def memoized(value, other=None):
+        pylons.app_globals.counter += 1
+        return '%s-%s' % (value, other)
+
     class CacheController(WSGIController):
         @beaker_cache(key=None, invalidate_on_startup=True)
         def test_default_cache_decorator_invalidate(self):
@@ -79,6 +86,112 @@ def make_cache_controller():
             pylons.app_globals.counter += 1
             return 'Counter=%s, id=%s' % (pylons.app_globals.counter, id)
 
+        @beaker_cache(key="id")
+        def test_region_cache_decorator(self, id):
+            return 'id=%s' % id
+
+        @beaker_cache(key=None, expire=1, stale_ttl=30,
+                      invalidate_on_startup=True)
+        def test_stale_cache_decorator(self):
+            pylons.app_globals.counter += 1
+            return 'Counter=%s' % pylons.app_globals.counter
+
+        @beaker_cache(key=None, expire=1, lock=True, type='dbm',
+                      invalidate_on_startup=True)
+        def test_lock_cache_decorator(self):
+            pylons.app_globals.counter += 1
+            return 'Counter=%s' % pylons.app_globals.counter
+
+        @beaker_cache(key=None, type='dbm')
+        def test_local_cache_decorator(self):
+            pylons.app_globals.counter += 1
+            return 'Counter=%s' % pylons.app_globals.counter
+
+        def test_invalidate_local_cache(self):
+            ns, key = create_cache_key(CacheController.test_local_cache_decorator)
+            pylons.cache.get_cache(ns, type='dbm').remove(key)
+
+        @beaker_cache(key="id", tags=lambda self, id: ['user:%s' % id])
+        def test_tags_cache_decorator(self, id):
+            pylons.app_globals.counter += 1
+            return 'Counter=%s, id=%s' % (pylons.app_globals.counter, id)
+
+        @beaker_cache(key=None, tags=['user:1', 'users'])
+        def test_static_tags_cache_decorator(self):
+            pylons.app_globals.counter += 1
+            return 'Counter=%s' % pylons.app_globals.counter
+
+        @beaker_cache(key="id", type='dbm',
+                      tags=lambda self, id: ['team:%s' % id])
+        def test_dbm_tags_cache_decorator(self, id):
+            pylons.app_globals.counter += 1
+            return 'Counter=%s, id=%s' % (pylons.app_globals.counter, id)
+
+        def test_invalidate_tags(self, tag):
+            invalidate_tags(tag)
+
+        @beaker_cache(key=None, full_response=True, vary=('Accept-Language',))
+        def test_full_response_cache_decorator(self):
+            pylons.app_globals.counter += 1
+            pylons.response.headers['Content-Type'] = 'text/plain'
+            pylons.response.headers['Vary'] = 'Cookie'
+            pylons.response.set_cookie('tracking', 'abc')
+            return u'Counter=%s \u2603' % pylons.app_globals.counter
+
+        def test_invalidate_full_response(self):
+            ns, key = create_cache_key(
+                CacheController.test_full_response_cache_decorator,
+                {'Vary-Accept-Language': ''})
+            pylons.cache.get_cache(ns).remove(key + ' body')
+
+        def test_request_memoize(self):
+            results = [memoized(1), memoized(1), memoized(2),
+                       memoized(1, other=3), memoized(1, other=3),
+                       memoized([])]
+            memo = get_request_memo()
+            return '%s %s hits=%s misses=%s' % (
+                ' '.join(results), pylons.app_globals.counter, memo.hits,
+                memo.misses)
+
+        @request_memoize
+        def _memoized_method(self, value):
+            pylons.app_globals.counter += 1
+            return value
+
+        def test_request_memoize_method(self):
+            self._memoized_method(1)
+            self._memoized_method(1)
+            return 'Counter=%s' % pylons.app_globals.counter
+
+        def test_lock_held(self):
+            ns, key = create_cache_key(CacheController.test_lock_cache_decorator)
+            c = pylons.cache.get_cache(ns, type='dbm')
+            creation_lock = c.namespace.get_creation_lock(key)
+            held, done = threading.Event(), threading.Event()
+            def hold():
+                creation_lock.acquire()
+                held.set()
+                done.wait()
+                creation_lock.release()
+            # Another worker holds the lock
+            thread = threading.Thread(target=hold)
+            thread.start()
+            held.wait()
+            try:
+                return self.test_lock_cache_decorator()
+            finally:
+                done.set()
+                thread.join()
+
+        def test_lock_stored_expiretime(self):
+            ns, key = create_cache_key(CacheController.test_lock_cache_decorator)
+            namespace = pylons.cache.get_cache(ns, type='dbm').namespace
+            namespace.acquire_read_lock()
+            try:
+                return 'expiretime=%s' % namespace[key][1]
+            finally:
+                namespace.release_read_lock()
+
         @beaker_cache(key=["id", "id2"])
         def test_keyslist_cache_decorator(self, id, id2="123"):
             pylons.app_globals.counter += 1
@@ -94,6 +207,11 @@ def make_cache_controller():
             c = pylons.cache.get_cache(ns, type='dbm')
             c.remove_value(key)
 
+        def test_dbm_cache_raw(self):
+            ns, key = create_cache_key(CacheController.test_dbm_cache_decorator)
+            c = pylons.cache.get_cache(ns, type='dbm')
+            return c.get_value(key)
+
         @beaker_cache(cache_headers=('content-type','content-length', 'x-powered-by'))
         def test_header_cache(self):
             pylons.response.headers['Content-Type'] = 'application/special'
@@ -226,6 +344,8 @@ class TestCacheDecorator(TestWSGIController):
         self.get_response(action="test_invalidate_dbm_cache")
         response = self.get_response(action="test_dbm_cache_decorator")
         assert "Counter=2" in response
+        response = self.get_response(action="test_dbm_cache_raw")
+        assert response.body.startswith('PyC')
 
         sap.g.counter = 0
         response = self.get_response(action="test_expire_dbm_cache_decorator")
@@ -282,3 +402,198 @@ class TestCacheDecorator(TestWSGIController):
         response = self.get_response(action='test_default_cache_decorator')
         assert 'Counter=2' in response
         pylons.config['cache_enabled'] = 'True'
+
+    def test_cache_key_sorted(self):
+        from pylons.decorators.cache import create_cache_key
+        def func():
+            pass
+        key_dict = dict(('arg%s' % i, i) for i in range(20))
+        namespace, key = create_cache_key(func, key_dict)
+        assert key == 'func ' + ' '.join('%s=%s' % item for item in sorted(key_dict.items()))
+
+    def test_cache_key_hashed(self):
+        from hashlib import sha1
+        from pylons.decorators.cache import create_cache_key
+        def func():
+            pass
+        namespace, key = create_cache_key(func, {'id': 'x' * 300}, max_key_length=250)
+        assert key == sha1('func id=' + 'x' * 300).hexdigest()
+        namespace, key = create_cache_key(func, {'id': 'x'}, max_key_length=250)
+        assert key == 'func id=x'
+
+    def test_cache_resolved_once(self):
+        sap.g.counter = 0
+        calls = []
+        from beaker.cache import CacheManager
+        original = CacheManager.get_cache
+        def counting_get_cache(self, name, **kwargs):
+            calls.append(name)
+            return original(self, name, **kwargs)
+        CacheManager.get_cache = counting_get_cache
+        try:
+            self.get_response(action='test_region_cache_decorator', id=1)
+            self.get_response(action='test_region_cache_decorator', id=2)
+            self.get_response(action='test_region_cache_decorator', id=3)
+        finally:
+            CacheManager.get_cache = original
+        assert len(calls) == 1
+
+    def test_stale_cache(self):
+        sap.g.counter = 0
+        response = self.get_response(action='test_stale_cache_decorator')
+        assert 'Counter=1' in response
+        time.sleep(1.1)
+        # The stale copy is served while it's regenerated in the background
+        response = self.get_response(action='test_stale_cache_decorator')
+        assert 'Counter=1' in response
+        for i in range(50):
+            if sap.g.counter == 2:
+                break
+            time.sleep(0.05)
+        time.sleep(0.1)
+        response = self.get_response(action='test_stale_cache_decorator')
+        assert 'Counter=2' in response
+        assert sap.g.counter == 2
+
+    def test_lock_cache(self):
+        sap.g.counter = 0
+        response = self.get_response(action='test_lock_cache_decorator')
+        assert 'Counter=1' in response
+        # Dropped from the backend once it can't be served anymore
+        response = self.get_response(action='test_lock_stored_expiretime')
+        assert 'expiretime=2' in response
+        time.sleep(1.1)
+        # The previous copy is served while the lock is held
+        response = self.get_response(action='test_lock_held')
+        assert 'Counter=1' in response
+        assert sap.g.counter == 1
+        response = self.get_response(action='test_lock_cache_decorator')
+        assert 'Counter=2' in response
+        response = self.get_response(action='test_lock_cache_decorator')
+        assert 'Counter=2' in response
+
+    def test_local_tier(self):
+        import pylons
+        from pylons.caching import local_tiers
+        sap.g.counter = 0
+        pylons.config['pylons.cache_local_ttl'] = '60'
+        try:
+            self.get_response(action='test_invalidate_local_cache')
+            response = self.get_response(action='test_local_cache_decorator')
+            assert 'Counter=1' in response
+            response = self.get_response(action='test_local_cache_decorator')
+            assert 'Counter=1' in response
+            tier = [tier for (namespace, cls), tier in local_tiers.items()
+                    if namespace.endswith('.CacheController')][0]
+            assert tier.hits
+            self.get_response(action='test_invalidate_local_cache')
+            response = self.get_response(action='test_local_cache_decorator')
+            assert 'Counter=2' in response
+        finally:
+            del pylons.config['pylons.cache_local_ttl']
+
+    def test_tags(self):
+        sap.g.counter = 0
+        self.get_response(action='test_invalidate_tags', tag='users')
+        response = self.get_response(action='test_tags_cache_decorator', id=1)
+        assert 'Counter=1' in response
+        response = self.get_response(action='test_tags_cache_decorator', id=2)
+        assert 'Counter=2' in response
+        response = self.get_response(action='test_static_tags_cache_decorator')
+        assert 'Counter=3' in response
+        response = self.get_response(action='test_tags_cache_decorator', id=1)
+        assert 'Counter=1' in response
+
+        self.get_response(action='test_invalidate_tags', tag='user:1')
+        response = self.get_response(action='test_tags_cache_decorator', id=1)
+        assert 'Counter=4' in response
+        response = self.get_response(action='test_tags_cache_decorator', id=2)
+        assert 'Counter=2' in response
+        response = self.get_response(action='test_static_tags_cache_decorator')
+        assert 'Counter=5' in response
+        response = self.get_response(action='test_tags_cache_decorator', id=1)
+        assert 'Counter=4' in response
+
+    def test_tags_across_managers(self):
+        from beaker.cache import CacheManager
+        from pylons.caching import TAGS_NAMESPACE, new_tag_generations
+        sap.g.counter = 0
+        # The cache manager of another process sharing the dbm backend
+        other = CacheManager(type='memory', data_dir=cache_dir)
+        self.get_response(action='test_invalidate_tags', tag='team:1')
+        generation = other.get_cache(TAGS_NAMESPACE, type='dbm').get('team:1')
+        response = self.get_response(action='test_dbm_tags_cache_decorator',
+                                     id=1)
+        assert 'Counter=1' in response
+
+        new_tag_generations(other, ['team:1'], 'dbm')
+        assert other.get_cache(TAGS_NAMESPACE,
+                               type='dbm').get('team:1') > generation
+        response = self.get_response(action='test_dbm_tags_cache_decorator',
+                                     id=1)
+        assert 'Counter=2' in response
+        response = self.get_response(action='test_dbm_tags_cache_decorator',
+                                     id=1)
+        assert 'Counter=2' in response
+
+    def test_stats(self):
+        from pylons.caching import namespace_stats
+        self.get_response(action='test_invalidate_tags', tag='users')
+        namespace_stats.clear()
+        response = self.get_response(action='test_static_tags_cache_decorator')
+        response = self.get_response(action='test_static_tags_cache_decorator')
+        self.get_response(action='test_invalidate_tags', tag='users')
+        response = self.get_response(action='test_static_tags_cache_decorator')
+        [(namespace, stats)] = namespace_stats.items()
+        assert namespace.endswith('.CacheController')
+        assert stats.hits == 1
+        assert stats.misses == 2
+        assert stats.regenerations == 2
+        assert stats.regen_time > 0
+        assert stats.size > len(response.body)
+
+    def test_full_response(self):
+        sap.g.counter = 0
+        response = self.get_response(action='test_full_response_cache_decorator')
+        assert response.body == u'Counter=1 \u2603'.encode('utf-8')
+        etag = response.headers['ETag']
+        assert etag.startswith('"') and len(etag) == 42
+        assert response.headers['Vary'] == 'Cookie, Accept-Language'
+        assert 'Set-Cookie' in response.headers
+
+        response = self.get_response(action='test_full_response_cache_decorator')
+        assert 'Counter=1' in response
+        assert response.headers['ETag'] == etag
+        assert response.headers['Content-Type'] == 'text/plain'
+        assert 'Set-Cookie' not in response.headers
+
+        response = self.get_response(
+            action='test_full_response_cache_decorator',
+            test_args=dict(headers={'If-None-Match': etag}, status=304))
+        assert response.status_int == 304
+        assert response.headers['ETag'] == etag
+        assert not response.body
+        assert sap.g.counter == 1
+
+        response = self.get_response(
+            action='test_full_response_cache_decorator',
+            test_args=dict(headers={'Accept-Language': 'fr'}))
+        assert 'Counter=2' in response
+        assert response.headers['ETag'] != etag
+
+        # A missing body is regenerated
+        self.get_response(action='test_invalidate_full_response')
+        response = self.get_response(action='test_full_response_cache_decorator')
+        assert 'Counter=3' in response
+        assert response.headers['ETag'] != etag
+
+    def test_request_memoize(self):
+        sap.g.counter = 0
+        response = self.get_response(action='test_request_memoize')
+        assert response.body == ('1-None 1-None 2-None 1-3 1-3 []-None 4 '
+                                 'hits=2 misses=3'), response.body
+        # Each request has its own memo
+        response = self.get_response(action='test_request_memoize')
+        assert ' 8 hits=2 misses=3' in response
+        response = self.get_response(action='test_request_memoize_method')
+        assert 'Counter=9' in response
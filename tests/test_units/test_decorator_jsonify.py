@@ -53,3 +53,23 @@ class TestJsonifyDecorator(TestWSGIController):
         response = self.get_response(action='test_good_json')
         assert '{"fred": 42}' in response
         assert response.header('Content-Type') == 'application/json; charset=utf-8'
+
+
+def test_json_encoder():
+    import simplejson
+    from pylons.decorators import JSONEncoder
+
+    class Point(object):
+        def __json__(self):
+            return [1, 2]
+
+    class SetEncoder(JSONEncoder):
+        def default(self, obj):
+            if isinstance(obj, set):
+                return sorted(obj)
+            return super(SetEncoder, self).default(obj)
+
+    assert simplejson.dumps(Point(), cls=JSONEncoder) == '[1, 2]'
+    assert simplejson.dumps([set([2, 1]), Point()], cls=SetEncoder) == \
+        '[[1, 2], [1, 2]]'
+    assert isinstance(SetEncoder(), simplejson.JSONEncoder)
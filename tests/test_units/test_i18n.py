@@ -55,3 +55,70 @@ class TestI18N(object):
         pylons.translator._push_object(t)
         assert Bar().local_foo == u'¡Hola!'
         assert foo == 'Hello'
+
+
+class TestTranslatorCache(object):
+    def setUp(self):
+        from pylons.i18n.translation import TranslatorCache
+        self.cache = TranslatorCache(max_entries=2)
+        self.localedir = os.path.join(test_root, 'sample_controllers', 'i18n')
+
+    def test_copies(self):
+        t1 = self.cache.get('sample_controllers', self.localedir, ['fr'])
+        t2 = self.cache.get('sample_controllers', self.localedir, ['fr'])
+        assert t1 is not t2
+        assert t1.ugettext('Hello') == t2.ugettext('Hello') == 'Bonjour'
+
+    def test_fallback_not_shared(self):
+        t1 = self.cache.get('sample_controllers', self.localedir, ['fr', 'ja'])
+        t1.add_fallback(self.cache.get('sample_controllers', self.localedir, ['es']))
+        t2 = self.cache.get('sample_controllers', self.localedir, ['fr', 'ja'])
+        assert t2._fallback._fallback is None
+
+    def test_missing(self):
+        from nose.tools import assert_raises
+        assert_raises(IOError, self.cache.get, 'sample_controllers',
+                      self.localedir, ['ch'])
+        assert_raises(IOError, self.cache.get, 'sample_controllers',
+                      self.localedir, ['ch'])
+        t = self.cache.get('sample_controllers', self.localedir, ['ch'],
+                           fallback=True)
+        assert t.ugettext('Hello') == 'Hello'
+
+    def test_bounded(self):
+        self.cache.warm('sample_controllers', self.localedir)
+        assert len(self.cache._entries) == 2
+        assert ('sample_controllers', self.localedir, ('ja',), None, False,
+                None) in self.cache._entries
+
+    def test_check_files(self):
+        mofile = os.path.join(self.localedir, 'fr', 'LC_MESSAGES',
+                              'sample_controllers.mo')
+        self.cache.check_files = True
+        t1 = self.cache.get('sample_controllers', self.localedir, ['fr'])
+        catalog = self.cache._entries.values()[0][1][0]
+        mtime = os.path.getmtime(mofile)
+        os.utime(mofile, (mtime, mtime - 10))
+        try:
+            t2 = self.cache.get('sample_controllers', self.localedir, ['fr'])
+        finally:
+            os.utime(mofile, (mtime, mtime))
+        assert self.cache._entries.values()[0][1][0] is not catalog
+        assert t2.ugettext('Hello') == 'Bonjour'
+
+    def test_check_files_argument(self):
+        mofile = os.path.join(self.localedir, 'fr', 'LC_MESSAGES',
+                              'sample_controllers.mo')
+        self.cache.get('sample_controllers', self.localedir, ['fr'])
+        catalog = self.cache._entries.values()[0][1][0]
+        mtime = os.path.getmtime(mofile)
+        os.utime(mofile, (mtime, mtime - 10))
+        try:
+            self.cache.get('sample_controllers', self.localedir, ['fr'])
+            assert self.cache._entries.values()[0][1][0] is catalog
+            self.cache.get('sample_controllers', self.localedir, ['fr'],
+                           check_files=True)
+        finally:
+            os.utime(mofile, (mtime, mtime))
+        assert self.cache._entries.values()[0][1][0] is not catalog
+        assert not self.cache.check_files
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+
+from __init__ import pylons_root
+
+# Modules only needed for project creation, paster commands, or by
+# features that import them on first use
+DEFERRED_MODULES = ['formencode', 'simplejson', 'tempita', 'paste.script',
+                    'webhelpers', 'pylons.scaffolding', 'pylons.templating']
+
+
+def imported_modules(*names):
+    code = 'import sys\n%s\nprint "\\n".join(sys.modules)' % '\n'.join(
+        'import %s' % name for name in names)
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=pylons_root,
+                            stdout=subprocess.PIPE)
+    output = proc.communicate()[0]
+    assert proc.returncode == 0
+    return set(output.split())
+
+
+def check_deferred(*names):
+    modules = imported_modules(*names)
+    loaded = [name for name in DEFERRED_MODULES if name in modules]
+    assert not loaded, '%s imported by %s' % (', '.join(loaded),
+                                              ', '.join(names))
+
+
+def test_import_pylons():
+    check_deferred('pylons')
+
+
+def test_import_wsgiapp():
+    check_deferred('pylons.wsgiapp')
+
+
+def test_import_controllers():
+    check_deferred('pylons.controllers', 'pylons.decorators',
+                   'pylons.decorators.rest', 'pylons.util')
+
+
+def test_version():
+    import pylons
+    assert pylons.__version__
+
+
+def test_scaffolding_classes():
+    from pylons import scaffolding, util
+
+    class CustomTemplate(util.PylonsTemplate):
+        summary = 'Custom template'
+
+    template = CustomTemplate('custom')
+    assert isinstance(template, CustomTemplate)
+    assert isinstance(template, scaffolding.PylonsTemplate)
+    assert template.summary == 'Custom template'
+    assert template.egg_plugins == ['PasteScript', 'Pylons']
+    assert util.MinimalPylonsTemplate.summary == \
+        scaffolding.MinimalPylonsTemplate.summary
+    assert issubclass(util.PylonsInstaller._combined(),
+                      scaffolding.PylonsInstaller)
@@ -48,3 +48,208 @@ def test_retains_request():
         assert 'pylons.original_request' in res.environ
         assert '/fredrick' == res.environ['pylons.original_request'].path_info
     
+
+class ClosingIter(object):
+    def __init__(self, environ, start_response, status):
+        self.start_response = start_response
+        self.status = status
+        self.produced = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.produced == 0:
+            self.start_response(self.status, [('Content-type', 'text/plain')])
+        elif self.produced == 3:
+            raise StopIteration
+        self.produced += 1
+        return 'chunk%s ' % self.produced
+
+    def close(self):
+        self.closed = True
+
+def test_streams_success():
+    from pylons.middleware import StatusCodeRedirect
+    iters = []
+    def streaming_app(environ, start_response):
+        iters.append(ClosingIter(environ, start_response, '200 OK'))
+        return iters[0]
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/'}
+    statuses = []
+    app_iter = StatusCodeRedirect(streaming_app)(
+        environ, lambda status, headers, exc_info=None: statuses.append(status))
+    assert app_iter.next() == 'chunk1 '
+    assert statuses == ['200 OK']
+    assert iters[0].produced == 1
+    assert list(app_iter) == ['chunk2 ', 'chunk3 ']
+    app_iter.close()
+    assert iters[0].closed
+
+def test_reads_success_under_registry():
+    from paste.registry import Registry
+    from pylons.middleware import StatusCodeRedirect
+    iters = []
+    def streaming_app(environ, start_response):
+        iters.append(ClosingIter(environ, start_response, '200 OK'))
+        return iters[0]
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/',
+               'paste.registry': Registry()}
+    app_iter = StatusCodeRedirect(streaming_app)(
+        environ, lambda status, headers, exc_info=None: None)
+    assert app_iter == ['chunk1 ', 'chunk2 ', 'chunk3 ']
+    assert iters[0].closed
+
+    del iters[:]
+    environ['pylons.stream_response'] = True
+    app_iter = StatusCodeRedirect(streaming_app)(
+        environ, lambda status, headers, exc_info=None: None)
+    assert iters[0].produced == 1
+    assert list(app_iter) == ['chunk1 ', 'chunk2 ', 'chunk3 ']
+
+def test_streaming_status_intercept():
+    from pylons.middleware import StatusCodeRedirect
+    iters = []
+    def streaming_app(environ, start_response):
+        if environ['PATH_INFO'].startswith('/error/document'):
+            return simple_exception_app(environ, start_response)
+        iters.append(ClosingIter(environ, start_response, '404 Not Found'))
+        return iters[0]
+    app = TestApp(StatusCodeRedirect(streaming_app))
+    res = app.get('/', status=404)
+    assert 'Made it to the error' in res
+    assert iters[0].closed
+
+def test_bypass_redirect():
+    from pylons.middleware import StatusCodeRedirect
+    def bypass_app(environ, start_response):
+        environ['pylons.status_code_redirect'] = True
+        return simple_exception_app(environ, start_response)
+    app = TestApp(StatusCodeRedirect(bypass_app))
+    res = app.get('/', status=404)
+    assert 'No page found!' in res
+
+class CountingErrorApp(object):
+    def __init__(self, cookie=False, default=False, headers=()):
+        self.documents = 0
+        self.cookie = cookie
+        self.default = default
+        self.headers = list(headers)
+
+    def __call__(self, environ, start_response):
+        if environ['PATH_INFO'].startswith('/error/document'):
+            self.documents += 1
+            headers = [('Content-type', 'text/plain')]
+            if self.cookie:
+                headers.append(('Set-Cookie', 'session=1'))
+            start_response('200 OK', headers + self.headers)
+            return ['Error document %s %s %s' % (
+                self.documents, environ.get('HTTP_ACCEPT_LANGUAGE', ''),
+                environ['pylons.original_response'].body)]
+        if self.default:
+            from webob.exc import HTTPNotFound
+            return HTTPNotFound()(environ, start_response)
+        start_response('404 Not Found', [('Content-type', 'text/plain')])
+        return ['No page found! %s' % environ['QUERY_STRING']]
+
+def test_cached_error_document():
+    from pylons.middleware import StatusCodeRedirect
+    errors = CountingErrorApp()
+    app = TestApp(StatusCodeRedirect(errors, cache_ttl=60))
+    res = app.get('/one', status=404)
+    assert 'Error document 1' in res
+    res = app.get('/two', status=404)
+    assert 'Error document 1' in res
+    assert res.headers['Content-type'] == 'text/plain'
+    assert errors.documents == 1
+
+def test_cached_error_document_message():
+    from pylons.middleware import StatusCodeRedirect
+    errors = CountingErrorApp()
+    app = TestApp(StatusCodeRedirect(errors, cache_ttl=60))
+    res = app.get('/?first', status=404)
+    assert 'Error document 1  No page found! first' in res
+    res = app.get('/?second', status=404)
+    assert 'Error document 2  No page found! second' in res
+    res = app.get('/?first', status=404)
+    assert 'Error document 1  No page found! first' in res
+    assert errors.documents == 2
+
+def test_cached_error_document_expires():
+    from pylons.middleware import StatusCodeRedirect
+    errors = CountingErrorApp()
+    app = TestApp(StatusCodeRedirect(errors, cache_ttl=0))
+    app.get('/', status=404)
+    res = app.get('/', status=404)
+    assert 'Error document 2' in res
+
+def test_cached_error_document_vary():
+    from pylons.middleware import StatusCodeRedirect
+    errors = CountingErrorApp()
+    app = TestApp(StatusCodeRedirect(errors, cache_ttl=60,
+                                     cache_vary=['Accept-Language']))
+    app.get('/', headers={'Accept-Language': 'en'}, status=404)
+    res = app.get('/', headers={'Accept-Language': 'fr'}, status=404)
+    assert 'Error document 2 fr' in res
+    res = app.get('/', headers={'Accept-Language': 'en'}, status=404)
+    assert 'Error document 1 en' in res
+
+def test_cached_error_document_cookie():
+    from pylons.middleware import StatusCodeRedirect
+    errors = CountingErrorApp(cookie=True)
+    app = TestApp(StatusCodeRedirect(errors, cache_ttl=60))
+    app.get('/', status=404)
+    app.get('/', status=404)
+    assert errors.documents == 2
+
+def test_cached_error_document_private():
+    from pylons.middleware import StatusCodeRedirect
+    for headers in ([('Cache-Control', 'private')], [('Vary', 'Cookie')]):
+        errors = CountingErrorApp(headers=headers)
+        app = TestApp(StatusCodeRedirect(errors, cache_ttl=60))
+        app.get('/', status=404)
+        app.get('/', status=404)
+        assert errors.documents == 2
+
+def test_cached_error_document_lru():
+    from pylons.middleware import StatusCodeRedirect
+    errors = CountingErrorApp()
+    redirect = StatusCodeRedirect(errors, cache_ttl=60)
+    redirect.max_cache_entries = 2
+    app = TestApp(redirect)
+    app.get('/?first', status=404)
+    app.get('/?second', status=404)
+    app.get('/?first', status=404)
+    app.get('/?third', status=404)
+    assert errors.documents == 3
+    assert len(redirect.cache) == 2
+    # The least recently used document was dropped
+    res = app.get('/?first', status=404)
+    assert 'Error document 1' in res
+    res = app.get('/?second', status=404)
+    assert 'Error document 4' in res
+
+def test_prerender_error_documents():
+    from pylons.middleware import StatusCodeRedirect
+    errors = CountingErrorApp(default=True)
+    app = StatusCodeRedirect(errors, cache_ttl=60, prerender=True)
+    assert errors.documents == 8
+    res = TestApp(app).get('/', headers={'Accept': 'text/html'}, status=404)
+    assert 'Error document' in res
+    assert 'The resource could not be found' in res
+    res = TestApp(app).get('/', status=404)
+    assert 'Error document' in res
+    assert errors.documents == 8
+
+def test_warmcache_filter():
+    from pylons.middleware import warmcache_filter_app_factory
+    requests = []
+    def app(environ, start_response):
+        requests.append(environ['PATH_INFO'])
+        return simple_app(environ, start_response)
+    assert warmcache_filter_app_factory(app, {}, urls='/\n/other\n',
+                                        concurrency='2') is app
+    assert sorted(requests) == ['/', '/other']
+    warmcache_filter_app_factory(app, {'pylons.cache_warm_list': '/'})
+    assert len(requests) == 3
@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from beaker.container import Value
+
+from pylons.shmcache import SharedMemoryCache, SharedMemoryNamespaceManager
+
+
+class TestSharedMemoryCache(TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.data_dir, 'cache.shm')
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_get_set(self):
+        cache = SharedMemoryCache(self.path, size=64 * 1024, slot_size=1024)
+        self.assertRaises(KeyError, cache.get, 'key')
+        assert cache.set('key', 'value')
+        assert cache.get('key') == 'value'
+        assert 'key' in cache
+        assert cache.set('key', 'other value')
+        assert cache.get('key') == 'other value'
+        assert cache.delete('key')
+        assert not cache.delete('key')
+        assert 'key' not in cache
+
+    def test_too_large(self):
+        cache = SharedMemoryCache(self.path, size=64 * 1024, slot_size=1024)
+        assert cache.set('key', 'value')
+        assert not cache.set('key', 'x' * 1024)
+        self.assertRaises(KeyError, cache.get, 'key')
+
+    def test_eviction(self):
+        # A single set of two slots
+        cache = SharedMemoryCache(self.path, size=2048, slot_size=1024,
+                                  ways=2)
+        assert cache.sets == 1
+        cache.set('a', '1')
+        time.sleep(0.01)
+        cache.set('b', '2')
+        time.sleep(0.01)
+        cache.get('a')
+        cache.set('c', '3')
+        assert sorted(cache.keys()) == ['a', 'c']
+
+        # Expired values are replaced first
+        cache.set('d', '4', expires=time.time() - 1)
+        assert sorted(cache.keys()) == ['c', 'd']
+        cache.set('e', '5')
+        assert sorted(cache.keys()) == ['c', 'e']
+
+    def test_keys(self):
+        cache = SharedMemoryCache(self.path, size=64 * 1024, slot_size=1024)
+        cache.set('ns1\0a', '1')
+        cache.set('ns1\0b', '2')
+        cache.set('ns2\0a', '3')
+        assert sorted(cache.keys('ns1\0')) == ['ns1\0a', 'ns1\0b']
+        cache.keys('ns1\0', remove=True)
+        assert cache.keys() == ['ns2\0a']
+
+    def test_shared(self):
+        cache = SharedMemoryCache(self.path, size=64 * 1024, slot_size=1024)
+        cache.set('key', 'value')
+        other = SharedMemoryCache(self.path, size=64 * 1024, slot_size=1024)
+        assert other.get('key') == 'value'
+        other.set('key', 'other value')
+        assert cache.get('key') == 'other value'
+        other.close()
+
+        # A different geometry uses another file, leaving this one to the
+        # processes using it
+        other = SharedMemoryCache(self.path, size=128 * 1024, slot_size=1024)
+        assert other.path == self.path + '.16x8x1024'
+        self.assertRaises(KeyError, other.get, 'key')
+        other.close()
+        assert cache.get('key') == 'other value'
+
+    def test_shared_stripes(self):
+        cache = SharedMemoryCache(self.path, size=64 * 1024, slot_size=1024,
+                                  stripes=4)
+        other = SharedMemoryCache(self.path, size=64 * 1024, slot_size=1024,
+                                  stripes=2)
+        assert other.stripes == 4
+        other.close()
+
+    def test_forked(self):
+        cache = SharedMemoryCache(self.path, size=512 * 1024, slot_size=1024)
+        pid = os.fork()
+        if not pid:
+            try:
+                for i in range(50):
+                    cache.set('child%s' % i, str(i))
+            finally:
+                os._exit(0)
+        for i in range(50):
+            cache.set('parent%s' % i, str(i))
+        os.waitpid(pid, 0)
+        for i in range(50):
+            assert cache.get('child%s' % i) == str(i)
+            assert cache.get('parent%s' % i) == str(i)
+
+    def test_threads(self):
+        cache = SharedMemoryCache(self.path, size=64 * 1024, slot_size=1024,
+                                  stripes=4)
+        errors = []
+        def run(name):
+            try:
+                for i in range(100):
+                    cache.set('%s%s' % (name, i % 10), str(i))
+                    cache.get('%s%s' % (name, i % 10))
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=run, args=(name,))
+                   for name in 'abcd']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        assert cache.get('a9') == '99'
+
+
+class TestSharedMemoryNamespaceManager(TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_values(self):
+        namespace = SharedMemoryNamespaceManager('ns', data_dir=self.data_dir)
+        created = []
+        def create():
+            created.append(True)
+            return {'content': u'Hello \u2603'}
+        value = Value('key', namespace, createfunc=create, expiretime=60)
+        assert value.get_value() == {'content': u'Hello \u2603'}
+        assert value.get_value() == {'content': u'Hello \u2603'}
+        assert len(created) == 1
+        assert namespace.keys() == ['key']
+
+        other = SharedMemoryNamespaceManager('other', data_dir=self.data_dir)
+        assert 'key' not in other
+        other['key'] = 'other'
+        namespace.remove()
+        assert 'key' not in namespace
+        assert other['key'] == 'other'
+
+    def test_expiration(self):
+        namespace = SharedMemoryNamespaceManager('ns', data_dir=self.data_dir)
+        created = []
+        def create():
+            created.append(True)
+            return len(created)
+        value = Value('key', namespace, createfunc=create, expiretime=0.1)
+        assert value.get_value() == 1
+        time.sleep(0.2)
+        assert value.get_value() == 2
@@ -4,6 +4,8 @@ import sys
 
 from beaker.cache import CacheManager
 from beaker.middleware import SessionMiddleware, CacheMiddleware
+from genshi.template import TemplateLoader
+from jinja2 import Environment, FileSystemLoader
 from mako.lookup import TemplateLookup
 from nose.tools import raises
 from paste.fixture import TestApp
@@ -44,6 +46,10 @@ def make_app(global_conf, full_stack=True, static_files=True, include_cache_midd
     config['pylons.app_globals'].mako_lookup = TemplateLookup(
         directories=paths['templates'], imports=['from markupsafe import escape']
     )
+    config['pylons.app_globals'].jinja2_env = Environment(
+        loader=FileSystemLoader(paths['templates']))
+    config['pylons.app_globals'].genshi_loader = TemplateLoader(
+        paths['templates'])
         
     if attribsafe:
         config['pylons.strict_tmpl_context'] = False
@@ -72,9 +78,137 @@ class TestTemplatingApp(object):
     def test_testvars(self):
         resp = self.app.get('/hello/intro_template')
         assert 'Hi there 6' in resp
+
+    def test_extra_vars(self):
+        resp = self.app.get('/hello/extra_vars_template')
+        assert resp.body == "Hello World\nHello World\n['name'] True"
+
+    def test_as_bytes(self):
+        resp = self.app.get('/hello/bytes_template')
+        assert resp.body == 'Hello caf\xc3\xa9\n'
+        resp = self.app.get('/hello/bytes_cached_template')
+        assert resp.body == 'literal str'
+
+    def test_stream(self):
+        rows = ''.join('<li>caf\xc3\xa9 %s</li>\n' % i for i in range(10))
+        for engine in ('mako', 'jinja2'):
+            resp = self.app.get('/hello/stream_template',
+                                params=dict(engine=engine))
+            assert resp.body == rows
+        resp = self.app.get('/hello/stream_template',
+                            params=dict(engine='genshi'))
+        assert resp.body == '<ul>%s</ul>' % rows.replace('\n', '')
+
+    def test_stream_progress(self):
+        resp = self.app.get('/hello/stream_progress')
+        assert resp.body == '<li>0</li> True True'
+
+    def test_stream_chunks(self):
+        resp = self.app.get('/hello/stream_chunks')
+        assert resp.body == '[44, 44, 22]'
     
+    def test_fragments(self):
+        resp = self.app.get('/hello/fragments_template', params=dict(x='y'))
+        fragments = ''.join('%s y Fragments|' % n for n in range(5))
+        assert resp.body == '%s %s 6 2' % (fragments, fragments)
+
     def test_template_cache(self):
         resp = self.app.get('/hello/time_template')
         resp2 = self.app.get('/hello/time_template')
         assert resp.body == resp2.body
 
+
+class TestAppGlobalsCacheTemplatingApp(object):
+    def setUp(self):
+        app = make_app({})
+        app.config['pylons.app_globals'].cache = CacheManager(type='memory')
+        self.app = TestApp(app)
+
+    def test_fragments(self):
+        resp = self.app.get('/hello/fragments_template',
+                            params=dict(x='y', key='globals'))
+        fragments = ''.join('%s y Fragments|' % n for n in range(5))
+        assert resp.body == '%s %s 6 2' % (fragments, fragments)
+
+
+class TestRegistryFreeTemplatingApp(object):
+    def setUp(self):
+        self.app = TestApp(make_app({'cache_dir': os.path.join(os.path.dirname(__file__), 'cache')}, include_cache_middleware=True, **{'pylons.use_registry': 'false'}))
+
+    def test_testvars(self):
+        resp = self.app.get('/hello/intro_template')
+        assert 'Hi there 6' in resp
+
+    def test_extra_vars(self):
+        resp = self.app.get('/hello/extra_vars_template')
+        assert resp.body == "Hello World\nHello World\n['name'] True"
+
+
+class TestCompileTemplates(object):
+    def setUp(self):
+        import tempfile
+        self.dir = tempfile.mkdtemp()
+        self.templates = os.path.join(self.dir, 'templates')
+        os.makedirs(os.path.join(self.templates, 'sub'))
+        os.makedirs(os.path.join(self.templates, '.svn'))
+        for name, content in [('index.html', 'Hello ${name}'),
+                              ('sub/page.html', 'Page'),
+                              ('broken.html', '${'),
+                              ('.hidden.html', '${'),
+                              ('.svn/entries', '${'),
+                              ('helpers.py', '${')]:
+            f = open(os.path.join(self.templates, name), 'w')
+            f.write(content)
+            f.close()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def _config(self, **app_globals):
+        class AppGlobals(object): pass
+        globs = AppGlobals()
+        globs.__dict__.update(app_globals)
+        return {'pylons.app_globals': globs,
+                'pylons.paths': {'templates': [self.templates]}}
+
+    def test_mako(self):
+        from pylons.templating import compile_templates
+        modules = os.path.join(self.dir, 'modules')
+        lookup = TemplateLookup(directories=[self.templates],
+                                module_directory=modules)
+        results = compile_templates(self._config(mako_lookup=lookup))
+        assert [(engine, name) for engine, name, error in results] == [
+            ('mako', '/broken.html'), ('mako', '/index.html'),
+            ('mako', '/sub/page.html')]
+        assert results[0][2] is not None
+        assert results[1][2] is None
+        assert os.path.exists(os.path.join(modules, 'index.html.py'))
+        assert os.path.exists(os.path.join(modules, 'sub', 'page.html.py'))
+        assert lookup.filesystem_checks
+
+        compile_templates(self._config(mako_lookup=lookup),
+                          filesystem_checks=False)
+        assert not lookup.filesystem_checks
+
+    def test_jinja2(self):
+        from jinja2 import Environment, FileSystemBytecodeCache, \
+            FileSystemLoader
+        from pylons.templating import compile_templates
+        os.remove(os.path.join(self.templates, 'broken.html'))
+        env = Environment(loader=FileSystemLoader(self.templates),
+                          bytecode_cache=FileSystemBytecodeCache(self.dir))
+        results = compile_templates(self._config(jinja2_env=env),
+                                    filesystem_checks=False)
+        assert results == [('jinja2', 'index.html', None),
+                           ('jinja2', 'sub/page.html', None)]
+        assert len([name for name in os.listdir(self.dir)
+                    if name.endswith('.cache')]) == 2
+        assert not env.auto_reload
+
+    def test_startup(self):
+        app = make_app({'debug': 'false'},
+                       **{'pylons.compile_templates': 'true'})
+        lookup = app.config['pylons.app_globals'].mako_lookup
+        assert not lookup.filesystem_checks
+        assert '/hello.html' in lookup._collection
@@ -81,7 +81,7 @@ def paster_create(template_engine='mako', overwrite=False, sqlatesting=False):
         setup = res.files_created[os.path.join('ProjectName','setup.py')]
         setup.mustcontain('0.1')
         setup.mustcontain('projectname.config.middleware:make_app')
-        setup.mustcontain('main = pylons.util:PylonsInstaller')
+        setup.mustcontain('main = pylons.scaffolding:PylonsInstaller')
         setup.mustcontain("include_package_data=True")
         assert '0.1' in setup
     testenv.run(_get_script_name(sys.executable)+' setup.py egg_info',